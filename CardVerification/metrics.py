@@ -0,0 +1,45 @@
+"""
+各应用共用的指标计数
+
+cards、settings、dashboard 等应用的缓存命中/未命中等计数在这里进程内累加，不依赖 api 应用；
+api/metrics.py 的 Metrics 每次刷新时取走这些增量，与其他指标一起合并到 Redis 并在 /metrics 输出。
+这里只支持计数器。
+"""
+import threading
+from django.conf import settings
+
+PREFIX = 'cardverify_'
+
+CACHE_REQUESTS = f'{PREFIX}cache_requests_total'
+FILTER_FALSE_POSITIVES = f'{PREFIX}card_key_filter_false_positives_total'
+
+_lock = threading.Lock()
+# (指标, 标签) -> 尚未被 Metrics 取走的增量
+_pending = {}
+
+
+def inc(name, value=1, **labels):
+    """计数器加 value"""
+    if not getattr(settings, 'METRICS_ENABLED', True):
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _pending[key] = _pending.get(key, 0) + value
+
+
+def cache_access(layer, hit):
+    """记录一次缓存读取（layer 为缓存层名称）"""
+    inc(CACHE_REQUESTS, layer=layer, result='hit' if hit else 'miss')
+
+
+def drain():
+    """
+    取走累加的增量
+
+    Returns:
+        dict: (指标, 标签) -> 增量
+    """
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+    return pending
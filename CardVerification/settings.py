@@ -53,13 +53,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',  # Prometheus 指标：请求数、耗时、数据库查询统计
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'accounts.middleware.AdminAccessMiddleware',  # 添加admin访问控制中间件
     'django.contrib.messages.middleware.MessageMiddleware',
+    'accounts.middleware.AdminAccessMiddleware',  # 添加admin访问控制中间件（需在MessageMiddleware之后，拒绝时要写入提示消息）
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -205,10 +206,12 @@ LOGOUT_REDIRECT_URL = '/'
 # Redis缓存配置
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'BACKEND': 'django_redis.cache.RedisCache',
         'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'SOCKET_CONNECT_TIMEOUT': 1,  # Redis不可用时快速失败，回退到数据库
+            'SOCKET_TIMEOUT': 1,
             'CONNECTION_POOL_KWARGS': {
                 'max_connections': 50,
                 'retry_on_timeout': True,
@@ -225,6 +228,63 @@ CACHES = {
     }
 }
 
+# 卡密热状态缓存（验证接口读取，修改卡密时写穿）
+CARD_STATE_CACHE_ENABLED = os.environ.get('CARD_STATE_CACHE_ENABLED', 'True').lower() == 'true'
+CARD_STATE_CACHE_ALIAS = 'default'
+CARD_STATE_CACHE_TIMEOUT = int(os.environ.get('CARD_STATE_CACHE_TIMEOUT', '3600'))  # 1小时
+# 命中缓存的验证最多每隔多少秒回写一次最后使用时间
+CARD_STATE_TOUCH_INTERVAL = int(os.environ.get('CARD_STATE_TOUCH_INTERVAL', '60'))
+
+# 卡密存在性过滤器（布隆过滤器，确定不存在的卡密不访问数据库；需要所有worker共享的缓存）
+CARD_KEY_FILTER_ENABLED = os.environ.get('CARD_KEY_FILTER_ENABLED', 'True').lower() == 'true'
+CARD_KEY_FILTER_CACHE_ALIAS = 'default'
+CARD_KEY_FILTER_ERROR_RATE = float(os.environ.get('CARD_KEY_FILTER_ERROR_RATE', '0.001'))
+# 过滤器最小容量，实际容量为 max(最小容量, 卡密总数 * 2)
+CARD_KEY_FILTER_MIN_CAPACITY = int(os.environ.get('CARD_KEY_FILTER_MIN_CAPACITY', '100000'))
+# 把构建结果快照共享到缓存，其他worker重建时直接加载
+CARD_KEY_FILTER_SHARE_SNAPSHOT = os.environ.get('CARD_KEY_FILTER_SHARE_SNAPSHOT', 'False').lower() == 'true'
+# 自上次重建以来删除的卡密超过该比例时重建
+CARD_KEY_FILTER_REBUILD_DELETE_RATIO = float(os.environ.get('CARD_KEY_FILTER_REBUILD_DELETE_RATIO', '0.2'))
+# 增量广播缺失超过该秒数时重建
+CARD_KEY_FILTER_SYNC_GRACE = int(os.environ.get('CARD_KEY_FILTER_SYNC_GRACE', '5'))
+
+# 过期卡密清理（manage.py sweep_expired_cards，见 cards/expiry.py）每批更新的卡密数
+CARD_EXPIRY_SWEEP_CHUNK_SIZE = int(os.environ.get('CARD_EXPIRY_SWEEP_CHUNK_SIZE', '5000'))
+
+# 批量生成卡密（见 cards/generation.py）：每批插入数量、单次最多生成数量，
+# 超过 CARD_GENERATION_SYNC_LIMIT 时转为后台任务（进程内线程执行，或关闭后运行 manage.py run_card_generation_jobs --loop 5）
+CARD_GENERATION_CHUNK_SIZE = int(os.environ.get('CARD_GENERATION_CHUNK_SIZE', '5000'))
+CARD_GENERATION_MAX_COUNT = int(os.environ.get('CARD_GENERATION_MAX_COUNT', '1000000'))
+CARD_GENERATION_SYNC_LIMIT = int(os.environ.get('CARD_GENERATION_SYNC_LIMIT', '10000'))
+CARD_GENERATION_IN_PROCESS = os.environ.get('CARD_GENERATION_IN_PROCESS', 'True').lower() == 'true'
+# 后台任务心跳超过该秒数未更新时，视为执行进程已失联，可被其他进程接管
+CARD_GENERATION_STALE_SECONDS = int(os.environ.get('CARD_GENERATION_STALE_SECONDS', '60'))
+
+# 卡密导入（见 cards/imports.py）每块读取和写入的行数，以及最多返回的错误明细条数
+CARD_IMPORT_CHUNK_SIZE = int(os.environ.get('CARD_IMPORT_CHUNK_SIZE', '10000'))
+CARD_IMPORT_MAX_ERRORS = int(os.environ.get('CARD_IMPORT_MAX_ERRORS', '1000'))
+
+# 列表页总数最多精确统计的行数，超过时 PostgreSQL 显示估算值（见 cards/pagination.py）
+LIST_COUNT_LIMIT = int(os.environ.get('LIST_COUNT_LIMIT', '10000'))
+
+# 列表页搜索（见 cards/search.py）：备注等子串搜索的最短搜索词长度（pg_trgm 三元组索引至少需要 3 个字符），
+# 日志按卡密前缀搜索时最多匹配的卡密数
+SEARCH_MIN_SUBSTRING_LENGTH = int(os.environ.get('SEARCH_MIN_SUBSTRING_LENGTH', '3'))
+SEARCH_MAX_CARDS = int(os.environ.get('SEARCH_MAX_CARDS', '1000'))
+
+# 卡密导出每批读取的行数（流式导出，见 cards/export.py）
+CARD_EXPORT_CHUNK_SIZE = int(os.environ.get('CARD_EXPORT_CHUNK_SIZE', '2000'))
+
+# 后台导出任务（见 api/exports.py），文件保存在 EXPORT_ROOT（默认 MEDIA_ROOT/exports）
+EXPORT_ROOT = os.environ.get('EXPORT_ROOT', '') or MEDIA_ROOT / 'exports'
+# 在 Web 进程的后台线程中执行导出；关闭后需单独运行 manage.py run_export_jobs --loop 5
+EXPORT_JOB_IN_PROCESS = os.environ.get('EXPORT_JOB_IN_PROCESS', 'True').lower() == 'true'
+EXPORT_JOB_CHUNK_SIZE = int(os.environ.get('EXPORT_JOB_CHUNK_SIZE', '5000'))
+# 执行进程超过该秒数没有心跳时，任务由其他进程接管并从断点继续
+EXPORT_JOB_STALE_SECONDS = int(os.environ.get('EXPORT_JOB_STALE_SECONDS', '60'))
+EXPORT_LINK_MAX_AGE = int(os.environ.get('EXPORT_LINK_MAX_AGE', '3600'))  # 下载链接有效期（秒）
+EXPORT_FILE_RETENTION_HOURS = int(os.environ.get('EXPORT_FILE_RETENTION_HOURS', '24'))
+
 # 会话存储配置
 if os.environ.get('USE_REDIS_SESSIONS', 'False').lower() == 'true':
     SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
@@ -361,3 +421,96 @@ if not DEBUG:
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 1000
+
+# ===== API 配置 =====
+# 批量验证接口单次最多条目数
+API_BATCH_VERIFY_MAX_ITEMS = int(os.environ.get('API_BATCH_VERIFY_MAX_ITEMS', '500'))
+
+# 验证/查询接口使用原生异步视图（需以ASGI方式部署，见 docker-compose.asgi.yml）
+API_ASYNC_VIEWS = os.environ.get('API_ASYNC_VIEWS', 'False').lower() == 'true'
+
+# API密钥进程内缓存（LRU + TTL），禁用的密钥最迟在 max(检查间隔, TTL) 秒内失效
+API_KEY_CACHE_ENABLED = os.environ.get('API_KEY_CACHE_ENABLED', 'True').lower() == 'true'
+API_KEY_CACHE_ALIAS = 'default'
+API_KEY_CACHE_MAX_SIZE = int(os.environ.get('API_KEY_CACHE_MAX_SIZE', '1024'))
+API_KEY_CACHE_TTL = int(os.environ.get('API_KEY_CACHE_TTL', '30'))
+# 每隔多少秒检查一次共享失效代数
+API_KEY_CACHE_CHECK_INTERVAL = float(os.environ.get('API_KEY_CACHE_CHECK_INTERVAL', '1'))
+
+# 系统设置进程内快照（见 settings/cache.py）：每隔多少秒检查一次共享版本号，共享缓存不可用时快照的过期秒数
+SYSTEM_SETTINGS_CACHE_ALIAS = 'default'
+SYSTEM_SETTINGS_CHECK_INTERVAL = float(os.environ.get('SYSTEM_SETTINGS_CHECK_INTERVAL', '1'))
+SYSTEM_SETTINGS_CACHE_TTL = int(os.environ.get('SYSTEM_SETTINGS_CACHE_TTL', '60'))
+
+# API密钥使用统计写后缓冲（累加到Redis，后台线程定期批量写回）
+API_KEY_USAGE_WRITE_BEHIND = os.environ.get('API_KEY_USAGE_WRITE_BEHIND', 'True').lower() == 'true'
+API_KEY_USAGE_FLUSH_INTERVAL = float(os.environ.get('API_KEY_USAGE_FLUSH_INTERVAL', '5'))
+
+# API频率限制（令牌桶，按API密钥的 rate_limit 次/分钟；Redis不可用时退回进程内限制）
+API_RATE_LIMIT_ENABLED = os.environ.get('API_RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+# 同一API密钥再按客户端IP分别限流
+API_RATE_LIMIT_BY_IP = os.environ.get('API_RATE_LIMIT_BY_IP', 'False').lower() == 'true'
+API_RATE_LIMIT_LOCAL_MAX_BUCKETS = int(os.environ.get('API_RATE_LIMIT_LOCAL_MAX_BUCKETS', '10000'))
+
+# API调用日志/验证日志缓冲批量写入
+# 进程被强制杀死时最多丢失最后一个刷新周期（且不超过队列上限）的日志；正常退出时会全部写入
+API_LOG_BUFFER_ENABLED = os.environ.get('API_LOG_BUFFER_ENABLED', 'True').lower() == 'true'
+API_LOG_BUFFER_BATCH_SIZE = int(os.environ.get('API_LOG_BUFFER_BATCH_SIZE', '500'))
+API_LOG_BUFFER_FLUSH_INTERVAL = float(os.environ.get('API_LOG_BUFFER_FLUSH_INTERVAL', '1'))
+API_LOG_BUFFER_MAX_SIZE = int(os.environ.get('API_LOG_BUFFER_MAX_SIZE', '10000'))
+
+# API日志本地落盘（追加到 JSON Lines 分段文件，由 manage.py ingest_logs 批量导入数据库）
+# 开启后日志不再经过内存缓冲，进程崩溃不丢日志；FSYNC=always 时机器掉电也不丢
+API_LOG_SPOOL_ENABLED = os.environ.get('API_LOG_SPOOL_ENABLED', 'False').lower() == 'true'
+API_LOG_SPOOL_DIR = os.environ.get('API_LOG_SPOOL_DIR', str(BASE_DIR / 'logs' / 'spool'))
+API_LOG_SPOOL_FSYNC = os.environ.get('API_LOG_SPOOL_FSYNC', 'batch')
+API_LOG_SPOOL_SEGMENT_BYTES = int(os.environ.get('API_LOG_SPOOL_SEGMENT_BYTES', str(64 * 1024 * 1024)))
+API_LOG_SPOOL_SEGMENT_SECONDS = float(os.environ.get('API_LOG_SPOOL_SEGMENT_SECONDS', '60'))
+
+# 日志表分区（仅 PostgreSQL，见 api/partitions.py；由 manage.py maintain_log_partitions 每天维护）
+LOG_PARTITION_INTERVAL = os.environ.get('LOG_PARTITION_INTERVAL', 'month')  # month / day
+LOG_PARTITION_PREMAKE = int(os.environ.get('LOG_PARTITION_PREMAKE', '3'))
+# 日志保留天数，0 表示永久保留；分区表整分区删除，其他数据库分批删除
+LOG_RETENTION_DAYS = int(os.environ.get('LOG_RETENTION_DAYS', '0'))
+
+# 日志汇总（统计接口和控制面板图表读取汇总表，见 api/rollups.py）
+# 写日志的 worker 在后台定期汇总；日志量大时可关闭，改为单独运行 manage.py update_rollups --loop 60
+ROLLUP_AUTO_UPDATE = os.environ.get('ROLLUP_AUTO_UPDATE', 'True').lower() == 'true'
+ROLLUP_UPDATE_INTERVAL = float(os.environ.get('ROLLUP_UPDATE_INTERVAL', '60'))
+ROLLUP_SETTLE_SECONDS = float(os.environ.get('ROLLUP_SETTLE_SECONDS', '5'))
+ROLLUP_CHUNK_SIZE = int(os.environ.get('ROLLUP_CHUNK_SIZE', '50000'))
+# 统计时最多读取的尚未汇总日志条数
+ROLLUP_MAX_TAIL_ROWS = int(os.environ.get('ROLLUP_MAX_TAIL_ROWS', '200000'))
+
+# 控制面板统计（见 dashboard/services.py）：结果缓存秒数（0 表示不缓存）；
+# 日志表很大时设置 DASHBOARD_USE_ROLLUPS=True，今日验证/调用次数改为读取汇总表
+DASHBOARD_CACHE_ALIAS = 'default'
+DASHBOARD_CACHE_SECONDS = int(os.environ.get('DASHBOARD_CACHE_SECONDS', '5'))
+DASHBOARD_USE_ROLLUPS = os.environ.get('DASHBOARD_USE_ROLLUPS', 'False').lower() == 'true'
+
+# 控制面板图表（见 dashboard/charts.py）：默认点数上限（超过时 LTTB 降采样）、请求可指定的最大点数、
+# 允许的最大桶数（指定粒度和自动粒度都适用）；关闭 CHART_USE_ROLLUPS 后小时/天粒度也直接统计日志表
+CHART_POINT_BUDGET = int(os.environ.get('CHART_POINT_BUDGET', '500'))
+CHART_MAX_POINTS = int(os.environ.get('CHART_MAX_POINTS', '2000'))
+CHART_MAX_BUCKETS = int(os.environ.get('CHART_MAX_BUCKETS', '20000'))
+CHART_USE_ROLLUPS = os.environ.get('CHART_USE_ROLLUPS', 'True').lower() == 'true'
+
+# 响应时间分位数（见 api/latency.py）：按分钟记录直方图，Redis 中跨 worker 合并
+LATENCY_HISTOGRAM_ENABLED = os.environ.get('LATENCY_HISTOGRAM_ENABLED', 'True').lower() == 'true'
+LATENCY_FLUSH_INTERVAL = float(os.environ.get('LATENCY_FLUSH_INTERVAL', '1'))
+# 分钟直方图保留的分钟数（统计接口 minutes 参数的上限）
+LATENCY_MINUTE_RETENTION = int(os.environ.get('LATENCY_MINUTE_RETENTION', '180'))
+
+# 请求分阶段计时（见 api/timing.py）：Server-Timing 响应头和按阶段的分钟直方图；
+# 超过 API_SLOW_REQUEST_MS 毫秒的请求记录警告日志（含各阶段耗时）
+STAGE_TIMING_ENABLED = os.environ.get('STAGE_TIMING_ENABLED', 'True').lower() == 'true'
+SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', 'True').lower() == 'true'
+API_SLOW_REQUEST_MS = float(os.environ.get('API_SLOW_REQUEST_MS', '1000'))
+
+# Prometheus 指标（见 api/metrics.py）：各 worker 每 METRICS_FLUSH_INTERVAL 秒合并到 Redis，/metrics 输出合计；
+# 默认拒绝访问：来源地址在 METRICS_ALLOWED_IPS（逗号分隔，按 REMOTE_ADDR 匹配）中时放行，
+# 其他来源需设置 METRICS_TOKEN 并在抓取时携带 Authorization: Bearer <METRICS_TOKEN>，两者都未配置时返回404
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '1'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]
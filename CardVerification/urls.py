@@ -19,6 +19,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
+from api.views import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -28,6 +29,7 @@ urlpatterns = [
     path('api/v1/', include('api.urls')),
     path('dashboard/', include('dashboard.urls')),
     path('settings/', include('settings.urls')),
+    path('metrics', metrics, name='metrics'),
 ]
 
 # 开发环境下的静态文件和媒体文件服务
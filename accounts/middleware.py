@@ -1,23 +1,46 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import HttpResponseRedirect
 from django.contrib import messages
 from django.urls import reverse
 
 
 class AdminAccessMiddleware:
-    """确保只有超级管理员可以访问Django admin的中间件"""
-    
+    """确保只有超级管理员可以访问Django admin的中间件（同步和异步请求都适用）"""
+
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
     
     def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
         # 检查是否是admin路径
         if request.path.startswith('/admin/'):
             # 如果用户已登录但不是超级管理员
             if request.user.is_authenticated and not request.user.is_superuser:
-                messages.error(request, '您没有权限访问管理后台，只有超级管理员可以访问。')
-                return HttpResponseRedirect('/')
+                return self._deny(request)
             
             # 如果用户未登录，让Django的默认认证处理
         
         response = self.get_response(request)
         return response
+
+    async def __acall__(self, request):
+        # 异步请求（如异步验证接口）不经过线程切换；只有admin路径才读取用户
+        if request.path.startswith('/admin/'):
+            user = await request.auser()
+            if user.is_authenticated and not user.is_superuser:
+                return self._deny(request)
+
+        return await self.get_response(request)
+
+    @staticmethod
+    def _deny(request):
+        messages.error(request, '您没有权限访问管理后台，只有超级管理员可以访问。')
+        return HttpResponseRedirect('/')
@@ -0,0 +1,105 @@
+"""
+异步（ASGI）版本的卡密验证与查询接口
+
+在 ASGI worker（gunicorn + UvicornWorker）下运行时，数据库和缓存往返期间
+不会占用 worker，单个 worker 可同时服务大量连接。
+设置 API_ASYNC_VIEWS=True 后 /api/v1/verify/ 与 /api/v1/query/ 路由到这里。
+"""
+import logging
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from .error_codes import ApiResponse, ApiErrorCode, get_http_status
+from .mixins import AsyncBaseApiView
+from .metrics import record_verify_outcome
+from .timing import stage
+from .serializers import CardVerifyRequestSerializer, CardQueryRequestSerializer
+from .services import CardVerificationService, CardQueryService, LoggingService
+
+logger = logging.getLogger(__name__)
+
+
+def format_serializer_errors(errors):
+    """格式化序列化器错误信息"""
+    return '; '.join([f"{k}: {', '.join(map(str, v))}" for k, v in errors.items()])
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncVerifyCardView(AsyncBaseApiView):
+    """卡密验证API（异步）"""
+
+    async def post(self, request):
+        """验证卡密"""
+        api_key_obj, data, error_response = await self.authenticate(request)
+        if error_response:
+            return error_response
+
+        # 验证请求数据
+        serializer = CardVerifyRequestSerializer(data=data)
+        with stage('serializer'):
+            is_valid = serializer.is_valid()
+        if not is_valid:
+            error_msg = format_serializer_errors(serializer.errors)
+            response_data = ApiResponse.error(ApiErrorCode.CARD_ERROR, f"参数验证失败: {error_msg}")
+            record_verify_outcome(response_data, 'invalid_params')
+            await self.alog_api_call(api_key_obj, request, 400, self.start_time, False, error_msg)
+            return self.json_response(response_data)
+
+        validated_data = serializer.validated_data
+
+        # 调用业务逻辑服务
+        success, response_data, card = await CardVerificationService.averify_card(
+            api_key_obj, validated_data['card_key'], validated_data.get('device_id'), request
+        )
+        record_verify_outcome(response_data)
+
+        # 记录验证日志
+        if card:
+            with stage('verification_log'):
+                await LoggingService.alog_verification(
+                    card, request, validated_data['api_key'],
+                    success, response_data.get('message', ''), None
+                )
+
+        # 记录API调用日志
+        status_code = get_http_status(response_data['code'])
+        await self.alog_api_call(
+            api_key_obj, request, status_code,
+            self.start_time, success, response_data.get('message', '')
+        )
+
+        return self.json_response(response_data, status_code)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncQueryCardView(AsyncBaseApiView):
+    """卡密查询API（异步）"""
+
+    async def post(self, request):
+        """查询卡密信息"""
+        api_key_obj, data, error_response = await self.authenticate(request)
+        if error_response:
+            return error_response
+
+        # 验证请求数据
+        serializer = CardQueryRequestSerializer(data=data)
+        with stage('serializer'):
+            is_valid = serializer.is_valid()
+        if not is_valid:
+            error_msg = format_serializer_errors(serializer.errors)
+            response_data = ApiResponse.error(ApiErrorCode.CARD_ERROR, f"参数验证失败: {error_msg}")
+            await self.alog_api_call(api_key_obj, request, 400, self.start_time, False, error_msg)
+            return self.json_response(response_data)
+
+        # 调用业务逻辑服务
+        success, response_data = await CardQueryService.aquery_card(
+            api_key_obj, serializer.validated_data['card_key']
+        )
+
+        # 记录API调用日志
+        status_code = get_http_status(response_data['code'])
+        await self.alog_api_call(
+            api_key_obj, request, status_code,
+            self.start_time, success, response_data.get('message', '')
+        )
+
+        return self.json_response(response_data, status_code)
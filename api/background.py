@@ -0,0 +1,112 @@
+"""
+后台定期任务线程
+
+写后缓冲（API密钥使用计数、调用日志等）由每个进程内的一个守护线程定期刷新。
+线程在首次注册任务时启动，gunicorn fork 出的 worker 会在各自进程内重新启动；
+进程正常退出时（atexit）会最后刷新一次。
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicFlusher:
+    """进程内后台定期任务"""
+
+    TICK = 0.5
+
+    _lock = threading.Lock()
+    _tasks = {}
+    _thread = None
+    _pid = None
+    _stop = None
+    _wake = None
+    _atexit_registered = False
+
+    @classmethod
+    def register(cls, name, func, interval):
+        """
+        注册定期任务（同名任务只注册一次）
+
+        Args:
+            name: 任务名称
+            func: 无参数可调用对象
+            interval: 执行间隔（秒）
+        """
+        with cls._lock:
+            if name not in cls._tasks:
+                cls._tasks[name] = {'func': func, 'interval': interval, 'last_run': time.monotonic()}
+        cls.ensure_started()
+
+    @classmethod
+    def ensure_started(cls):
+        """确保当前进程的后台线程在运行"""
+        pid = os.getpid()
+        if cls._pid == pid and cls._thread is not None and cls._thread.is_alive():
+            return
+        with cls._lock:
+            if cls._pid == pid and cls._thread is not None and cls._thread.is_alive():
+                return
+            cls._pid = pid
+            cls._stop = threading.Event()
+            cls._wake = threading.Event()
+            cls._thread = threading.Thread(target=cls._run, name='periodic-flusher', daemon=True)
+            cls._thread.start()
+            if not cls._atexit_registered:
+                atexit.register(cls.shutdown)
+                cls._atexit_registered = True
+
+    @classmethod
+    def wake(cls, name):
+        """请求尽快执行指定任务（例如缓冲区达到批量阈值时）"""
+        task = cls._tasks.get(name)
+        if task is None:
+            return
+        task['requested'] = True
+        cls.ensure_started()
+        cls._wake.set()
+
+    @classmethod
+    def _run(cls):
+        stop, wake = cls._stop, cls._wake
+        while not stop.is_set():
+            wake.wait(cls.TICK)
+            wake.clear()
+            if stop.is_set():
+                break
+            now = time.monotonic()
+            for name, task in list(cls._tasks.items()):
+                if task.get('requested') or now - task['last_run'] >= task['interval']:
+                    task['requested'] = False
+                    task['last_run'] = now
+                    cls._run_task(name, task)
+
+    @classmethod
+    def _run_task(cls, name, task):
+        try:
+            task['func']()
+        except Exception as e:
+            logger.error(f"后台任务 {name} 执行失败: {e}", exc_info=True)
+        finally:
+            close_old_connections()
+
+    @classmethod
+    def flush_all(cls):
+        """立即执行全部任务"""
+        for name, task in list(cls._tasks.items()):
+            task['last_run'] = time.monotonic()
+            cls._run_task(name, task)
+
+    @classmethod
+    def shutdown(cls):
+        """停止后台线程并最后执行一次全部任务"""
+        if cls._stop is not None:
+            cls._stop.set()
+            cls._wake.set()
+        if cls._pid == os.getpid():
+            cls.flush_all()
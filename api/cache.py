@@ -0,0 +1,190 @@
+"""
+API密钥进程内缓存
+
+每个 worker 在内存中以 LRU + TTL 方式缓存 API 密钥的少量字段（id、name、is_active、rate_limit），
+验证 API 密钥时不再访问数据库。
+
+- 密钥被修改、启停或删除时（post_save/post_delete 信号）递增共享缓存中的代数；
+  各 worker 每隔 API_KEY_CACHE_CHECK_INTERVAL 秒读取一次代数，变化时清空本地缓存。
+- 即使共享缓存不可用，条目也会在 API_KEY_CACHE_TTL 秒后过期，
+  因此禁用的密钥最迟在 max(检查间隔, TTL) 秒内失效。
+- 不存在的密钥同样缓存（负缓存），新建密钥同样会递增代数。
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from CardVerification.metrics import cache_access
+from .models import ApiKey
+
+logger = logging.getLogger(__name__)
+
+API_KEY_CACHE_FIELDS = ('id', 'key', 'name', 'is_active', 'rate_limit')
+
+_MISSING = object()
+
+
+class ApiKeyCache:
+    """API密钥进程内缓存（LRU + TTL，跨worker按代数失效）"""
+
+    GENERATION_KEY = 'api_key_cache:generation'
+
+    _lock = threading.Lock()
+    _entries = OrderedDict()
+    _generation = None
+    _checked_at = 0.0
+    # 每次清空本地缓存加一，防止清空前发起的数据库读取把旧数据写回
+    _epoch = 0
+
+    @staticmethod
+    def is_enabled():
+        return getattr(settings, 'API_KEY_CACHE_ENABLED', True)
+
+    @staticmethod
+    def _get_cache():
+        return caches[getattr(settings, 'API_KEY_CACHE_ALIAS', 'default')]
+
+    @classmethod
+    def get(cls, key):
+        """
+        按密钥获取API密钥对象（包含未启用的密钥）
+
+        Returns:
+            ApiKey | None: 密钥不存在时返回None
+        """
+        if not cls.is_enabled():
+            return cls._load(key)
+
+        if cls._generation_check_due():
+            try:
+                cls._apply_generation(cls._get_cache().get(cls.GENERATION_KEY))
+            except Exception as e:
+                logger.warning(f"读取API密钥缓存代数失败: {e}")
+                cls._checked_at = time.monotonic()
+
+        values = cls._lookup(key)
+        cache_access('api_key', values is not _MISSING)
+        if values is _MISSING:
+            epoch = cls._epoch
+            values = cls._load_values(key)
+            cls._remember(key, values, epoch)
+        return cls._to_api_key(values)
+
+    @classmethod
+    async def aget(cls, key):
+        """异步按密钥获取API密钥对象"""
+        if not cls.is_enabled():
+            return await cls._aload(key)
+
+        if cls._generation_check_due():
+            try:
+                cls._apply_generation(await cls._get_cache().aget(cls.GENERATION_KEY))
+            except Exception as e:
+                logger.warning(f"读取API密钥缓存代数失败: {e}")
+                cls._checked_at = time.monotonic()
+
+        values = cls._lookup(key)
+        cache_access('api_key', values is not _MISSING)
+        if values is _MISSING:
+            epoch = cls._epoch
+            values = await cls._aload_values(key)
+            cls._remember(key, values, epoch)
+        return cls._to_api_key(values)
+
+    @classmethod
+    def invalidate(cls):
+        """清空本进程缓存，并在事务提交后通知所有worker"""
+        cls.clear()
+        transaction.on_commit(cls._bump_generation)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
+            cls._epoch += 1
+
+    @classmethod
+    def _bump_generation(cls):
+        try:
+            cache = cls._get_cache()
+            cache.add(cls.GENERATION_KEY, 0, None)
+            cache.incr(cls.GENERATION_KEY)
+        except Exception as e:
+            logger.warning(f"广播API密钥缓存失效失败: {e}")
+        # 提交前可能已有请求把旧数据重新放回本地缓存
+        cls.clear()
+
+    @classmethod
+    def _generation_check_due(cls):
+        interval = getattr(settings, 'API_KEY_CACHE_CHECK_INTERVAL', 1)
+        return time.monotonic() - cls._checked_at >= interval
+
+    @classmethod
+    def _apply_generation(cls, generation):
+        with cls._lock:
+            if generation != cls._generation:
+                cls._entries.clear()
+                cls._epoch += 1
+                cls._generation = generation
+            cls._checked_at = time.monotonic()
+
+    @classmethod
+    def _lookup(cls, key):
+        now = time.monotonic()
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, values = entry
+            if expires_at <= now:
+                del cls._entries[key]
+                return _MISSING
+            cls._entries.move_to_end(key)
+            return values
+
+    @classmethod
+    def _remember(cls, key, values, epoch):
+        ttl = getattr(settings, 'API_KEY_CACHE_TTL', 30)
+        max_size = getattr(settings, 'API_KEY_CACHE_MAX_SIZE', 1024)
+        with cls._lock:
+            if epoch != cls._epoch:
+                return
+            cls._entries[key] = (time.monotonic() + ttl, values)
+            cls._entries.move_to_end(key)
+            while len(cls._entries) > max_size:
+                cls._entries.popitem(last=False)
+
+    @staticmethod
+    def _load_values(key):
+        try:
+            return ApiKey.objects.values(*API_KEY_CACHE_FIELDS).get(key=key)
+        except ApiKey.DoesNotExist:
+            return None
+
+    @staticmethod
+    async def _aload_values(key):
+        try:
+            return await ApiKey.objects.values(*API_KEY_CACHE_FIELDS).aget(key=key)
+        except ApiKey.DoesNotExist:
+            return None
+
+    @classmethod
+    def _load(cls, key):
+        return cls._to_api_key(cls._load_values(key))
+
+    @classmethod
+    async def _aload(cls, key):
+        return cls._to_api_key(await cls._aload_values(key))
+
+    @staticmethod
+    def _to_api_key(values):
+        """每次返回新的实例，调用方对其修改不会影响缓存"""
+        if values is None:
+            return None
+        api_key_obj = ApiKey(**values)
+        api_key_obj._state.adding = False
+        api_key_obj._state.db = 'default'
+        return api_key_obj
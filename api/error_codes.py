@@ -21,6 +21,9 @@ class ApiErrorCode:
     
     # 卡密已被禁用
     CARD_DISABLED = 5
+    
+    # 请求过于频繁
+    RATE_LIMITED = 6
 
 
 class ApiErrorMessages:
@@ -34,6 +37,7 @@ class ApiErrorMessages:
         ApiErrorCode.SYSTEM_ERROR: "系统错误",
         ApiErrorCode.INVALID_API_KEY: "API密钥无效",
         ApiErrorCode.CARD_DISABLED: "卡密已被禁用",
+        ApiErrorCode.RATE_LIMITED: "请求过于频繁",
     }
     
     # 英文错误消息
@@ -44,6 +48,7 @@ class ApiErrorMessages:
         ApiErrorCode.SYSTEM_ERROR: "System error",
         ApiErrorCode.INVALID_API_KEY: "Invalid API key",
         ApiErrorCode.CARD_DISABLED: "Card disabled",
+        ApiErrorCode.RATE_LIMITED: "Too many requests",
     }
     
     # 详细错误描述
@@ -54,6 +59,7 @@ class ApiErrorMessages:
         ApiErrorCode.SYSTEM_ERROR: "服务器内部错误，请稍后重试或联系管理员",
         ApiErrorCode.INVALID_API_KEY: "请检查API密钥是否正确或是否已被禁用",
         ApiErrorCode.CARD_DISABLED: "此卡密已被管理员手动禁用，请联系管理员处理",
+        ApiErrorCode.RATE_LIMITED: "超过API密钥的频率限制，请按 Retry-After 响应头等待后重试",
     }
 
 
@@ -67,6 +73,7 @@ class ApiHttpStatus:
         ApiErrorCode.SYSTEM_ERROR: status.HTTP_500_INTERNAL_SERVER_ERROR,
         ApiErrorCode.INVALID_API_KEY: status.HTTP_401_UNAUTHORIZED,
         ApiErrorCode.CARD_DISABLED: status.HTTP_403_FORBIDDEN,
+        ApiErrorCode.RATE_LIMITED: status.HTTP_429_TOO_MANY_REQUESTS,
     }
 
 
@@ -157,6 +164,14 @@ class ApiResponse:
             "API密钥无效或已被禁用"
         )
     
+    @staticmethod
+    def rate_limited(retry_after):
+        """请求过于频繁错误"""
+        return ApiResponse.error(
+            ApiErrorCode.RATE_LIMITED,
+            f"请求过于频繁，请在 {retry_after} 秒后重试"
+        )
+    
     @staticmethod
     def missing_parameters(missing_params):
         """缺少必要参数错误"""
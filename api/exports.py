@@ -0,0 +1,337 @@
+"""
+后台导出任务
+
+大量数据的导出不占用 Web 请求：创建 ExportJob 后由 ExportJobRunner 在后台分批写入 EXPORT_ROOT
+（默认 MEDIA_ROOT/exports）下的文件，页面轮询进度，完成后通过限时签名链接下载。
+
+- 队列：进程内 queue.Queue + 守护线程，无需外部消息队列；任务本身保存在数据库中，
+  线程空闲时也会定期领取排队中或执行进程已失联（心跳超时）的任务，
+  也可以关闭进程内执行（EXPORT_JOB_IN_PROCESS=False），改为单独运行 ``manage.py run_export_jobs --loop 5``。
+- 断点续传：按主键倒序分批读取，每批写入临时文件并 fsync 后，在数据库中记录最后一行的主键和文件字节数；
+  进程重启后截断到已确认的字节数，从下一行继续。csv.gz 每批写为一个独立的 gzip 成员（多成员 gzip 仍是合法文件），
+  xlsx 先写 JSON Lines 临时文件，全部写完后再流式转换为 xlsx。
+- 领取任务和推进断点都是带执行进程条件的单条 UPDATE，同一任务不会被两个进程同时执行。
+"""
+import gzip
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import uuid
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.core import signing
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from openpyxl import Workbook
+from cards.export import (
+    CardExportDataset, ExportDataset, VerificationLogExportDataset, DATETIME_FORMAT, encode_csv,
+)
+from .models import ApiCallLog, ExportJob
+from .search import filter_api_call_logs
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_SALT = 'api.exports.download'
+
+
+class ApiCallLogExportDataset(ExportDataset):
+    name = 'api_call_logs'
+    label = 'API调用记录'
+    model = ApiCallLog
+    headers = ['调用时间', 'API密钥', '接口端点', '请求方法', 'IP地址', '状态码', '响应时间(ms)', '调用结果', '错误信息']
+    fields = (
+        'call_time', 'api_key__name', 'endpoint', 'method', 'ip_address',
+        'response_code', 'response_time', 'success', 'error_message',
+    )
+    filter_params = ('search', 'success')
+
+    @classmethod
+    def get_queryset(cls, params):
+        return filter_api_call_logs(ApiCallLog.objects.all(), params)
+
+    @staticmethod
+    def format_row(values):
+        call_time, api_key_name, endpoint, method, ip_address, response_code, response_time, success, error = values
+        return [
+            call_time.strftime(DATETIME_FORMAT),
+            api_key_name,
+            endpoint,
+            method,
+            ip_address,
+            response_code,
+            round(response_time, 2),
+            '成功' if success else '失败',
+            error,
+        ]
+
+
+EXPORT_DATASETS = {
+    dataset.name: dataset
+    for dataset in (CardExportDataset, VerificationLogExportDataset, ApiCallLogExportDataset)
+}
+
+
+def get_export_dir():
+    path = Path(getattr(settings, 'EXPORT_ROOT', None) or Path(settings.MEDIA_ROOT) / 'exports')
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def make_download_token(job):
+    """生成限时下载令牌（EXPORT_LINK_MAX_AGE 秒内有效）"""
+    return signing.dumps(job.pk, salt=DOWNLOAD_SALT)
+
+
+def check_download_token(token):
+    """校验下载令牌，返回任务ID；过期或无效时返回 None"""
+    try:
+        return signing.loads(token, salt=DOWNLOAD_SALT, max_age=getattr(settings, 'EXPORT_LINK_MAX_AGE', 3600))
+    except signing.BadSignature:
+        return None
+
+
+def get_download_name(job):
+    """下载时使用的文件名"""
+    return f"{job.dataset}_{timezone.localtime(job.created_at):%Y%m%d_%H%M%S}.{job.export_format}"
+
+
+class _ClaimLost(Exception):
+    """任务已被其他进程接管"""
+
+
+class ExportJobRunner:
+    """导出任务执行器"""
+
+    TASK_POLL_INTERVAL = 30
+
+    _queue = queue.Queue()
+    _lock = threading.Lock()
+    _thread = None
+    _pid = None
+
+    # ---- 提交与调度 ----
+
+    @classmethod
+    def create(cls, user, dataset, export_format, params):
+        """
+        创建导出任务并在事务提交后放入队列
+
+        Args:
+            params: 列表页的查询参数（只保留该数据集支持的筛选参数）
+        """
+        dataset_cls = EXPORT_DATASETS[dataset]
+        filters = {name: params.get(name) for name in dataset_cls.filter_params if params.get(name)}
+        job = ExportJob.objects.create(
+            created_by=user, dataset=dataset, export_format=export_format, filters=filters
+        )
+        if cls.is_in_process():
+            transaction.on_commit(lambda: cls._enqueue(job.pk))
+        return job
+
+    @staticmethod
+    def is_in_process():
+        return getattr(settings, 'EXPORT_JOB_IN_PROCESS', True)
+
+    @classmethod
+    def _enqueue(cls, job_id):
+        cls.ensure_started()
+        cls._queue.put(job_id)
+
+    @classmethod
+    def ensure_started(cls):
+        """确保当前进程的导出线程在运行（进程重启后由页面访问触发，继续未完成的任务）"""
+        if not cls.is_in_process():
+            return
+        pid = os.getpid()
+        if cls._pid == pid and cls._thread is not None and cls._thread.is_alive():
+            return
+        with cls._lock:
+            if cls._pid == pid and cls._thread is not None and cls._thread.is_alive():
+                return
+            cls._pid = pid
+            cls._queue = queue.Queue()
+            cls._thread = threading.Thread(target=cls._run, name='export-jobs', daemon=True)
+            cls._thread.start()
+
+    @classmethod
+    def _run(cls):
+        while True:
+            try:
+                cls.run_pending()
+                cls.cleanup_expired()
+            except Exception as e:
+                logger.error(f"导出任务线程执行失败: {e}", exc_info=True)
+            finally:
+                close_old_connections()
+            try:
+                cls._queue.get(timeout=cls.TASK_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+
+    @classmethod
+    def run_pending(cls):
+        """依次领取并执行可执行的任务，返回执行的任务数"""
+        count = 0
+        while True:
+            job = cls.claim()
+            if job is None:
+                return count
+            cls.run(job)
+            count += 1
+
+    @staticmethod
+    def _claimable():
+        stale = timezone.now() - timedelta(seconds=getattr(settings, 'EXPORT_JOB_STALE_SECONDS', 60))
+        return Q(status='pending') | Q(status='running', heartbeat_at__lt=stale)
+
+    @classmethod
+    def claim(cls):
+        """领取一个排队中或执行进程已失联的任务"""
+        worker = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        candidates = ExportJob.objects.filter(cls._claimable()).order_by('created_at').values_list('pk', flat=True)
+        for job_id in candidates[:10]:
+            now = timezone.now()
+            claimed = ExportJob.objects.filter(cls._claimable(), pk=job_id).update(
+                status='running', worker=worker, heartbeat_at=now,
+                started_at=Coalesce(F('started_at'), Value(now)),
+            )
+            if claimed:
+                return ExportJob.objects.get(pk=job_id)
+        return None
+
+    # ---- 执行 ----
+
+    @classmethod
+    def run(cls, job):
+        """执行（或继续）已领取的任务"""
+        dataset = EXPORT_DATASETS[job.dataset]
+        export_dir = get_export_dir()
+        part_path = export_dir / f"{job.pk}.part"
+        try:
+            queryset = dataset.get_queryset(job.filters)
+            if job.total_rows is None:
+                job.total_rows = queryset.count()
+                cls._checkpoint(job, total_rows=job.total_rows)
+            if job.last_pk is not None:
+                logger.info(f"导出任务 {job.pk} 从第 {job.written_rows} 行继续")
+
+            cls._write_part(job, dataset, queryset, part_path)
+            file_name = f"{job.pk}_{uuid.uuid4().hex}.{job.export_format}"
+            final_path = export_dir / file_name
+            if job.export_format == 'xlsx':
+                cls._convert_to_xlsx(job, dataset, part_path, final_path)
+                part_path.unlink()
+            else:
+                os.replace(part_path, final_path)
+
+            now = timezone.now()
+            retention = timedelta(hours=getattr(settings, 'EXPORT_FILE_RETENTION_HOURS', 24))
+            cls._checkpoint(
+                job, status='completed', file_name=file_name, file_size=final_path.stat().st_size,
+                finished_at=now, expires_at=now + retention,
+            )
+            logger.info(f"导出任务 {job.pk} 完成：{job.written_rows} 行")
+        except _ClaimLost:
+            logger.warning(f"导出任务 {job.pk} 已被其他进程接管，停止执行")
+        except Exception as e:
+            logger.error(f"导出任务 {job.pk} 失败: {e}", exc_info=True)
+            ExportJob.objects.filter(pk=job.pk, worker=job.worker).update(
+                status='failed', error_message=str(e)[:1000], finished_at=timezone.now()
+            )
+            part_path.unlink(missing_ok=True)
+
+    @classmethod
+    def _write_part(cls, job, dataset, queryset, part_path):
+        """分批写入临时文件，每批 fsync 后推进断点"""
+        chunk_size = getattr(settings, 'EXPORT_JOB_CHUNK_SIZE', 5000)
+        if job.part_bytes and not part_path.exists():
+            # 临时文件丢失，从头开始
+            job.last_pk, job.written_rows, job.part_bytes = None, 0, 0
+
+        with open(part_path, 'r+b' if part_path.exists() else 'w+b') as f:
+            # 丢弃上次中断时未确认的部分
+            f.truncate(job.part_bytes)
+            f.seek(job.part_bytes)
+            while True:
+                chunk = queryset.order_by('-pk')
+                if job.last_pk is not None:
+                    chunk = chunk.filter(pk__lt=job.last_pk)
+                rows = list(chunk.values_list('pk', *dataset.fields)[:chunk_size])
+                if not rows:
+                    return
+                f.write(cls._encode_chunk(job, dataset, rows))
+                f.flush()
+                os.fsync(f.fileno())
+                cls._checkpoint(
+                    job, last_pk=rows[-1][0], written_rows=job.written_rows + len(rows), part_bytes=f.tell()
+                )
+
+    @staticmethod
+    def _encode_chunk(job, dataset, rows):
+        formatted = [dataset.format_row(row[1:]) for row in rows]
+        header = dataset.headers if job.part_bytes == 0 else None
+        if job.export_format == 'xlsx':
+            lines = [json.dumps(row, ensure_ascii=False, default=str) for row in formatted]
+            if header is not None:
+                lines.insert(0, json.dumps(header, ensure_ascii=False))
+            return ('\n'.join(lines) + '\n').encode('utf-8')
+        data = encode_csv(formatted, header)
+        if job.export_format == 'csv.gz':
+            return gzip.compress(data, compresslevel=6)
+        return data
+
+    @classmethod
+    def _convert_to_xlsx(cls, job, dataset, part_path, final_path):
+        """把 JSON Lines 临时文件流式转换为 xlsx，期间定期更新心跳"""
+        temp_path = final_path.with_suffix('.tmp')
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(f'{dataset.label}列表')
+        with open(part_path, 'rb') as f:
+            for index, line in enumerate(f):
+                sheet.append(json.loads(line))
+                if index and index % 20000 == 0:
+                    cls._checkpoint(job)
+        workbook.save(temp_path)
+        os.replace(temp_path, final_path)
+
+    @staticmethod
+    def _checkpoint(job, **fields):
+        """在仍持有任务的前提下更新字段和心跳"""
+        fields['heartbeat_at'] = timezone.now()
+        updated = ExportJob.objects.filter(pk=job.pk, worker=job.worker, status='running').update(**fields)
+        if not updated:
+            raise _ClaimLost()
+        for name, value in fields.items():
+            setattr(job, name, value)
+
+    # ---- 清理 ----
+
+    @staticmethod
+    def cleanup_expired():
+        """删除已过期的导出文件和不再需要的临时文件，返回清理的任务数"""
+        export_dir = get_export_dir()
+        expired = list(ExportJob.objects.filter(
+            status='completed', expires_at__lt=timezone.now()
+        ).values_list('pk', 'file_name'))
+        for job_id, file_name in expired:
+            if file_name:
+                (export_dir / file_name).unlink(missing_ok=True)
+        if expired:
+            ExportJob.objects.filter(pk__in=[job_id for job_id, _ in expired]).update(status='expired')
+
+        # 已结束或已删除的任务遗留的临时文件
+        parts = {int(path.stem): path for path in export_dir.glob('*.part') if path.stem.isdigit()}
+        if parts:
+            active = set(ExportJob.objects.filter(
+                pk__in=list(parts), status__in=['pending', 'running']
+            ).values_list('pk', flat=True))
+            for job_id, path in parts.items():
+                if job_id not in active:
+                    path.unlink(missing_ok=True)
+        return len(expired)
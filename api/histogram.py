@@ -0,0 +1,25 @@
+"""
+响应时间固定分桶直方图
+
+桶上界从 0.25ms 起按 1.25 倍等比增长到约 53 秒，最后一个桶收集更慢的请求。
+分桶固定不变，因此不同 worker、不同时间段的直方图逐桶相加即可合并，不损失精度。
+"""
+import numpy as np
+
+# 各桶上界（毫秒），第 i 个桶收集 (LATENCY_BOUNDS[i-1], LATENCY_BOUNDS[i]] 内的值
+LATENCY_BOUNDS = np.round(0.25 * 1.25 ** np.arange(56), 3)
+BUCKET_COUNT = len(LATENCY_BOUNDS) + 1
+
+
+def bucket_indexes(latencies):
+    """响应时间（毫秒）对应的桶序号"""
+    return np.searchsorted(LATENCY_BOUNDS, np.asarray(latencies, dtype=float), side='left')
+
+
+def to_array(histogram):
+    """把数据库中保存的直方图（列表）转为定长数组，兼容分桶数变化前的旧数据"""
+    array = np.zeros(BUCKET_COUNT, dtype=np.int64)
+    if histogram:
+        values = np.asarray(histogram[:BUCKET_COUNT], dtype=np.int64)
+        array[:len(values)] = values
+    return array
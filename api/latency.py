@@ -0,0 +1,235 @@
+"""
+响应时间分位数（p50/p95/p99/max）
+
+- LatencyRecorder：请求完成时把响应时间计入进程内的分钟直方图（按 API密钥、接口端点），
+  后台线程每秒把增量 HINCRBY 到 Redis 的分钟哈希 ``latency:<分钟>``（字段 ``<密钥id>|<端点>|<桶序号>``），
+  最大值用 ``ZADD GT`` 记在 ``latency:max:<分钟>``。各 worker 的直方图在 Redis 中自然合并，
+  保留 LATENCY_MINUTE_RETENTION 分钟，用于最近若干分钟的分位数。
+  Redis 不可用时只保留在进程内，结果仅反映当前 worker。
+- 更长时间段的直方图来自汇总表（api/rollups.py）。
+- percentiles() 对合并后的直方图矩阵向量化计算分位数，合并多少个时间段都只是一次矩阵运算。
+"""
+import bisect
+import logging
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from .background import PeriodicFlusher
+from .histogram import BUCKET_COUNT, LATENCY_BOUNDS
+from .redis_client import get_redis_client, make_redis_key
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+QUANTILE_NAMES = ('p50', 'p95', 'p99')
+
+_BOUNDS = LATENCY_BOUNDS.tolist()
+_LOWER_BOUNDS = np.concatenate(([0.0], LATENCY_BOUNDS))
+_UPPER_BOUNDS = np.concatenate((LATENCY_BOUNDS, [LATENCY_BOUNDS[-1] * 1.25]))
+
+
+def percentiles(histograms, maxima=None, quantiles=QUANTILES):
+    """
+    按直方图计算分位数（桶内线性插值）
+
+    Args:
+        histograms: 形状 (n, BUCKET_COUNT) 的计数矩阵，每行一组
+        maxima: 每组的最大响应时间，分位数不会超过它，也作为最后一个（溢出）桶的上界
+        quantiles: 分位点
+
+    Returns:
+        np.ndarray: 形状 (n, len(quantiles))，没有数据的组为 nan
+    """
+    hist = np.atleast_2d(np.asarray(histograms, dtype=np.float64))
+    rows = np.arange(hist.shape[0])
+    totals = hist.sum(axis=1)
+    cumulative = np.cumsum(hist, axis=1)
+
+    upper_bounds = np.broadcast_to(_UPPER_BOUNDS, hist.shape).copy()
+    if maxima is not None:
+        maxima = np.asarray(maxima, dtype=np.float64)
+        upper_bounds[:, -1] = np.maximum(maxima, LATENCY_BOUNDS[-1])
+
+    result = np.full((hist.shape[0], len(quantiles)), np.nan)
+    for column, quantile in enumerate(quantiles):
+        target = quantile * totals
+        index = np.argmax(cumulative >= target[:, None], axis=1)
+        before = np.where(index > 0, cumulative[rows, np.maximum(index - 1, 0)], 0.0)
+        count = hist[rows, index]
+        fraction = np.divide(target - before, count, out=np.zeros_like(target), where=count > 0)
+        lower = _LOWER_BOUNDS[index]
+        values = lower + fraction * (upper_bounds[rows, index] - lower)
+        if maxima is not None:
+            values = np.minimum(values, maxima)
+        result[:, column] = np.where(totals > 0, values, np.nan)
+    return result
+
+
+def summarize(groups):
+    """
+    为每组统计补充 p50/p95/p99/max（一次向量化计算全部分组）
+
+    Args:
+        groups: dict，值为含 'histogram' 和 'latency_max' 的字典，原地补充分位数字段
+    """
+    items = [item for item in groups.values() if item.get('histogram') is not None]
+    if not items:
+        return groups
+    values = percentiles(
+        np.vstack([item['histogram'] for item in items]),
+        [item.get('latency_max', np.inf) for item in items],
+    )
+    for item, row in zip(items, values):
+        for name, value in zip(QUANTILE_NAMES, row):
+            item[name] = None if np.isnan(value) else round(float(value), 2)
+    return groups
+
+
+class LatencyRecorder:
+    """分钟级响应时间直方图（Redis 中跨 worker 合并）"""
+
+    KEY_PREFIX = 'latency:'
+    MAX_KEY_PREFIX = 'latency:max:'
+    TASK_NAME = 'latency_histograms'
+
+    _lock = threading.Lock()
+    # (分钟, api_key_id, endpoint) -> [{桶序号: 次数}, 最大值]，等待写入 Redis
+    _pending = {}
+    # Redis 不可用时保存在进程内，结构同上
+    _local = {}
+
+    @staticmethod
+    def is_enabled():
+        return getattr(settings, 'LATENCY_HISTOGRAM_ENABLED', True)
+
+    @classmethod
+    def record(cls, api_key_id, endpoint, latency_ms, now=None):
+        """记录一次请求的响应时间（毫秒）"""
+        if not cls.is_enabled():
+            return
+        minute = int((now or time.time()) // 60)
+        bucket = bisect.bisect_left(_BOUNDS, latency_ms)
+        key = (minute, api_key_id, endpoint)
+        with cls._lock:
+            entry = cls._pending.get(key)
+            if entry is None:
+                entry = cls._pending[key] = [{}, latency_ms]
+            entry[0][bucket] = entry[0].get(bucket, 0) + 1
+            if latency_ms > entry[1]:
+                entry[1] = latency_ms
+        PeriodicFlusher.register(cls.TASK_NAME, cls.flush, getattr(settings, 'LATENCY_FLUSH_INTERVAL', 1))
+
+    @classmethod
+    def flush(cls):
+        """把进程内的增量写入 Redis"""
+        with cls._lock:
+            pending, cls._pending = cls._pending, {}
+        if not pending:
+            return 0
+
+        client = get_redis_client()
+        if client is not None:
+            try:
+                ttl = cls._retention_minutes() * 60 + 120
+                pipe = client.pipeline(transaction=False)
+                minutes = set()
+                for (minute, api_key_id, endpoint), (buckets, maximum) in pending.items():
+                    hash_key = make_redis_key(f"{cls.KEY_PREFIX}{minute}")
+                    for bucket, count in buckets.items():
+                        pipe.hincrby(hash_key, f"{api_key_id}|{endpoint}|{bucket}", count)
+                    pipe.zadd(make_redis_key(f"{cls.MAX_KEY_PREFIX}{minute}"),
+                              {f"{api_key_id}|{endpoint}": maximum}, gt=True)
+                    minutes.add(minute)
+                for minute in minutes:
+                    pipe.expire(make_redis_key(f"{cls.KEY_PREFIX}{minute}"), ttl)
+                    pipe.expire(make_redis_key(f"{cls.MAX_KEY_PREFIX}{minute}"), ttl)
+                pipe.execute()
+                return len(pending)
+            except Exception as e:
+                logger.warning(f"写入响应时间直方图到Redis失败，保留在进程内: {e}")
+
+        oldest = int(time.time() // 60) - cls._retention_minutes()
+        with cls._lock:
+            for key, (buckets, maximum) in pending.items():
+                entry = cls._local.setdefault(key, [{}, maximum])
+                for bucket, count in buckets.items():
+                    entry[0][bucket] = entry[0].get(bucket, 0) + count
+                entry[1] = max(entry[1], maximum)
+            for key in [key for key in cls._local if key[0] < oldest]:
+                del cls._local[key]
+        return len(pending)
+
+    @classmethod
+    def histograms(cls, minutes, group_by=('endpoint',), api_key_id=None):
+        """
+        最近 minutes 分钟（含当前分钟）的合并直方图
+
+        Args:
+            minutes: 分钟数，不超过 LATENCY_MINUTE_RETENTION
+            group_by: 分组字段，可选 'api_key_id'、'endpoint'，为空时整体汇总
+            api_key_id: 只统计指定API密钥
+
+        Returns:
+            dict: 分组键元组 -> {'call_count', 'latency_max', 'histogram'}
+        """
+        current = int(time.time() // 60)
+        window = range(current - min(minutes, cls._retention_minutes()) + 1, current + 1)
+        entries = cls._read_redis(window)
+        if entries is None:
+            with cls._lock:
+                entries = [
+                    (api_key_id_, endpoint, dict(buckets), maximum)
+                    for (minute, api_key_id_, endpoint), (buckets, maximum)
+                    in list(cls._local.items()) + list(cls._pending.items())
+                    if minute in window
+                ]
+
+        groups = {}
+        for entry_key_id, endpoint, buckets, maximum in entries:
+            if api_key_id and entry_key_id != api_key_id:
+                continue
+            fields = {'api_key_id': entry_key_id, 'endpoint': endpoint}
+            key = tuple(fields[field] for field in group_by)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {
+                    'call_count': 0, 'latency_max': 0.0, 'histogram': np.zeros(BUCKET_COUNT, dtype=np.int64)
+                }
+            for bucket, count in buckets.items():
+                group['histogram'][min(bucket, BUCKET_COUNT - 1)] += count
+            group['latency_max'] = max(group['latency_max'], maximum)
+        for group in groups.values():
+            group['call_count'] = int(group['histogram'].sum())
+        return groups
+
+    @classmethod
+    def _read_redis(cls, window):
+        client = get_redis_client()
+        if client is None:
+            return None
+        try:
+            pipe = client.pipeline(transaction=False)
+            for minute in window:
+                pipe.hgetall(make_redis_key(f"{cls.KEY_PREFIX}{minute}"))
+                pipe.zrange(make_redis_key(f"{cls.MAX_KEY_PREFIX}{minute}"), 0, -1, withscores=True)
+            results = pipe.execute()
+        except Exception as e:
+            logger.warning(f"读取响应时间直方图失败: {e}")
+            return None
+
+        entries = []
+        for index in range(0, len(results), 2):
+            per_group = {}
+            for field, count in results[index].items():
+                prefix, bucket = field.decode().rsplit('|', 1)
+                per_group.setdefault(prefix, {})[int(bucket)] = int(count)
+            maxima = {member.decode(): score for member, score in results[index + 1]}
+            for prefix, buckets in per_group.items():
+                api_key_id, endpoint = prefix.split('|', 1)
+                entries.append((int(api_key_id), endpoint, buckets, maxima.get(prefix, 0.0)))
+        return entries
+
+    @staticmethod
+    def _retention_minutes():
+        return int(getattr(settings, 'LATENCY_MINUTE_RETENTION', 180))
@@ -0,0 +1,154 @@
+"""
+API调用日志与验证日志的缓冲批量写入
+
+请求中只把 ApiCallLog / VerificationLog 对象放入进程内队列，后台线程在
+达到 API_LOG_BUFFER_BATCH_SIZE 条或距上次写入超过 API_LOG_BUFFER_FLUSH_INTERVAL 秒时
+以 bulk_create 在一个事务中批量写入，请求路径上不再有逐条 INSERT 和提交。
+
+- 内存有界：队列最多 API_LOG_BUFFER_MAX_SIZE 条，写满后丢弃新日志并计数（日志文件中仍有记录）。
+- 丢失窗口：进程被强制杀死（SIGKILL、OOM）时，最多丢失最后一个刷新周期内、
+  且不超过队列上限的日志；正常退出时会在 atexit 中最后写入一次。
+- 数据库暂时不可用时日志放回队列重试；批量写入因外键失效（卡密/密钥已删除）失败时逐条写入并跳过无效记录。
+
+需要严格不丢日志时开启 API_LOG_SPOOL_ENABLED，日志改为追加到本地落盘文件（见 api/spool.py）。
+"""
+import logging
+import threading
+from collections import deque
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from .background import PeriodicFlusher
+from .rollups import RollupService
+from .spool import LogSpool
+
+logger = logging.getLogger(__name__)
+
+
+class LogWriter:
+    """日志缓冲批量写入器（进程内单例）"""
+
+    TASK_NAME = 'api_log_buffer'
+
+    _lock = threading.Lock()
+    # 模型类 -> deque[实例]
+    _queues = {}
+    _size = 0
+    _dropped = 0
+    _written = 0
+
+    @staticmethod
+    def is_enabled():
+        """日志是否延后写入（缓冲或落盘），否则调用方需直接保存"""
+        return LogSpool.is_enabled() or getattr(settings, 'API_LOG_BUFFER_ENABLED', True)
+
+    @classmethod
+    def write(cls, obj):
+        """写入一条日志"""
+        cls.write_many([obj])
+
+    @classmethod
+    def write_many(cls, objs):
+        """写入多条日志（可以是不同模型）"""
+        objs = [obj for obj in objs if obj is not None]
+        if not objs:
+            return
+        # 写日志的进程同时负责定期汇总（多个 worker 之间只有一个执行）
+        RollupService.ensure_scheduled()
+        if LogSpool.is_enabled():
+            try:
+                LogSpool.write_many(objs)
+                return
+            except Exception as e:
+                logger.error(f"写入日志落盘文件失败，改用内存缓冲: {e}")
+        elif not cls.is_enabled():
+            cls._save(objs)
+            return
+
+        max_size = getattr(settings, 'API_LOG_BUFFER_MAX_SIZE', 10000)
+        batch_size = getattr(settings, 'API_LOG_BUFFER_BATCH_SIZE', 500)
+        dropped = 0
+        with cls._lock:
+            for obj in objs:
+                if cls._size >= max_size:
+                    dropped += 1
+                    continue
+                cls._queues.setdefault(type(obj), deque()).append(obj)
+                cls._size += 1
+            cls._dropped += dropped
+            size = cls._size
+
+        if dropped:
+            logger.warning(f"日志缓冲区已满，丢弃 {dropped} 条日志（累计 {cls._dropped} 条）")
+
+        PeriodicFlusher.register(
+            cls.TASK_NAME, cls.flush, getattr(settings, 'API_LOG_BUFFER_FLUSH_INTERVAL', 1)
+        )
+        if size >= batch_size:
+            PeriodicFlusher.wake(cls.TASK_NAME)
+
+    @classmethod
+    def flush(cls):
+        """
+        把队列中的日志批量写入数据库
+
+        Returns:
+            int: 写入条数
+        """
+        with cls._lock:
+            pending = {model: list(queue) for model, queue in cls._queues.items() if queue}
+            cls._queues = {}
+            cls._size = 0
+
+        written = 0
+        for model, objs in pending.items():
+            try:
+                written += cls._bulk_save(model, objs)
+            except Exception as e:
+                logger.error(f"批量写入{model._meta.verbose_name}失败，稍后重试: {e}")
+                cls._requeue(model, objs)
+        cls._written += written
+        return written
+
+    @classmethod
+    def stats(cls):
+        return {
+            'pending': cls._size,
+            'dropped': cls._dropped,
+            'written': cls._written,
+        }
+
+    @classmethod
+    def _bulk_save(cls, model, objs):
+        batch_size = getattr(settings, 'API_LOG_BUFFER_BATCH_SIZE', 500)
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(objs, batch_size=batch_size)
+            return len(objs)
+        except IntegrityError:
+            # 批次中有外键已失效的记录，逐条写入并跳过
+            written = 0
+            for obj in objs:
+                try:
+                    with transaction.atomic():
+                        obj.save(force_insert=True)
+                    written += 1
+                except IntegrityError:
+                    pass
+            logger.warning(f"{model._meta.verbose_name}批次中有 {len(objs) - written} 条记录外键失效，已跳过")
+            return written
+
+    @classmethod
+    def _requeue(cls, model, objs):
+        max_size = getattr(settings, 'API_LOG_BUFFER_MAX_SIZE', 10000)
+        with cls._lock:
+            room = max(0, max_size - cls._size)
+            kept = objs[-room:] if room else []
+            queue = cls._queues.setdefault(model, deque())
+            queue.extendleft(reversed(kept))
+            cls._size += len(kept)
+            cls._dropped += len(objs) - len(kept)
+
+    @staticmethod
+    def _save(objs):
+        for obj in objs:
+            obj.save()
@@ -0,0 +1,112 @@
+import os
+import resource
+import threading
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from accounts.models import CustomUser
+from cards.export import CardExporter, EXPORT_FORMATS
+from cards.models import Card
+
+
+def current_rss():
+    """当前进程常驻内存（字节）；无 /proc 时退化为峰值"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler(threading.Thread):
+    """后台定期采样常驻内存，记录峰值"""
+
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = current_rss()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        self.peak = max(self.peak, current_rss())
+        return self.peak
+
+
+class Command(BaseCommand):
+    """
+    卡密导出基准测试
+
+    创建指定数量的卡密后依次按各格式导出（输出丢弃或写入临时文件），
+    报告每秒行数、输出大小和导出期间常驻内存的峰值增量。测试数据在事务中创建，结束后全部回滚。
+    """
+    help = '测试流式导出的吞吐（行/秒）与内存占用，测试数据会被回滚'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=1000000, help='测试卡密数量')
+        parser.add_argument('--formats', nargs='+', choices=EXPORT_FORMATS, default=list(EXPORT_FORMATS),
+                            help='测试的导出格式')
+
+    def handle(self, *args, **options):
+        count = options['cards']
+        with transaction.atomic():
+            start = time.perf_counter()
+            self._create_fixtures(count)
+            self.stdout.write(f"创建 {count} 张卡密耗时 {time.perf_counter() - start:.1f}s")
+
+            queryset = Card.objects.order_by('-created_at')
+            for export_format in options['formats']:
+                baseline = current_rss()
+                sampler = RssSampler()
+                sampler.start()
+                start = time.perf_counter()
+                size = self._export(queryset, export_format)
+                elapsed = time.perf_counter() - start
+                peak = sampler.stop()
+                self.stdout.write(
+                    f"{export_format:7s}: {elapsed:8.2f}s  {count / elapsed:10.0f} 行/秒  "
+                    f"输出 {size / 1024 / 1024:8.1f} MB  内存峰值增量 {(peak - baseline) / 1024 / 1024:6.1f} MB"
+                )
+
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def _export(queryset, export_format):
+        """执行导出，返回输出字节数"""
+        if export_format == 'xlsx':
+            with CardExporter.write_xlsx(queryset) as file:
+                file.seek(0, os.SEEK_END)
+                return file.tell()
+        return sum(len(chunk) for chunk in CardExporter.iter_csv(queryset, compress=export_format == 'csv.gz'))
+
+    @staticmethod
+    def _create_fixtures(count, batch_size=5000):
+        """分批创建测试卡密，避免一次性构造全部对象"""
+        username = f"bench_{uuid.uuid4().hex[:8]}"
+        user = CustomUser.objects.create(username=username, email=f"{username}@bench.invalid", status='approved')
+        now = timezone.now()
+        prefix = uuid.uuid4().hex[:8]
+        for offset in range(0, count, batch_size):
+            cards = []
+            for index in range(offset, min(offset + batch_size, count)):
+                card_key = f"{prefix}{index:024d}"
+                is_time = index % 2 == 0
+                cards.append(Card(
+                    card_key=card_key,
+                    card_key_hash=uuid.uuid5(uuid.NAMESPACE_OID, card_key).hex + prefix,
+                    card_type='time' if is_time else 'count',
+                    valid_days=30 if is_time else None,
+                    expire_date=now + timezone.timedelta(days=30) if is_time else None,
+                    total_count=None if is_time else 100,
+                    created_by=user,
+                    created_at=now,
+                    note='bench',
+                ))
+            Card.objects.bulk_create(cards)
@@ -0,0 +1,68 @@
+import hashlib
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from accounts.models import CustomUser
+from cards.generation import CardGenerator, card_attrs, generate_card_keys
+from cards.models import Card
+
+
+class Command(BaseCommand):
+    """
+    批量生成卡密基准测试
+
+    分别测试：仅生成卡密和哈希（随机数 + SHA1 + 内存去重）、完整生成并分批插入，
+    以及原先逐个查询是否存在的方式（少量样本，用于对比）。测试数据在事务中创建，结束后全部回滚。
+    """
+    help = '测试批量生成卡密的吞吐（个/秒），测试数据会被回滚'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000000, help='生成数量')
+        parser.add_argument('--chunk-size', type=int, default=None, help='每批插入数量（默认 CARD_GENERATION_CHUNK_SIZE）')
+        parser.add_argument('--legacy-sample', type=int, default=2000,
+                            help='按原先逐个查询方式生成的样本数量（0 表示不测试）')
+
+    def handle(self, *args, **options):
+        count = options['count']
+
+        start = time.perf_counter()
+        keys = generate_card_keys(count)
+        elapsed = time.perf_counter() - start
+        self._report('生成卡密和哈希', len(keys), elapsed)
+        del keys
+
+        with transaction.atomic():
+            username = f"bench_{uuid.uuid4().hex[:8]}"
+            user = CustomUser.objects.create(username=username, email=f"{username}@bench.invalid", status='approved')
+            attrs = card_attrs(user, 'time', valid_days=30, note='bench')
+
+            start = time.perf_counter()
+            result = CardGenerator.generate(count, attrs, chunk_size=options['chunk_size'])
+            elapsed = time.perf_counter() - start
+            self._report('生成并插入', result['created'], elapsed, f"冲突重新生成 {result['collisions']} 个")
+
+            sample = options['legacy_sample']
+            if sample:
+                start = time.perf_counter()
+                self._generate_legacy(sample, attrs)
+                elapsed = time.perf_counter() - start
+                self._report('逐个查询（原方式）', sample, elapsed)
+
+            transaction.set_rollback(True)
+
+    def _report(self, label, count, elapsed, extra=''):
+        self.stdout.write(f"{label:12s}: {count:8d} 个  {elapsed:8.2f}s  {count / elapsed:10.0f} 个/秒  {extra}")
+
+    @staticmethod
+    def _generate_legacy(count, attrs):
+        """原 BatchCreateView 的做法：每个卡密先查询一次是否存在，再整批 bulk_create"""
+        cards = []
+        for _ in range(count):
+            while True:
+                card_key = uuid.uuid4().hex
+                card_key_hash = hashlib.sha1(card_key.encode()).hexdigest()
+                if not Card.objects.filter(card_key_hash=card_key_hash).exists():
+                    break
+            cards.append(Card(card_key=card_key, card_key_hash=card_key_hash, **attrs))
+        Card.objects.bulk_create(cards)
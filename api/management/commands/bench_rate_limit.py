@@ -0,0 +1,50 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from api.ratelimit import RateLimiter
+from api.redis_client import get_redis_client
+
+
+class Command(BaseCommand):
+    """
+    频率限制开销基准测试
+
+    分别测量 Redis Lua 令牌桶和进程内令牌桶单次判定的耗时分位数，
+    用于评估限流给每个API请求增加的开销。
+    """
+    help = '测量频率限制器单次判定的开销'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=10000, help='每种实现的判定次数')
+        parser.add_argument('--keys', type=int, default=100, help='轮流使用的限流对象数量')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        keys = [f"bench:{i}" for i in range(options['keys'])]
+
+        self.stdout.write(f"{'实现':<10} {'次数':>8} {'均值(µs)':>10} {'p50(µs)':>9} {'p99(µs)':>9} {'max(µs)':>9}")
+
+        if get_redis_client() is not None:
+            self._report('redis', self._measure(RateLimiter.check, keys, iterations))
+        else:
+            self.stdout.write('redis      缓存后端不是Redis，跳过')
+
+        def check_local(identity, limit):
+            return RateLimiter._check_local(f"{RateLimiter.KEY_PREFIX}{identity}", limit, limit, limit / 60000, 1)
+
+        self._report('local', self._measure(check_local, keys, iterations))
+
+    def _measure(self, check, keys, iterations):
+        durations = np.empty(iterations)
+        key_count = len(keys)
+        for i in range(iterations):
+            start = time.perf_counter_ns()
+            check(keys[i % key_count], 10 ** 9)
+            durations[i] = (time.perf_counter_ns() - start) / 1000
+        return durations
+
+    def _report(self, name, durations):
+        p50, p99 = np.percentile(durations, [50, 99])
+        self.stdout.write(
+            f"{name:<10} {len(durations):>8} {durations.mean():>10.1f} {p50:>9.1f} {p99:>9.1f} {durations.max():>9.1f}"
+        )
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.utils import timezone
+from accounts.models import CustomUser
+from api.models import ApiKey
+from cards.keyfilter import CardKeyFilter
+from cards.models import Card
+
+
+class Command(BaseCommand):
+    """
+    卡密验证吞吐基准测试
+
+    在进程内通过完整的中间件/视图栈分别调用单条验证接口和批量验证接口，
+    比较每秒验证条目数。测试数据在事务中创建，结束后全部回滚。
+    """
+    help = '比较单条验证与批量验证接口的吞吐（条目/秒），测试数据会被回滚'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000, help='每种模式验证的卡密数量')
+        parser.add_argument('--batch-size', type=int, default=500, help='批量接口每次请求的条目数')
+        parser.add_argument('--card-type', choices=['time', 'count'], default='time', help='测试卡密类型')
+
+    def handle(self, *args, **options):
+        items = options['items']
+        batch_size = options['batch_size']
+
+        # 测试数据不会提交，过滤器需在此之前构建，再由 add_many 登记到本进程
+        CardKeyFilter.rebuild()
+
+        with transaction.atomic():
+            api_key, single_keys, batch_keys = self._create_fixtures(items, options['card_type'])
+            client = Client()
+
+            single_elapsed = self._run_single(client, api_key.key, single_keys)
+            batch_elapsed = self._run_batch(client, api_key.key, batch_keys, batch_size)
+
+            transaction.set_rollback(True)
+
+        single_rate = items / single_elapsed if single_elapsed else 0
+        batch_rate = items / batch_elapsed if batch_elapsed else 0
+
+        self.stdout.write(f"条目数: {items}  卡密类型: {options['card_type']}  批大小: {batch_size}")
+        self.stdout.write(f"单条接口 /api/v1/verify/       : {single_elapsed:8.3f}s  {single_rate:10.1f} 条/秒")
+        self.stdout.write(f"批量接口 /api/v1/verify/batch/ : {batch_elapsed:8.3f}s  {batch_rate:10.1f} 条/秒")
+        if single_rate:
+            self.stdout.write(self.style.SUCCESS(f"批量接口吞吐为单条接口的 {batch_rate / single_rate:.1f} 倍"))
+
+    def _create_fixtures(self, items, card_type):
+        """创建测试用户、API密钥和卡密"""
+        username = f"bench_{uuid.uuid4().hex[:8]}"
+        user = CustomUser.objects.create(
+            username=username, email=f"{username}@bench.invalid", status='approved'
+        )
+        api_key = ApiKey.objects.create(name='bench', created_by=user, rate_limit=10 ** 9)
+
+        keys = [uuid.uuid4().hex for _ in range(items * 2)]
+        expire_date = timezone.now() + timezone.timedelta(days=30)
+        Card.objects.bulk_create([
+            Card(
+                card_key=key,
+                card_key_hash=hashlib.sha1(key.encode()).hexdigest(),
+                card_type=card_type,
+                expire_date=expire_date if card_type == 'time' else None,
+                total_count=10 if card_type == 'count' else None,
+                created_by=user
+            )
+            for key in keys
+        ], batch_size=1000)
+        CardKeyFilter.add_many(hashlib.sha1(key.encode()).hexdigest() for key in keys)
+        return api_key, keys[:items], keys[items:]
+
+    def _run_single(self, client, api_key, keys):
+        start = time.perf_counter()
+        for key in keys:
+            response = client.post(
+                '/api/v1/verify/',
+                data=json.dumps({'api_key': api_key, 'card_key': key, 'device_id': 'bench-device'}),
+                content_type='application/json'
+            )
+            if response.status_code != 200:
+                self.stderr.write(f"单条验证失败: {response.content[:200]}")
+                break
+        return time.perf_counter() - start
+
+    def _run_batch(self, client, api_key, keys, batch_size):
+        start = time.perf_counter()
+        for offset in range(0, len(keys), batch_size):
+            chunk = keys[offset:offset + batch_size]
+            response = client.post(
+                '/api/v1/verify/batch/',
+                data=json.dumps({
+                    'api_key': api_key,
+                    'items': [{'card_key': key, 'device_id': 'bench-device'} for key in chunk]
+                }),
+                content_type='application/json'
+            )
+            if response.status_code != 200:
+                self.stderr.write(f"批量验证失败: {response.content[:200]}")
+                break
+        return time.perf_counter() - start
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from api.usage import ApiKeyUsageBuffer
+
+
+class Command(BaseCommand):
+    """
+    立即把缓冲的API密钥使用统计写回数据库
+
+    各 worker 的后台线程会定期自动刷新；部署下线前或排查计数差异时可手动执行，
+    同时会补写之前中断遗留在 Redis 中的批次。
+    """
+    help = '把API密钥使用统计写后缓冲写回数据库'
+
+    def handle(self, *args, **options):
+        flushed = ApiKeyUsageBuffer.flush()
+        self.stdout.write(self.style.SUCCESS(f"已写回 {flushed} 个API密钥的使用统计"))
@@ -0,0 +1,54 @@
+import csv
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import CustomUser
+from cards.imports import CardImporter, CardImportError, IMPORT_FORMATS, detect_format
+
+
+class Command(BaseCommand):
+    """
+    从 CSV / XLSX 导入卡密
+
+    按块读取和校验，按 card_key_hash 新建或更新卡密；出错的行跳过，错误明细输出到终端或 --errors 指定的 CSV 文件。
+    """
+    help = '从 CSV / XLSX 文件批量导入卡密（已存在的卡密按文件内容更新）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='导入文件（.csv / .csv.gz / .xlsx）')
+        parser.add_argument('--user', required=True, help='新建卡密的创建者用户名')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, default=None, help='文件格式（默认按扩展名判断）')
+        parser.add_argument('--chunk-size', type=int, default=None, help='每块行数（默认 CARD_IMPORT_CHUNK_SIZE）')
+        parser.add_argument('--errors', default=None, help='把全部错误明细写入该 CSV 文件')
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(username=options['user'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"用户 {options['user']} 不存在")
+
+        try:
+            file_format = options['format'] or detect_format(options['file'])
+            result = CardImporter.import_file(
+                options['file'], file_format, user, chunk_size=options['chunk_size'],
+                max_errors=sys.maxsize if options['errors'] else None,
+            )
+        except CardImportError as e:
+            raise CommandError(str(e))
+
+        elapsed = result['elapsed']
+        self.stdout.write(
+            f"共 {result['total']} 行：新建 {result['created']}，更新 {result['updated']}，失败 {result['failed']}，"
+            f"耗时 {elapsed:.2f}s（{result['total'] / elapsed if elapsed else 0:.0f} 行/秒）"
+        )
+
+        if options['errors']:
+            with open(options['errors'], 'w', newline='', encoding='utf-8-sig') as f:
+                writer = csv.writer(f)
+                writer.writerow(['行号', '卡密', '错误原因'])
+                writer.writerows([error['row'], error['card_key'], error['message']] for error in result['errors'])
+            self.stdout.write(f"错误明细已写入 {options['errors']}")
+        else:
+            for error in result['errors'][:20]:
+                self.stdout.write(f"  第 {error['row']} 行 {error['card_key']}: {error['message']}")
+            if result['failed'] > 20:
+                self.stdout.write(f"  ……其余 {result['failed'] - 20} 条错误可使用 --errors 输出到文件")
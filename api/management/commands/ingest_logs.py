@@ -0,0 +1,195 @@
+import io
+import json
+import logging
+import os
+import shutil
+import time
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F, JSONField, BooleanField
+from api.models import LogIngestCheckpoint
+from api.spool import get_spool_dir, OPEN_SUFFIX, CLOSED_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_CHUNK_SIZE = 900
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\n': '\\n', '\r': '\\r', '\t': '\\t'})
+
+
+class Command(BaseCommand):
+    """
+    把日志落盘文件（api/spool.py）导入数据库
+
+    按文件名顺序处理已关闭的分段，每次读取 --chunk-size 行：
+    PostgreSQL 使用 COPY，其他数据库使用 bulk_create，
+    数据和导入进度（字节偏移）在同一事务中提交，中途失败或被杀死后重新执行会从进度处继续，不会重复导入。
+    """
+    help = '把日志落盘文件批量导入数据库（幂等，可重复执行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spool-dir', default=None, help='落盘目录，默认 API_LOG_SPOOL_DIR')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='每个事务导入的行数')
+        parser.add_argument('--keep', action='store_true', help='导入完成的分段移到 done/ 子目录而不是删除')
+        parser.add_argument('--orphan-age', type=float, default=600,
+                            help='.open 分段超过该秒数未修改时视为写入进程已退出并导入')
+        parser.add_argument('--loop', type=float, default=0, help='每隔该秒数重复导入（0 表示只执行一次）')
+
+    def handle(self, *args, **options):
+        spool_dir = options['spool_dir'] or get_spool_dir()
+        while True:
+            segments, records = 0, 0
+            for path in self._segments(spool_dir, options['orphan_age']):
+                records += self._ingest(path, options['chunk_size'], options['keep'])
+                segments += 1
+            if segments or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"已导入 {segments} 个分段，共 {records} 条日志"))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
+
+    def _segments(self, spool_dir, orphan_age):
+        if not os.path.isdir(spool_dir):
+            return []
+        now = time.time()
+        segments = []
+        for name in sorted(os.listdir(spool_dir)):
+            path = os.path.join(spool_dir, name)
+            if name.endswith(CLOSED_SUFFIX):
+                segments.append(path)
+            elif name.endswith(OPEN_SUFFIX) and now - os.path.getmtime(path) > orphan_age:
+                logger.warning(f"导入写入进程异常退出遗留的日志分段: {name}")
+                segments.append(path)
+        return segments
+
+    def _ingest(self, path, chunk_size, keep):
+        name = os.path.basename(path)
+        # .open 与重命名后的 .jsonl 是同一个分段，共用导入进度
+        segment = name[:-len(OPEN_SUFFIX)] if name.endswith(OPEN_SUFFIX) else name[:-len(CLOSED_SUFFIX)]
+        checkpoint, _ = LogIngestCheckpoint.objects.get_or_create(segment=segment)
+        records = 0
+
+        if not checkpoint.completed:
+            with open(path, 'rb') as spool_file:
+                spool_file.seek(checkpoint.offset)
+                offset = checkpoint.offset
+                while True:
+                    lines, offset = self._read_chunk(spool_file, offset, chunk_size)
+                    if offset == checkpoint.offset:
+                        break
+                    rows = self._parse(name, lines)
+                    with transaction.atomic():
+                        for model, objs in rows.items():
+                            self._insert(model, objs)
+                        LogIngestCheckpoint.objects.filter(pk=checkpoint.pk).update(
+                            offset=offset, records=F('records') + len(lines)
+                        )
+                    checkpoint.offset = offset
+                    records += len(lines)
+            LogIngestCheckpoint.objects.filter(pk=checkpoint.pk).update(completed=True)
+
+        if keep:
+            done_dir = os.path.join(os.path.dirname(path), 'done')
+            os.makedirs(done_dir, exist_ok=True)
+            shutil.move(path, os.path.join(done_dir, segment + CLOSED_SUFFIX))
+        else:
+            os.remove(path)
+        self.stdout.write(f"{name}: {records} 条")
+        return records
+
+    @staticmethod
+    def _read_chunk(spool_file, offset, chunk_size):
+        lines = []
+        while len(lines) < chunk_size:
+            line = spool_file.readline()
+            # 末尾没有换行的是崩溃时写了一半的行，跳过
+            if not line or not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            if line.strip():
+                lines.append(line)
+        return lines, offset
+
+    @staticmethod
+    def _parse(name, lines):
+        rows = {}
+        for line in lines:
+            try:
+                record = json.loads(line)
+                model = apps.get_model(record.pop('model'))
+            except (ValueError, KeyError, LookupError) as e:
+                logger.error(f"日志分段 {name} 中有无法解析的行，已跳过: {e}")
+                continue
+            values = {}
+            for field in model._meta.concrete_fields:
+                if field.primary_key or field.attname not in record:
+                    continue
+                value = record[field.attname]
+                values[field.attname] = field.to_python(value) if value is not None else None
+            rows.setdefault(model, []).append(model(**values))
+        return rows
+
+    def _insert(self, model, objs):
+        objs = self._check_foreign_keys(model, objs)
+        if not objs:
+            return
+        if connection.vendor == 'postgresql':
+            self._copy(model, objs)
+        else:
+            model.objects.bulk_create(objs, batch_size=LOOKUP_CHUNK_SIZE)
+
+    @staticmethod
+    def _check_foreign_keys(model, objs):
+        """
+        处理引用已删除卡密/密钥的日志：CASCADE 外键的记录丢弃，SET_NULL 外键置空
+
+        外键约束是延迟检查的，插入时不会报错而是在提交时让整个批次失败，所以要在插入前过滤。
+        """
+        for field in model._meta.concrete_fields:
+            if not field.is_relation:
+                continue
+            ids = {getattr(obj, field.attname) for obj in objs} - {None}
+            existing = set()
+            ids = list(ids)
+            for offset in range(0, len(ids), LOOKUP_CHUNK_SIZE):
+                existing.update(field.related_model._base_manager.filter(
+                    pk__in=ids[offset:offset + LOOKUP_CHUNK_SIZE]
+                ).values_list('pk', flat=True))
+            if len(existing) == len(ids):
+                continue
+            if field.null:
+                for obj in objs:
+                    if getattr(obj, field.attname) not in existing:
+                        setattr(obj, field.attname, None)
+            else:
+                kept = [obj for obj in objs if getattr(obj, field.attname) in existing]
+                logger.warning(f"{model._meta.verbose_name}中有 {len(objs) - len(kept)} 条记录的{field.verbose_name}已删除，已跳过")
+                objs = kept
+        return objs
+
+    @staticmethod
+    def _copy(model, objs):
+        fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+        buffer = io.StringIO()
+        for obj in objs:
+            buffer.write('\t'.join(_copy_value(field, getattr(obj, field.attname)) for field in fields))
+            buffer.write('\n')
+        buffer.seek(0)
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(
+                f"COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN", buffer
+            )
+
+
+def _copy_value(field, value):
+    """转换为 COPY 文本格式的字段值"""
+    if value is None:
+        return '\\N'
+    if isinstance(field, JSONField):
+        value = json.dumps(value, ensure_ascii=False)
+    elif isinstance(field, BooleanField):
+        value = 't' if value else 'f'
+    elif hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return str(value).translate(COPY_ESCAPES)
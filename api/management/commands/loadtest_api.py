@@ -0,0 +1,89 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """
+    HTTP并发压测
+
+    对运行中的部署按多个并发级别持续发送验证请求，输出吞吐和延迟分位数。
+    分别指向同步部署（gunicorn sync worker）和异步部署（gunicorn + UvicornWorker），
+    并将两者都限制为1个worker，即可对比单个worker能承载的并发连接数：
+        python manage.py loadtest_api --url http://127.0.0.1:8000/api/v1/verify/ \\
+            --api-key KEY --card-key CARD --concurrency 10,50,200
+    """
+    help = '对验证/查询接口做多并发级别压测，输出吞吐与延迟分位数'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', required=True, help='接口完整地址，如 http://127.0.0.1:8000/api/v1/verify/')
+        parser.add_argument('--api-key', required=True, help='API密钥')
+        parser.add_argument('--card-key', required=True, help='用于压测的卡密（建议使用时间卡）')
+        parser.add_argument('--device-id', default='', help='设备ID（可选）')
+        parser.add_argument('--concurrency', default='10,50,100,200', help='逗号分隔的并发级别')
+        parser.add_argument('--duration', type=float, default=10.0, help='每个并发级别持续秒数')
+        parser.add_argument('--timeout', type=float, default=30.0, help='单个请求超时秒数')
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',') if level.strip()]
+        except ValueError:
+            raise CommandError('--concurrency 必须是逗号分隔的整数')
+
+        payload = {'api_key': options['api_key'], 'card_key': options['card_key']}
+        if options['device_id']:
+            payload['device_id'] = options['device_id']
+        body = json.dumps(payload)
+
+        self.stdout.write(f"目标: {options['url']}  每级持续 {options['duration']}s")
+        self.stdout.write(f"{'并发':>6} {'请求数':>8} {'错误':>6} {'吞吐(req/s)':>12} "
+                          f"{'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'max(ms)':>9}")
+
+        for level in levels:
+            latencies, errors, elapsed = self._run_level(
+                options['url'], body, level, options['duration'], options['timeout']
+            )
+            count = len(latencies)
+            if count:
+                p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+                max_latency = max(latencies)
+            else:
+                p50 = p95 = p99 = max_latency = 0.0
+            self.stdout.write(
+                f"{level:>6} {count:>8} {errors:>6} {count / elapsed:>12.1f} "
+                f"{p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {max_latency:>9.1f}"
+            )
+
+    def _run_level(self, url, body, concurrency, duration, timeout):
+        """以指定并发持续发送请求，返回 (成功请求延迟列表, 错误数, 实际耗时)"""
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def worker():
+            session = requests.Session()
+            headers = {'Content-Type': 'application/json'}
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = session.post(url, data=body, headers=headers, timeout=timeout)
+                    ok = response.status_code < 500
+                except requests.RequestException:
+                    ok = False
+                latency = (time.perf_counter() - start) * 1000
+                with lock:
+                    if ok:
+                        latencies.append(latency)
+                    else:
+                        errors[0] += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(worker)
+        return latencies, errors[0], time.perf_counter() - start
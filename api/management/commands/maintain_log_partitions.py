@@ -0,0 +1,69 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from api.partitions import LogPartitionManager, get_log_tables
+
+
+class Command(BaseCommand):
+    """
+    维护日志表分区
+
+    预建当前及之后 --premake 个周期的分区，并删除（--detach 时分离）超过保留期的分区。
+    建议每天执行一次。非 PostgreSQL 数据库没有分区，保留期清理退化为分批 DELETE。
+    """
+    help = '预建日志表分区并清理超过保留期的分区'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--premake', type=int, default=getattr(settings, 'LOG_PARTITION_PREMAKE', 3),
+                            help='预建的未来分区数量')
+        parser.add_argument('--retention-days', type=int, default=getattr(settings, 'LOG_RETENTION_DAYS', 0),
+                            help='日志保留天数，0 表示不清理')
+        parser.add_argument('--detach', action='store_true', help='只分离过期分区（保留为独立表供归档），不删除')
+        parser.add_argument('--dry-run', action='store_true', help='只列出将要清理的分区')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='非分区表每次删除的行数')
+
+    def handle(self, *args, **options):
+        retention_days = options['retention_days']
+        cutoff = timezone.now() - timedelta(days=retention_days) if retention_days > 0 else None
+
+        for model, column in get_log_tables():
+            table = model._meta.db_table
+            if not LogPartitionManager.is_supported():
+                if cutoff is not None and not options['dry_run']:
+                    deleted = self._delete_expired(model, column, cutoff, options['chunk_size'])
+                    self.stdout.write(f"{table}: 删除 {deleted} 条过期日志")
+                continue
+
+            with transaction.atomic(), connection.cursor() as cursor:
+                if not LogPartitionManager.is_partitioned(cursor, table):
+                    self.stdout.write(self.style.WARNING(f"{table} 不是分区表，请先执行 migrate"))
+                    continue
+                created = LogPartitionManager.ensure_partitions(cursor, table, column, options['premake'])
+                for name in created:
+                    self.stdout.write(f"{table}: 新建分区 {name}")
+                if cutoff is not None:
+                    expired = LogPartitionManager.expire_partitions(
+                        cursor, table, cutoff, detach=options['detach'], dry_run=options['dry_run']
+                    )
+                    action = '将清理' if options['dry_run'] else ('分离' if options['detach'] else '删除')
+                    for name in expired:
+                        self.stdout.write(f"{table}: {action}分区 {name}")
+
+                cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {connection.ops.quote_name(table + '_default')})")
+                if cursor.fetchone()[0]:
+                    self.stdout.write(self.style.WARNING(
+                        f"{table}_default 中有日志，说明分区未及时预建或时间超出预建范围；建立对应周期的分区时会自动迁入"
+                    ))
+
+        self.stdout.write(self.style.SUCCESS('日志分区维护完成'))
+
+    @staticmethod
+    def _delete_expired(model, column, cutoff, chunk_size):
+        deleted = 0
+        while True:
+            ids = list(model.objects.filter(**{f'{column}__lt': cutoff}).values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                return deleted
+            deleted += model.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,40 @@
+import hashlib
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from cards.keyfilter import CardKeyFilter
+
+
+class Command(BaseCommand):
+    """
+    重建卡密存在性过滤器
+
+    从Card表扫描构建过滤器，输出重建耗时、估算误判率，并用随机卡密实测误判率。
+    开启 CARD_KEY_FILTER_SHARE_SNAPSHOT 时会同时发布快照，供各worker直接加载。
+    """
+    help = '重建卡密存在性过滤器并输出耗时与误判率'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--probes', type=int, default=100000, help='用于实测误判率的随机卡密数量')
+
+    def handle(self, *args, **options):
+        elapsed = CardKeyFilter.rebuild(use_snapshot=False)
+        stats = CardKeyFilter.stats()
+
+        self.stdout.write(f"卡密数量: {stats['count']}  容量: {stats['capacity']}")
+        self.stdout.write(f"位数组: {stats['bit_size']} bit ({stats['bit_size'] / 8 / 1024 / 1024:.2f} MB)  "
+                          f"哈希函数: {stats['hash_count']}")
+        self.stdout.write(f"重建耗时: {elapsed:.3f}s")
+        self.stdout.write(f"估算误判率: {stats['estimated_fp_rate']:.6f}")
+
+        probes = options['probes']
+        if probes > 0:
+            bloom = CardKeyFilter._filter
+            start = time.perf_counter()
+            hits = sum(
+                1 for _ in range(probes)
+                if hashlib.sha1(uuid.uuid4().hex.encode()).hexdigest() in bloom
+            )
+            probe_elapsed = time.perf_counter() - start
+            self.stdout.write(f"实测误判率: {hits / probes:.6f} ({hits}/{probes})  "
+                              f"单次判断(含哈希): {probe_elapsed / probes * 1e6:.2f} µs")
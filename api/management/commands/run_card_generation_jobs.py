@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from cards.generation import CardGenerationJobRunner
+
+
+class Command(BaseCommand):
+    """
+    执行后台批量生成任务
+
+    领取排队中的任务以及执行进程已失联（心跳超时）的任务，从已提交的数量继续生成。
+    设置 CARD_GENERATION_IN_PROCESS=False 时由该命令独立执行全部生成任务：``run_card_generation_jobs --loop 5``。
+    """
+    help = '执行排队中的批量生成卡密任务'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=float, default=0, help='每隔该秒数检查一次新任务（0 表示只执行一次）')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            count = CardGenerationJobRunner.run_pending()
+            if count or not options['loop']:
+                self.stdout.write(f"完成批量生成任务 {count} 个，耗时 {time.perf_counter() - start:.2f}s")
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from api.exports import ExportJobRunner
+
+
+class Command(BaseCommand):
+    """
+    执行后台导出任务
+
+    领取排队中的任务以及执行进程已失联（心跳超时）的任务，从上次写入的位置继续，并清理过期的导出文件。
+    设置 EXPORT_JOB_IN_PROCESS=False 时由该命令独立执行全部导出任务：``run_export_jobs --loop 5``。
+    """
+    help = '执行排队中的导出任务并清理过期的导出文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=float, default=0, help='每隔该秒数检查一次新任务（0 表示只执行一次）')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            count = ExportJobRunner.run_pending()
+            expired = ExportJobRunner.cleanup_expired()
+            if count or expired or not options['loop']:
+                self.stdout.write(
+                    f"完成导出任务 {count} 个，清理过期文件 {expired} 个，耗时 {time.perf_counter() - start:.2f}s"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
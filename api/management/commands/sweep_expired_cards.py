@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from cards.expiry import CardExpirySweeper
+
+
+class Command(BaseCommand):
+    """
+    批量转换过期的时间卡和次数已用完的次数卡
+
+    建议每分钟执行一次或使用 ``--loop 60`` 常驻运行；多个节点同时运行时只有一个会执行清理。
+    """
+    help = '把到期的时间卡置为已过期、次数用完的次数卡置为已用完'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='每批更新的卡密数，默认 CARD_EXPIRY_SWEEP_CHUNK_SIZE')
+        parser.add_argument('--loop', type=float, default=0, help='每隔该秒数重复清理（0 表示只执行一次）')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            counts = CardExpirySweeper.sweep(chunk_size=options['chunk_size'])
+            elapsed = time.perf_counter() - start
+            if counts is None:
+                self.stdout.write(self.style.WARNING('其他节点正在清理，已跳过'))
+            else:
+                self.stdout.write(
+                    f"过期时间卡 {counts['expired']} 张，用完次数卡 {counts['used_up']} 张，耗时 {elapsed:.2f}s"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
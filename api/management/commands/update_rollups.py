@@ -0,0 +1,41 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.rollups import RollupService
+
+
+class Command(BaseCommand):
+    """
+    把新增的API调用日志和验证日志累加到汇总表
+
+    worker 默认会在后台定期汇总（ROLLUP_AUTO_UPDATE）；日志量大时建议关闭自动汇总，
+    改为单独运行 ``update_rollups --loop 60``。首次部署时执行一次可回填全部历史日志。
+    """
+    help = '增量汇总API调用日志与验证日志'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None, help='每批汇总的日志条数')
+        parser.add_argument('--settle', type=float, default=None,
+                            help='日志id上界记录后等待多少秒再汇总，默认 ROLLUP_SETTLE_SECONDS')
+        parser.add_argument('--loop', type=float, default=0, help='每隔该秒数重复汇总（0 表示只执行一次）')
+
+    def handle(self, *args, **options):
+        settle = options['settle']
+        if settle is None:
+            settle = getattr(settings, 'ROLLUP_SETTLE_SECONDS', 5)
+        while True:
+            start = time.perf_counter()
+            processed = RollupService.update(chunk_size=options['chunk_size'], settle=settle)
+            if not options['loop']:
+                # 新记录的上界要等待 settle 秒后才会汇总，单次执行时等待后再汇总一轮
+                time.sleep(settle)
+                for source, count in RollupService.update(chunk_size=options['chunk_size'], settle=settle).items():
+                    processed[source] += count
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"API调用日志 {processed[RollupService.API_CALL_SOURCE]} 条，"
+                f"验证日志 {processed[RollupService.VERIFICATION_SOURCE]} 条，耗时 {elapsed:.2f}s"
+            )
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
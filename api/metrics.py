@@ -0,0 +1,367 @@
+"""
+Prometheus 指标
+
+/metrics 以 Prometheus 文本格式输出：
+
+- API：按端点和错误码（ApiErrorCode）的请求数、按端点的耗时直方图；
+- 验证结果：按原因（success、card_not_found、card_expired、device_limit_exceeded……）的次数；
+- HTTP：按路由、方法、状态码的请求数和耗时直方图，每个请求的数据库查询次数/耗时直方图，处理中的请求数；
+- 缓存：各缓存层（API密钥、卡密状态、卡密过滤器、系统设置、控制面板统计）的命中/未命中次数。
+
+多进程 gunicorn 下各 worker 先在进程内累加，由后台线程（api/background.py）每 METRICS_FLUSH_INTERVAL 秒
+用 HINCRBYFLOAT 合并到 Redis 的同一个哈希中，/metrics 落在任何一个 worker 上都能读到所有 worker 的合计；
+处理中的请求数等瞬时值由各 worker 写入自己的带过期时间的哈希，读取时求和，已退出的 worker 过期后不再计入。
+缓存后端不是 Redis 时只能输出当前进程的指标。
+"""
+import contextvars
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from django.conf import settings
+from CardVerification import metrics as app_metrics
+from CardVerification.metrics import CACHE_REQUESTS, FILTER_FALSE_POSITIVES, PREFIX
+from .background import PeriodicFlusher
+from .error_codes import ApiErrorCode, ApiResponse
+from .redis_client import get_redis_client, make_redis_key
+
+logger = logging.getLogger(__name__)
+
+# 耗时直方图的桶上限（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# 每个请求的数据库查询次数直方图的桶上限
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+API_REQUESTS = f'{PREFIX}api_requests_total'
+API_DURATION = f'{PREFIX}api_request_duration_seconds'
+VERIFY_OUTCOMES = f'{PREFIX}verify_outcomes_total'
+HTTP_REQUESTS = f'{PREFIX}http_requests_total'
+HTTP_DURATION = f'{PREFIX}http_request_duration_seconds'
+HTTP_IN_PROGRESS = f'{PREFIX}http_requests_in_progress'
+DB_QUERIES = f'{PREFIX}db_queries_per_request'
+DB_DURATION = f'{PREFIX}db_query_duration_seconds_per_request'
+WORKERS = f'{PREFIX}workers'
+
+# 指标名称 -> (类型, 说明, 直方图桶)
+METRICS = {
+    API_REQUESTS: ('counter', 'API请求数（按端点、错误码）', None),
+    API_DURATION: ('histogram', 'API请求耗时（按端点）', DURATION_BUCKETS),
+    VERIFY_OUTCOMES: ('counter', '卡密验证结果（按原因）', None),
+    HTTP_REQUESTS: ('counter', 'HTTP请求数（按路由、方法、状态码）', None),
+    HTTP_DURATION: ('histogram', 'HTTP请求耗时（按路由）', DURATION_BUCKETS),
+    HTTP_IN_PROGRESS: ('gauge', '正在处理的HTTP请求数（所有worker合计）', None),
+    DB_QUERIES: ('histogram', '每个请求的数据库查询次数（按路由）', QUERY_COUNT_BUCKETS),
+    DB_DURATION: ('histogram', '每个请求的数据库查询总耗时（按路由）', DURATION_BUCKETS),
+    CACHE_REQUESTS: ('counter', '缓存读取次数（按缓存层、hit/miss；卡密过滤器的hit表示确定不存在、未访问数据库）', None),
+    FILTER_FALSE_POSITIVES: ('counter', '卡密过滤器误判次数（判断可能存在但数据库中不存在）', None),
+    WORKERS: ('gauge', '最近上报过指标的worker数', None),
+}
+
+ERROR_CODE_NAMES = {
+    value: name.lower() for name, value in vars(ApiErrorCode).items() if name.isupper()
+}
+
+# 验证失败响应的消息 -> 原因
+VERIFY_REASONS = {
+    ApiResponse.card_not_found()['message']: 'card_not_found',
+    ApiResponse.card_expired()['message']: 'card_expired',
+    ApiResponse.card_used_up()['message']: 'card_used_up',
+    ApiResponse.card_disabled()['message']: 'card_disabled',
+    ApiResponse.device_limit_exceeded()['message']: 'device_limit_exceeded',
+    ApiResponse.device_already_bound()['message']: 'device_already_bound',
+}
+
+_LE_PATTERN = re.compile(r',?le="([^"]*)"')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sample(name, labels):
+    """生成样本名（含标签），如 ``name{a="1",b="2"}``"""
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _sort_key(sample):
+    """同一序列的 _bucket（按 le 升序）、_sum、_count 排在一起"""
+    name, _, labels = sample.partition('{')
+    match = _LE_PATTERN.search(labels)
+    le = float(match.group(1)) if match else 0.0
+    suffix = 0 if name.endswith('_bucket') else 1 if name.endswith('_sum') else 2
+    return _LE_PATTERN.sub('', labels), suffix, le
+
+
+def _family(sample):
+    name = sample.partition('{')[0]
+    if name in METRICS:
+        return name
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+            return name[:-len(suffix)]
+    return None
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def error_code_name(code):
+    return ERROR_CODE_NAMES.get(code, 'unknown')
+
+
+def verify_reason(response_data):
+    """验证结果的原因标签"""
+    if response_data.get('success'):
+        return 'success'
+    reason = VERIFY_REASONS.get(response_data.get('message'))
+    if reason is not None:
+        return reason
+    return error_code_name(response_data.get('code'))
+
+
+class Metrics:
+    """进程内累加、定期合并到 Redis 的指标注册表"""
+
+    VALUES_KEY = 'metrics:values'
+    GAUGES_KEY_PREFIX = 'metrics:gauges:'
+    TASK_NAME = 'metrics'
+
+    _lock = threading.Lock()
+    # 样本名 -> 尚未写入 Redis 的增量
+    _pending = {}
+    # 没有 Redis 时的进程内累计值
+    _local = {}
+    # 本进程的瞬时值（样本名 -> 当前值）
+    _gauges = {}
+    # (指标, 标签) -> 样本名（直方图为各桶、_sum、_count 的样本名）
+    _series = {}
+    _flusher_pid = None
+
+    @staticmethod
+    def is_enabled():
+        return getattr(settings, 'METRICS_ENABLED', True)
+
+    @classmethod
+    def _series_for(cls, name, labels):
+        key = (name, labels)
+        series = cls._series.get(key)
+        if series is None:
+            buckets = METRICS[name][2]
+            if buckets is None:
+                series = _sample(name, labels)
+            else:
+                series = (
+                    [(bound, _sample(f'{name}_bucket', labels + (('le', _format_value(bound)),))) for bound in buckets]
+                    + [(float('inf'), _sample(f'{name}_bucket', labels + (('le', '+Inf'),)))],
+                    _sample(f'{name}_sum', labels),
+                    _sample(f'{name}_count', labels),
+                )
+            cls._series[key] = series
+        return series
+
+    @classmethod
+    def _ensure_flusher(cls):
+        # 每个进程（含 fork 出的 worker）注册一次，避免每次计数都获取后台任务的锁
+        pid = os.getpid()
+        if cls._flusher_pid != pid:
+            PeriodicFlusher.register(cls.TASK_NAME, cls.flush, getattr(settings, 'METRICS_FLUSH_INTERVAL', 1))
+            cls._flusher_pid = pid
+
+    @classmethod
+    def inc(cls, name, value=1, **labels):
+        """计数器加 value"""
+        if not cls.is_enabled():
+            return
+        sample = cls._series_for(name, tuple(sorted(labels.items())))
+        with cls._lock:
+            cls._pending[sample] = cls._pending.get(sample, 0) + value
+        cls._ensure_flusher()
+
+    @classmethod
+    def observe(cls, name, value, **labels):
+        """直方图记录一个观测值"""
+        if not cls.is_enabled():
+            return
+        buckets, sum_sample, count_sample = cls._series_for(name, tuple(sorted(labels.items())))
+        with cls._lock:
+            pending = cls._pending
+            # 每个桶都要输出（计数为0的桶也写入），Prometheus 才能正确计算分位数
+            for bound, sample in buckets:
+                pending[sample] = pending.get(sample, 0) + (value <= bound)
+            pending[sum_sample] = pending.get(sum_sample, 0) + value
+            pending[count_sample] = pending.get(count_sample, 0) + 1
+        cls._ensure_flusher()
+
+    @classmethod
+    def add_gauge(cls, name, delta, **labels):
+        """本进程的瞬时值加 delta（可为负）"""
+        if not cls.is_enabled():
+            return
+        sample = cls._series_for(name, tuple(sorted(labels.items())))
+        with cls._lock:
+            cls._gauges[sample] = cls._gauges.get(sample, 0) + delta
+        cls._ensure_flusher()
+
+    @classmethod
+    def _gauges_key(cls):
+        return make_redis_key(f"{cls.GAUGES_KEY_PREFIX}{socket.gethostname()}:{os.getpid()}")
+
+    @classmethod
+    def flush(cls):
+        """把本进程的增量合并到 Redis，并刷新本进程的瞬时值"""
+        with cls._lock:
+            pending, cls._pending = cls._pending, {}
+            gauges = dict(cls._gauges)
+        # 其他应用记录的计数（见 CardVerification/metrics.py）
+        for (name, labels), value in app_metrics.drain().items():
+            sample = cls._series_for(name, labels)
+            pending[sample] = pending.get(sample, 0) + value
+
+        client = get_redis_client()
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=False)
+                values_key = make_redis_key(cls.VALUES_KEY)
+                for sample, value in pending.items():
+                    pipe.hincrbyfloat(values_key, sample, value)
+                if gauges:
+                    gauges_key = cls._gauges_key()
+                    pipe.hset(gauges_key, mapping=gauges)
+                    pipe.expire(gauges_key, max(10, int(getattr(settings, 'METRICS_FLUSH_INTERVAL', 1) * 5)))
+                pipe.execute()
+                return len(pending)
+            except Exception as e:
+                logger.warning(f"写入指标到Redis失败，保留在进程内: {e}")
+
+        with cls._lock:
+            for sample, value in pending.items():
+                cls._local[sample] = cls._local.get(sample, 0) + value
+        return len(pending)
+
+    @classmethod
+    def collect(cls):
+        """
+        读取所有 worker 的指标
+
+        Returns:
+            tuple: (样本名 -> 累计值, 样本名 -> 各worker瞬时值之和, worker数)
+        """
+        cls.flush()
+        client = get_redis_client()
+        if client is not None:
+            try:
+                values = {
+                    field.decode(): float(value)
+                    for field, value in client.hgetall(make_redis_key(cls.VALUES_KEY)).items()
+                }
+                gauges, workers = {}, 0
+                for key in client.scan_iter(match=make_redis_key(f"{cls.GAUGES_KEY_PREFIX}*"), count=100):
+                    workers += 1
+                    for field, value in client.hgetall(key).items():
+                        gauges[field.decode()] = gauges.get(field.decode(), 0) + float(value)
+                return values, gauges, workers
+            except Exception as e:
+                logger.warning(f"读取Redis中的指标失败，只输出本进程的指标: {e}")
+
+        with cls._lock:
+            values = dict(cls._local)
+            for sample, value in cls._pending.items():
+                values[sample] = values.get(sample, 0) + value
+            return values, dict(cls._gauges), 1
+
+    @classmethod
+    def render(cls):
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        values, gauges, workers = cls.collect()
+        values.update(gauges)
+        values[WORKERS] = workers
+
+        families = {}
+        for sample, value in values.items():
+            family = _family(sample)
+            if family is not None:
+                families.setdefault(family, []).append((sample, value))
+
+        lines = []
+        for name, (kind, help_text, _) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for sample, value in sorted(families.get(name, ()), key=lambda item: _sort_key(item[0])):
+                lines.append(f'{sample} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# ===== 每个请求的数据库查询统计 =====
+
+# 当前请求的 [查询次数, 查询耗时(纳秒)]，同步线程和异步任务（含 sync_to_async）共用
+_request_queries = contextvars.ContextVar('request_queries', default=None)
+
+
+def query_wrapper(execute, sql, params, many, context):
+    """数据库执行包装器（见 connection_created 信号），计入当前请求的查询次数和耗时"""
+    stats = _request_queries.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter_ns()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter_ns() - start
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    """新建数据库连接时安装查询统计包装器"""
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, query_wrapper)
+
+
+def start_request():
+    """
+    开始统计一个HTTP请求
+
+    Returns:
+        tuple: 传给 finish_request() 的状态
+    """
+    stats = [0, 0]
+    token = _request_queries.set(stats)
+    Metrics.add_gauge(HTTP_IN_PROGRESS, 1)
+    return time.perf_counter_ns(), stats, token
+
+
+def finish_request(request, response, state):
+    """记录HTTP请求数、耗时和数据库查询统计"""
+    start_ns, stats, token = state
+    duration = (time.perf_counter_ns() - start_ns) / 1e9
+    _request_queries.reset(token)
+    Metrics.add_gauge(HTTP_IN_PROGRESS, -1)
+    try:
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else 'unmatched'
+        status = response.status_code if response is not None else 500
+        Metrics.inc(HTTP_REQUESTS, route=route, method=request.method, status=status)
+        Metrics.observe(HTTP_DURATION, duration, route=route)
+        Metrics.observe(DB_QUERIES, stats[0], route=route)
+        Metrics.observe(DB_DURATION, stats[1] / 1e9, route=route)
+    except Exception as e:
+        logger.warning(f"记录请求指标失败: {e}")
+
+
+def record_api_response(endpoint, response, duration):
+    """记录一次API请求（错误码取自响应数据的 code 字段）"""
+    code = getattr(response, 'api_code', None)
+    if code is None:
+        data = getattr(response, 'data', None)
+        code = data.get('code') if isinstance(data, dict) else None
+    Metrics.inc(API_REQUESTS, endpoint=endpoint, code=error_code_name(code))
+    Metrics.observe(API_DURATION, duration, endpoint=endpoint)
+
+
+def record_verify_outcome(response_data, reason=None):
+    """记录一次卡密验证结果（参数校验失败等无法从响应判断的原因由调用方指定）"""
+    Metrics.inc(VERIFY_OUTCOMES, reason=reason or verify_reason(response_data))
@@ -0,0 +1,39 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from .metrics import Metrics, finish_request, start_request
+
+
+class MetricsMiddleware:
+    """记录每个HTTP请求的次数、耗时和数据库查询统计（见 api/metrics.py），同步和异步请求都适用"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not Metrics.is_enabled():
+            return self.get_response(request)
+        state = start_request()
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            finish_request(request, response, state)
+
+    async def __acall__(self, request):
+        if not Metrics.is_enabled():
+            return await self.get_response(request)
+        state = start_request()
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            finish_request(request, response, state)
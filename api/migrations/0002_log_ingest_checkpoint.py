@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogIngestCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('segment', models.CharField(max_length=255, unique=True, verbose_name='分段文件')),
+                ('offset', models.BigIntegerField(default=0, verbose_name='已导入字节偏移')),
+                ('records', models.IntegerField(default=0, verbose_name='已导入记录数')),
+                ('completed', models.BooleanField(default=False, verbose_name='已完成')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '日志导入进度',
+                'verbose_name_plural': '日志导入进度',
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:39
+
+from django.db import migrations, models
+from api.partitions import LogPartitionManager
+
+INDEXES = [
+    models.Index(fields=['call_time'], name='api_calllog_time_idx'),
+    models.Index(fields=['api_key', 'call_time'], name='api_calllog_key_time_idx'),
+]
+
+
+def add_indexes(apps, schema_editor):
+    """PostgreSQL 上 CONCURRENTLY 建索引，不阻塞日志写入"""
+    model = apps.get_model('api', 'ApiCallLog')
+    for index in INDEXES:
+        LogPartitionManager.add_index(schema_editor, model, index)
+
+
+def remove_indexes(apps, schema_editor):
+    model = apps.get_model('api', 'ApiCallLog')
+    for index in INDEXES:
+        schema_editor.remove_index(model, index)
+
+
+def prepare_partition(apps, schema_editor):
+    """事务外建立分区转换所需的唯一索引和时间上界约束"""
+    model = apps.get_model('api', 'ApiCallLog')
+    LogPartitionManager.prepare_conversion(schema_editor, model._meta.db_table, 'call_time')
+
+
+def partition_table(apps, schema_editor):
+    """PostgreSQL 上把日志表改为按调用时间分区（其他数据库不处理）"""
+    model = apps.get_model('api', 'ApiCallLog')
+    LogPartitionManager.convert_to_partitioned(schema_editor, model._meta.db_table, 'call_time')
+
+
+class Migration(migrations.Migration):
+    # CONCURRENTLY 不能在事务中执行；只有改表的一步在事务中
+    atomic = False
+
+    dependencies = [
+        ('api', '0002_log_ingest_checkpoint'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[migrations.AddIndex(model_name='apicalllog', index=index) for index in INDEXES],
+            database_operations=[migrations.RunPython(add_indexes, remove_indexes)],
+        ),
+        migrations.RunPython(prepare_partition, migrations.RunPython.noop),
+        migrations.RunPython(partition_table, migrations.RunPython.noop, atomic=True),
+    ]
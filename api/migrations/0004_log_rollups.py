@@ -0,0 +1,67 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_partition_apicalllog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='数据源')),
+                ('last_id', models.BigIntegerField(default=0, verbose_name='已汇总到的日志ID')),
+                ('pending_id', models.BigIntegerField(blank=True, null=True, verbose_name='待汇总的日志ID上界')),
+                ('pending_at', models.DateTimeField(blank=True, null=True, verbose_name='上界记录时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '日志汇总进度',
+                'verbose_name_plural': '日志汇总进度',
+            },
+        ),
+        migrations.CreateModel(
+            name='ApiCallDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField(verbose_name='时间段起点')),
+                ('endpoint', models.CharField(max_length=255, verbose_name='接口端点')),
+                ('call_count', models.BigIntegerField(default=0, verbose_name='调用次数')),
+                ('success_count', models.BigIntegerField(default=0, verbose_name='成功次数')),
+                ('latency_sum', models.FloatField(default=0, verbose_name='响应时间合计(ms)')),
+                ('latency_max', models.FloatField(default=0, verbose_name='最大响应时间(ms)')),
+                ('latency_histogram', models.JSONField(default=list, verbose_name='响应时间直方图')),
+                ('api_key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.apikey', verbose_name='API密钥')),
+            ],
+            options={
+                'verbose_name': 'API调用每日汇总',
+                'verbose_name_plural': 'API调用每日汇总',
+                'unique_together': {('bucket_start', 'api_key', 'endpoint')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ApiCallHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField(verbose_name='时间段起点')),
+                ('endpoint', models.CharField(max_length=255, verbose_name='接口端点')),
+                ('call_count', models.BigIntegerField(default=0, verbose_name='调用次数')),
+                ('success_count', models.BigIntegerField(default=0, verbose_name='成功次数')),
+                ('latency_sum', models.FloatField(default=0, verbose_name='响应时间合计(ms)')),
+                ('latency_max', models.FloatField(default=0, verbose_name='最大响应时间(ms)')),
+                ('latency_histogram', models.JSONField(default=list, verbose_name='响应时间直方图')),
+                ('api_key', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.apikey', verbose_name='API密钥')),
+            ],
+            options={
+                'verbose_name': 'API调用小时汇总',
+                'verbose_name_plural': 'API调用小时汇总',
+                'unique_together': {('bucket_start', 'api_key', 'endpoint')},
+            },
+        ),
+    ]
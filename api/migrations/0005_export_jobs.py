@@ -0,0 +1,47 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_log_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dataset', models.CharField(choices=[('cards', '卡密'), ('verification_logs', '验证记录'), ('api_call_logs', 'API调用记录')], max_length=30, verbose_name='导出内容')),
+                ('export_format', models.CharField(choices=[('xlsx', 'Excel'), ('csv', 'CSV'), ('csv.gz', 'CSV（gzip压缩）')], default='xlsx', max_length=10, verbose_name='文件格式')),
+                ('filters', models.JSONField(blank=True, default=dict, verbose_name='筛选条件')),
+                ('status', models.CharField(choices=[('pending', '排队中'), ('running', '导出中'), ('completed', '已完成'), ('failed', '失败'), ('expired', '已过期')], default='pending', max_length=10, verbose_name='状态')),
+                ('total_rows', models.BigIntegerField(blank=True, null=True, verbose_name='总行数')),
+                ('written_rows', models.BigIntegerField(default=0, verbose_name='已写入行数')),
+                ('last_pk', models.BigIntegerField(blank=True, null=True, verbose_name='已写入的最后一行ID')),
+                ('part_bytes', models.BigIntegerField(default=0, verbose_name='临时文件已确认字节数')),
+                ('file_name', models.CharField(blank=True, max_length=255, verbose_name='文件名')),
+                ('file_size', models.BigIntegerField(default=0, verbose_name='文件大小')),
+                ('error_message', models.TextField(blank=True, verbose_name='错误信息')),
+                ('worker', models.CharField(blank=True, max_length=64, verbose_name='执行进程')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='心跳时间')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='文件过期时间')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='创建者')),
+            ],
+            options={
+                'verbose_name': '导出任务',
+                'verbose_name_plural': '导出任务',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'heartbeat_at'], name='api_exportjob_status_idx')],
+            },
+        ),
+    ]
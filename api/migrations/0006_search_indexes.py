@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_export_jobs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='apicalllog',
+            index=models.Index(fields=['ip_address', 'call_time'], name='api_calllog_ip_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='apicalllog',
+            index=models.Index(fields=['endpoint', 'call_time'], name='api_calllog_ep_time_idx'),
+        ),
+    ]
@@ -2,12 +2,20 @@ import json
 import time
 import logging
 from functools import wraps
-from django.utils import timezone
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.http import JsonResponse
+from django.views import View
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from .cache import ApiKeyCache
 from .error_codes import ApiResponse, ApiErrorCode, get_http_status
-from .models import ApiKey, ApiCallLog
+from .latency import LatencyRecorder
+from .logbuffer import LogWriter
+from .metrics import record_api_response
+from .models import ApiCallLog
+from .ratelimit import RateLimiter
+from .timing import current_timer, finish_request, stage, start_request
 
 logger = logging.getLogger(__name__)
 
@@ -78,32 +86,60 @@ class ApiLoggingMixin:
     def log_api_call(self, api_key_obj, request, response_code, start_time, success, error_message='', endpoint=None):
         """记录API调用日志"""
         try:
-            response_time = (timezone.now() - start_time).total_seconds() * 1000
-            
-            # 只有当api_key_obj不为None时才记录到数据库
-            if api_key_obj is not None:
-                ApiCallLog.objects.create(
-                    api_key=api_key_obj,
-                    endpoint=endpoint or request.path,
-                    method=request.method,
-                    ip_address=self.get_client_ip(request),
-                    user_agent=self.get_user_agent(request),
-                    response_code=response_code,
-                    response_time=response_time,
-                    success=success,
-                    error_message=error_message[:1000]  # 限制错误消息长度
-                )
+            call_log = self._build_api_call_log(
+                api_key_obj, request, response_code, start_time, success, error_message, endpoint
+            )
             
-            # 记录到日志文件
-            log_level = logging.INFO if success else logging.WARNING
-            logger.log(log_level, 
-                f"API调用 - 端点:{endpoint or request.path} "
-                f"方法:{request.method} IP:{self.get_client_ip(request)} "
-                f"状态码:{response_code} 响应时间:{response_time:.2f}ms "
-                f"成功:{success} 错误:{error_message}")
+            # 只有当api_key_obj不为None时才记录到数据库（经缓冲批量写入）
+            if call_log is not None:
+                with stage('call_log'):
+                    LogWriter.write(call_log)
                 
         except Exception as e:
             logger.error(f"记录API调用日志失败: {e}")
+    
+    async def alog_api_call(self, api_key_obj, request, response_code, start_time, success, error_message='', endpoint=None):
+        """异步记录API调用日志"""
+        try:
+            call_log = self._build_api_call_log(
+                api_key_obj, request, response_code, start_time, success, error_message, endpoint
+            )
+            if call_log is not None:
+                with stage('call_log'):
+                    if LogWriter.is_enabled():
+                        LogWriter.write(call_log)
+                    else:
+                        await call_log.asave()
+                
+        except Exception as e:
+            logger.error(f"记录API调用日志失败: {e}")
+    
+    def _build_api_call_log(self, api_key_obj, request, response_code, start_time, success, error_message='', endpoint=None):
+        """写日志文件并构建API调用记录对象（api_key_obj为None时返回None）"""
+        response_time = (time.perf_counter_ns() - start_time) / 1e6
+        
+        # 记录到日志文件
+        log_level = logging.INFO if success else logging.WARNING
+        logger.log(log_level, 
+            f"API调用 - 端点:{endpoint or request.path} "
+            f"方法:{request.method} IP:{self.get_client_ip(request)} "
+            f"状态码:{response_code} 响应时间:{response_time:.2f}ms "
+            f"成功:{success} 错误:{error_message}")
+        
+        if api_key_obj is None:
+            return None
+        LatencyRecorder.record(api_key_obj.pk, endpoint or request.path, response_time)
+        return ApiCallLog(
+            api_key=api_key_obj,
+            endpoint=endpoint or request.path,
+            method=request.method,
+            ip_address=self.get_client_ip(request),
+            user_agent=self.get_user_agent(request),
+            response_code=response_code,
+            response_time=response_time,
+            success=success,
+            error_message=error_message[:1000]  # 限制错误消息长度
+        )
 
 
 class ApiKeyValidationMixin:
@@ -114,22 +150,52 @@ class ApiKeyValidationMixin:
         if not api_key:
             return None, ApiResponse.missing_parameters(['api_key'])
         
-        try:
-            api_key_obj = ApiKey.objects.select_related('created_by').get(
-                key=api_key, 
-                is_active=True
-            )
-            
-            # 检查频率限制（可以在这里添加Redis缓存实现）
-            # TODO: 实现频率限制逻辑
-            
-            return api_key_obj, None
-            
-        except ApiKey.DoesNotExist:
+        # 进程内缓存，启停/修改/删除密钥时跨worker失效
+        with stage('api_key'):
+            api_key_obj = ApiKeyCache.get(api_key)
+        if api_key_obj is None or not api_key_obj.is_active:
             return None, ApiResponse.invalid_api_key()
+        
+        return api_key_obj, None
+    
+    async def avalidate_api_key(self, api_key):
+        """异步验证API密钥"""
+        if not api_key:
+            return None, ApiResponse.missing_parameters(['api_key'])
+        
+        with stage('api_key'):
+            api_key_obj = await ApiKeyCache.aget(api_key)
+        if api_key_obj is None or not api_key_obj.is_active:
+            return None, ApiResponse.invalid_api_key()
+        return api_key_obj, None
+
+
+class RateLimitMixin:
+    """频率限制混入类"""
+    
+    def check_rate_limit(self, request, api_key_obj=None, max_requests=60, window_seconds=60, cost=1):
+        """
+        消耗 cost 次请求额度（批量接口按条目数消耗）
+        
+        Returns:
+            RateLimitResult | None: 不限制时返回None
+        """
+        with stage('rate_limit'):
+            if api_key_obj is not None:
+                identity = f"key:{api_key_obj.pk}"
+                if getattr(settings, 'API_RATE_LIMIT_BY_IP', False):
+                    identity = f"{identity}:ip:{self.get_client_ip(request)}"
+                return RateLimiter.check(identity, api_key_obj.rate_limit, cost=cost)
+            return RateLimiter.check(f"ip:{self.get_client_ip(request)}", max_requests, window_seconds, cost)
+    
+    async def acheck_rate_limit(self, request, api_key_obj=None, max_requests=60, window_seconds=60, cost=1):
+        """异步消耗 cost 次请求额度"""
+        return await sync_to_async(self.check_rate_limit, thread_sensitive=False)(
+            request, api_key_obj, max_requests, window_seconds, cost
+        )
 
 
-class BaseApiView(APIView, ApiRequestMixin, ApiResponseMixin, ApiLoggingMixin, ApiKeyValidationMixin):
+class BaseApiView(APIView, ApiRequestMixin, ApiResponseMixin, ApiLoggingMixin, ApiKeyValidationMixin, RateLimitMixin):
     """基础API视图类"""
     
     permission_classes = []  # 允许未认证访问
@@ -137,15 +203,20 @@ class BaseApiView(APIView, ApiRequestMixin, ApiResponseMixin, ApiLoggingMixin, A
     
     def dispatch(self, request, *args, **kwargs):
         """重写dispatch方法，添加通用处理逻辑"""
-        self.start_time = timezone.now()
+        self.start_time = time.perf_counter_ns()
+        timer = start_request(self.start_time)
         
         try:
-            return super().dispatch(request, *args, **kwargs)
+            response = super().dispatch(request, *args, **kwargs)
         except Exception as e:
             logger.error(f"API请求处理异常: {e}", exc_info=True)
             response_data = ApiResponse.system_error(f"系统内部错误")
             self.log_api_call(None, request, 500, self.start_time, False, str(e))
-            return Response(response_data, status=get_http_status(response_data['code']))
+            response = Response(response_data, status=get_http_status(response_data['code']))
+        record_api_response(request.path, response, (time.perf_counter_ns() - self.start_time) / 1e9)
+        # require_api_key 把API密钥放在 DRF 的 Request 上
+        api_key_obj = getattr(getattr(self, 'request', None), 'api_key_obj', None)
+        return finish_request(response, timer, api_key_obj, request.path)
     
     def handle_exception(self, exc):
         """统一异常处理"""
@@ -160,24 +231,99 @@ class BaseApiView(APIView, ApiRequestMixin, ApiResponseMixin, ApiLoggingMixin, A
         return Response(response_data, status=get_http_status(response_data['code']))
 
 
+class AsyncBaseApiView(ApiRequestMixin, ApiLoggingMixin, ApiKeyValidationMixin, RateLimitMixin, View):
+    """
+    异步API视图基类
+    
+    在ASGI下原生运行，处理方法必须为 async def。
+    不依赖DRF，响应统一使用 JsonResponse。
+    """
+    
+    http_method_names = ['post', 'options']
+    
+    async def dispatch(self, request, *args, **kwargs):
+        """添加通用异常处理"""
+        self.start_time = time.perf_counter_ns()
+        self.rate_limit_result = None
+        self.api_key_obj = None
+        timer = start_request(self.start_time)
+        
+        try:
+            response = await super().dispatch(request, *args, **kwargs)
+            response = RateLimiter.apply_headers(response, self.rate_limit_result)
+        except Exception as e:
+            logger.error(f"API请求处理异常: {e}", exc_info=True)
+            await self.alog_api_call(None, request, 500, self.start_time, False, str(e))
+            response = self.json_response(ApiResponse.system_error("系统内部错误"))
+        record_api_response(request.path, response, (time.perf_counter_ns() - self.start_time) / 1e9)
+        return finish_request(response, timer, self.api_key_obj, request.path)
+    
+    def json_response(self, response_data, status=None):
+        """返回JSON响应（中文不转义，与DRF输出一致）"""
+        response = JsonResponse(
+            response_data,
+            status=status or get_http_status(response_data['code']),
+            json_dumps_params={'ensure_ascii': False}
+        )
+        # 供指标按错误码统计（见 api/metrics.py）
+        response.api_code = response_data['code']
+        return response
+    
+    async def authenticate(self, request):
+        """
+        解析请求数据并验证API密钥
+        
+        Returns:
+            tuple: (api_key_obj, data, error_response)，验证失败时error_response不为None
+        """
+        try:
+            with stage('parse'):
+                data = self.parse_request_data(request)
+        except ValueError as e:
+            return None, None, self.json_response(ApiResponse.error(ApiErrorCode.CARD_ERROR, str(e)))
+        
+        api_key_obj, error_response = await self.avalidate_api_key(data.get('api_key'))
+        if error_response:
+            await self.alog_api_call(None, request,
+                get_http_status(error_response['code']),
+                self.start_time, False, error_response['message'])
+            return None, None, self.json_response(error_response)
+        
+        # 频率限制，在任何卡密相关的数据库操作之前执行
+        self.rate_limit_result = await self.acheck_rate_limit(request, api_key_obj)
+        if self.rate_limit_result is not None and not self.rate_limit_result.allowed:
+            response_data = ApiResponse.rate_limited(self.rate_limit_result.retry_after)
+            await self.alog_api_call(None, request,
+                get_http_status(response_data['code']),
+                self.start_time, False, response_data['message'])
+            return None, None, self.json_response(response_data)
+        
+        self.api_key_obj = api_key_obj
+        return api_key_obj, data, None
+
+
 def api_monitor(func):
-    """API性能监控装饰器"""
+    """API性能监控装饰器：超过 API_SLOW_REQUEST_MS 的请求记录警告及各阶段耗时"""
     @wraps(func)
     def wrapper(self, request, *args, **kwargs):
-        start_time = time.time()
+        start_time = time.perf_counter_ns()
         
         try:
             response = func(self, request, *args, **kwargs)
             
             # 记录性能指标
-            duration = (time.time() - start_time) * 1000
-            if duration > 1000:  # 超过1秒的请求记录警告
-                logger.warning(f"慢API请求: {request.path} 耗时 {duration:.2f}ms")
+            duration = (time.perf_counter_ns() - start_time) / 1e6
+            if duration > getattr(settings, 'API_SLOW_REQUEST_MS', 1000):
+                timer = current_timer()
+                stages = ', '.join(
+                    f"{name}={value / 1e6:.2f}ms" for name, value in timer.stages.items()
+                ) if timer is not None else ''
+                logger.warning(f"慢API请求: {request.path} 耗时 {duration:.2f}ms {stages}")
             
             return response
             
         except Exception as e:
-            duration = (time.time() - start_time) * 1000
+            duration = (time.perf_counter_ns() - start_time) / 1e6
             logger.error(f"API请求失败: {request.path} 耗时 {duration:.2f}ms 错误: {e}")
             raise
     
@@ -185,13 +331,32 @@ def api_monitor(func):
 
 
 def rate_limit(max_requests=60, window_seconds=60):
-    """频率限制装饰器"""
+    """
+    频率限制装饰器
+    
+    已通过 require_api_key 验证时按API密钥的 rate_limit（次/分钟）限流，
+    否则按客户端IP使用 max_requests/window_seconds。
+    需放在 require_api_key 内层，在视图的任何数据库操作之前执行。
+    """
     def decorator(func):
         @wraps(func)
         def wrapper(self, request, *args, **kwargs):
-            # TODO: 实现基于Redis的频率限制
-            # 当前简单实现，生产环境建议使用Redis
-            return func(self, request, *args, **kwargs)
+            result = self.check_rate_limit(
+                request, getattr(request, 'api_key_obj', None), max_requests, window_seconds
+            )
+            if result is not None and not result.allowed:
+                response_data = ApiResponse.rate_limited(result.retry_after)
+                # 超限请求只写日志文件，不写数据库
+                self.log_api_call(None, request,
+                    get_http_status(response_data['code']),
+                    self.start_time, False, response_data['message'])
+                response = Response(response_data, status=get_http_status(response_data['code']))
+                return RateLimiter.apply_headers(response, result)
+            
+            # 视图可以追加消耗额度（如批量验证），并把最新结果放回 request.rate_limit_result
+            request.rate_limit_result = result
+            response = func(self, request, *args, **kwargs)
+            return RateLimiter.apply_headers(response, request.rate_limit_result)
         return wrapper
     return decorator
 
@@ -201,7 +366,8 @@ def require_api_key(func):
     @wraps(func)
     def wrapper(self, request, *args, **kwargs):
         try:
-            data = self.parse_request_data(request)
+            with stage('parse'):
+                data = self.parse_request_data(request)
         except ValueError as e:
             return self.error_response(ApiErrorCode.CARD_ERROR, str(e))
         
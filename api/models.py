@@ -49,6 +49,148 @@ class ApiCallLog(models.Model):
         verbose_name = 'API调用记录'
         verbose_name_plural = 'API调用记录'
         ordering = ['-call_time']
+        # PostgreSQL 上按 call_time 分区，见 api/partitions.py
+        indexes = [
+            models.Index(fields=['call_time'], name='api_calllog_time_idx'),
+            models.Index(fields=['api_key', 'call_time'], name='api_calllog_key_time_idx'),
+            # 搜索框按 IP、接口端点精确匹配（见 api/search.py 的 search_api_call_logs）
+            models.Index(fields=['ip_address', 'call_time'], name='api_calllog_ip_time_idx'),
+            models.Index(fields=['endpoint', 'call_time'], name='api_calllog_ep_time_idx'),
+        ]
 
     def __str__(self):
         return f"{self.api_key.name} - {self.endpoint} - {self.call_time}"
+
+
+class LogIngestCheckpoint(models.Model):
+    """日志落盘文件导入进度（与导入的数据在同一事务中更新，保证重放幂等）"""
+    segment = models.CharField('分段文件', max_length=255, unique=True)
+    offset = models.BigIntegerField('已导入字节偏移', default=0)
+    records = models.IntegerField('已导入记录数', default=0)
+    completed = models.BooleanField('已完成', default=False)
+    updated_at = models.DateTimeField('更新时间', auto_now=True)
+
+    class Meta:
+        verbose_name = '日志导入进度'
+        verbose_name_plural = '日志导入进度'
+
+    def __str__(self):
+        return f"{self.segment} - {self.offset}"
+
+
+class ApiCallRollup(models.Model):
+    """API调用汇总（按时间段、API密钥、接口端点），由 api/rollups.py 增量维护"""
+    bucket_start = models.DateTimeField('时间段起点')
+    api_key = models.ForeignKey(ApiKey, on_delete=models.CASCADE, verbose_name='API密钥')
+    endpoint = models.CharField('接口端点', max_length=255)
+    call_count = models.BigIntegerField('调用次数', default=0)
+    success_count = models.BigIntegerField('成功次数', default=0)
+    latency_sum = models.FloatField('响应时间合计(ms)', default=0)
+    latency_max = models.FloatField('最大响应时间(ms)', default=0)
+    latency_histogram = models.JSONField('响应时间直方图', default=list)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f"{self.bucket_start} - {self.api_key_id} - {self.endpoint}"
+
+
+class ApiCallHourlyRollup(ApiCallRollup):
+    """API调用小时汇总"""
+
+    class Meta:
+        verbose_name = 'API调用小时汇总'
+        verbose_name_plural = 'API调用小时汇总'
+        unique_together = ['bucket_start', 'api_key', 'endpoint']
+
+
+class ApiCallDailyRollup(ApiCallRollup):
+    """API调用每日汇总（按本地时区的自然日）"""
+
+    class Meta:
+        verbose_name = 'API调用每日汇总'
+        verbose_name_plural = 'API调用每日汇总'
+        unique_together = ['bucket_start', 'api_key', 'endpoint']
+
+
+class RollupCheckpoint(models.Model):
+    """日志汇总进度（已汇总到的日志id）"""
+    name = models.CharField('数据源', max_length=50, unique=True)
+    last_id = models.BigIntegerField('已汇总到的日志ID', default=0)
+    pending_id = models.BigIntegerField('待汇总的日志ID上界', null=True, blank=True)
+    pending_at = models.DateTimeField('上界记录时间', null=True, blank=True)
+    updated_at = models.DateTimeField('更新时间', auto_now=True)
+
+    class Meta:
+        verbose_name = '日志汇总进度'
+        verbose_name_plural = '日志汇总进度'
+
+    def __str__(self):
+        return f"{self.name} - {self.last_id}"
+
+
+class ExportJob(models.Model):
+    """后台导出任务，由 api/exports.py 的 ExportJobRunner 分批执行，可从上次写入的位置继续"""
+    DATASET_CHOICES = [
+        ('cards', '卡密'),
+        ('verification_logs', '验证记录'),
+        ('api_call_logs', 'API调用记录'),
+    ]
+
+    FORMAT_CHOICES = [
+        ('xlsx', 'Excel'),
+        ('csv', 'CSV'),
+        ('csv.gz', 'CSV（gzip压缩）'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', '排队中'),
+        ('running', '导出中'),
+        ('completed', '已完成'),
+        ('failed', '失败'),
+        ('expired', '已过期'),
+    ]
+
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='创建者')
+    dataset = models.CharField('导出内容', max_length=30, choices=DATASET_CHOICES)
+    export_format = models.CharField('文件格式', max_length=10, choices=FORMAT_CHOICES, default='xlsx')
+    filters = models.JSONField('筛选条件', default=dict, blank=True)
+    status = models.CharField('状态', max_length=10, choices=STATUS_CHOICES, default='pending')
+
+    # 进度与断点：按主键倒序分批写入，last_pk/part_bytes 与临时文件同步推进
+    total_rows = models.BigIntegerField('总行数', null=True, blank=True)
+    written_rows = models.BigIntegerField('已写入行数', default=0)
+    last_pk = models.BigIntegerField('已写入的最后一行ID', null=True, blank=True)
+    part_bytes = models.BigIntegerField('临时文件已确认字节数', default=0)
+
+    file_name = models.CharField('文件名', max_length=255, blank=True)
+    file_size = models.BigIntegerField('文件大小', default=0)
+    error_message = models.TextField('错误信息', blank=True)
+
+    worker = models.CharField('执行进程', max_length=64, blank=True)
+    heartbeat_at = models.DateTimeField('心跳时间', null=True, blank=True)
+    created_at = models.DateTimeField('创建时间', default=timezone.now)
+    started_at = models.DateTimeField('开始时间', null=True, blank=True)
+    finished_at = models.DateTimeField('完成时间', null=True, blank=True)
+    expires_at = models.DateTimeField('文件过期时间', null=True, blank=True)
+
+    class Meta:
+        verbose_name = '导出任务'
+        verbose_name_plural = '导出任务'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'heartbeat_at'], name='api_exportjob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_dataset_display()} - {self.get_status_display()} - {self.created_at}"
+
+    @property
+    def progress(self):
+        """完成百分比"""
+        if self.status == 'completed':
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(99, int(self.written_rows * 100 / self.total_rows))
@@ -0,0 +1,335 @@
+"""
+日志表按时间分区（PostgreSQL 声明式分区）
+
+ApiCallLog / VerificationLog 在 PostgreSQL 上按调用/验证时间做 RANGE 分区（默认按月，
+LOG_PARTITION_INTERVAL=day 时按天），分区表名为 ``<表名>_p202610`` / ``<表名>_p20261018``：
+
+- 带时间范围（>= / <）的查询只扫描相关分区；
+- 过期日志整分区 DROP（或 DETACH 后归档），不再需要大批量 DELETE；
+- 迁移时原表整体挂为 ``<表名>_legacy`` 分区（不复制数据），另建 ``<表名>_default`` 兜底分区，
+  保证分区未及时创建时写入也不会失败。挂载所需的 (id, 时间) 唯一索引和时间上界 CHECK 约束
+  先在事务外 CONCURRENTLY 建立/校验，持有排他锁的改表步骤只修改元数据，不建索引、不扫描全表。
+
+主键变为 (id, 时间) 以满足分区约束，id 仍由序列生成、全局唯一，ORM 用法不变。
+分区由 ``manage.py maintain_log_partitions`` 定期预建和清理。其他数据库不分区。
+"""
+import logging
+import re
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+BOUND_PATTERN = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+CHECK_BOUND_PATTERN = re.compile(r"'([^']+)'")
+
+
+def get_log_tables():
+    """
+    需要分区的日志表
+
+    Returns:
+        list: [(模型, 时间字段名), ...]
+    """
+    from cards.models import VerificationLog
+    from .models import ApiCallLog
+    return [(ApiCallLog, 'call_time'), (VerificationLog, 'verification_time')]
+
+
+class LogPartitionManager:
+    """日志表分区管理"""
+
+    @staticmethod
+    def is_supported(conn=None):
+        return (conn or connection).vendor == 'postgresql'
+
+    @staticmethod
+    def get_interval():
+        return 'day' if getattr(settings, 'LOG_PARTITION_INTERVAL', 'month') == 'day' else 'month'
+
+    @staticmethod
+    def period_start(value, interval):
+        """value 所在分区周期的起点（本地时区的月初/零点）"""
+        local = timezone.localtime(value)
+        day = local.day if interval == 'day' else 1
+        return timezone.make_aware(datetime(local.year, local.month, day))
+
+    @staticmethod
+    def next_period(start, interval):
+        local = timezone.localtime(start)
+        if interval == 'day':
+            naive = datetime(local.year, local.month, local.day) + timedelta(days=1)
+        else:
+            naive = datetime(local.year + local.month // 12, local.month % 12 + 1, 1)
+        return timezone.make_aware(naive)
+
+    @staticmethod
+    def partition_name(table, start, interval):
+        local = timezone.localtime(start)
+        return f"{table}_p{local:%Y%m%d}" if interval == 'day' else f"{table}_p{local:%Y%m}"
+
+    @staticmethod
+    def is_partitioned(cursor, table):
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [table])
+        return cursor.fetchone() is not None
+
+    @staticmethod
+    def list_partitions(cursor, table):
+        """
+        列出分区
+
+        Returns:
+            list: [(分区名, 下界, 上界), ...]，按下界排序；MINVALUE 为 None，默认分区上下界均为 None
+        """
+        cursor.execute("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+        """, [table])
+        partitions = []
+        for name, bound in cursor.fetchall():
+            match = BOUND_PATTERN.search(bound)
+            if match is None:
+                partitions.append((name, None, None))
+                continue
+            lower, upper = (
+                None if value.upper() == 'MINVALUE' else parse_datetime(value.strip("'"))
+                for value in match.groups()
+            )
+            partitions.append((name, lower, upper))
+        partitions.sort(key=lambda item: (item[1] is not None, item[1] or timezone.now()))
+        return partitions
+
+    @classmethod
+    def ensure_partitions(cls, cursor, table, column, premake, now=None):
+        """
+        创建当前及之后 premake 个周期的分区（已存在或已被其他分区覆盖的跳过）
+
+        Returns:
+            list: 新建的分区名
+        """
+        interval = cls.get_interval()
+        existing = [(lower, upper) for _, lower, upper in cls.list_partitions(cursor, table) if upper is not None]
+        default = f"{table}_default"
+        now = now or timezone.now()
+        last = cls.period_start(now, interval)
+        for _ in range(premake):
+            last = cls.next_period(last, interval)
+
+        # 从兜底分区中最早的日志所在周期开始补建，漏建周期的数据会迁入新分区
+        qn = connection.ops.quote_name
+        cursor.execute(f"SELECT MIN({qn(column)}) FROM {qn(default)}")
+        earliest = cursor.fetchone()[0]
+        start = cls.period_start(min(now, earliest) if earliest else now, interval)
+
+        created = []
+        while start <= last:
+            end = cls.next_period(start, interval)
+            overlaps = any((lower is None or lower < end) and start < upper for lower, upper in existing)
+            if not overlaps:
+                cls._create_partition(cursor, table, column, cls.partition_name(table, start, interval),
+                                      start, end, default)
+                created.append(cls.partition_name(table, start, interval))
+            start = end
+        return created
+
+    @classmethod
+    def expire_partitions(cls, cursor, table, cutoff, detach=False, dry_run=False):
+        """
+        删除（或分离）上界不晚于 cutoff 的分区，整表 DROP 为常数时间操作
+
+        Returns:
+            list: 处理的分区名
+        """
+        expired = [name for name, _, upper in cls.list_partitions(cursor, table)
+                   if upper is not None and upper <= cutoff]
+        if dry_run:
+            return expired
+        qn = connection.ops.quote_name
+        for name in expired:
+            if detach:
+                cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}")
+            else:
+                cursor.execute(f"DROP TABLE {qn(name)}")
+            logger.info(f"{'分离' if detach else '删除'}日志分区 {name}")
+        return expired
+
+    @staticmethod
+    def add_index(schema_editor, model, index):
+        """添加索引；PostgreSQL 上 CONCURRENTLY 创建，不阻塞日志写入（需在事务外调用）"""
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.add_index(model, index, concurrently=True)
+        else:
+            schema_editor.add_index(model, index)
+
+    @staticmethod
+    def conversion_index_name(table):
+        return f"{table}_id_time_uniq"
+
+    @staticmethod
+    def conversion_check_name(table):
+        return f"{table}_partition_check"
+
+    @classmethod
+    def prepare_conversion(cls, schema_editor, table, column):
+        """
+        分区转换前的准备（迁移中在事务外调用，只持有不阻塞读写的锁）
+
+        - CONCURRENTLY 建立 (id, 时间) 唯一索引，挂载时直接作为历史分区的主键索引；
+        - 加上 CHECK (时间 < 上界) 约束并单独 VALIDATE，挂载时据此跳过全表范围检查。
+        """
+        if not cls.is_supported(schema_editor.connection):
+            return
+        with schema_editor.connection.cursor() as cursor:
+            if cls.is_partitioned(cursor, table):
+                return
+            cls._prepare(cursor, table, column, concurrently=True)
+
+    @classmethod
+    def _prepare(cls, cursor, table, column, concurrently):
+        """建立转换所需的唯一索引和上界约束（已存在的跳过），返回上界"""
+        qn = connection.ops.quote_name
+        index = cls.conversion_index_name(table)
+        check = cls.conversion_check_name(table)
+        option = 'CONCURRENTLY ' if concurrently else ''
+
+        cursor.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", [index])
+        row = cursor.fetchone()
+        if row is not None and not row[0]:
+            # 上次 CONCURRENTLY 中断留下的无效索引
+            cursor.execute(f"DROP INDEX {option}{qn(index)}")
+            row = None
+        if row is None:
+            cursor.execute(f"CREATE UNIQUE INDEX {option}{qn(index)} ON {qn(table)} (id, {qn(column)})")
+
+        cursor.execute(
+            "SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = to_regclass(%s) AND conname = %s",
+            [table, check]
+        )
+        row = cursor.fetchone()
+        if row is None:
+            # 上界至少留出一个完整周期，准备和改表之间跨过周期边界时新日志也不会违反约束
+            interval = cls.get_interval()
+            cursor.execute(f"SELECT MAX({qn(column)}) FROM {qn(table)}")
+            max_time = cursor.fetchone()[0]
+            now = timezone.now()
+            upper = cls.next_period(cls.next_period(cls.period_start(max(now, max_time or now), interval), interval),
+                                    interval)
+            cursor.execute(
+                f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(check)} CHECK ({qn(column)} < %s) NOT VALID", [upper]
+            )
+        else:
+            upper = parse_datetime(CHECK_BOUND_PATTERN.search(row[0]).group(1))
+        # VALIDATE 只持有 SHARE UPDATE EXCLUSIVE 锁，校验期间日志照常写入
+        cursor.execute(f"ALTER TABLE {qn(table)} VALIDATE CONSTRAINT {qn(check)}")
+        return upper
+
+    @classmethod
+    def convert_to_partitioned(cls, schema_editor, table, column):
+        """
+        把普通日志表原地改为分区表（迁移中在事务内调用，应先执行 prepare_conversion）
+
+        原表改名为 <表名>_legacy 并整体挂为 (MINVALUE, 上界) 的分区，不复制数据；
+        其索引与外键保留，并在新的父表上按原名重建。准备好的唯一索引转为历史分区的主键，
+        上界取自已校验的 CHECK 约束，挂载时不建索引、不扫描数据，排他锁只持有很短时间。
+        """
+        if not cls.is_supported(schema_editor.connection):
+            return
+        qn = schema_editor.quote_name
+        legacy = f"{table}_legacy"
+        unique_index = cls.conversion_index_name(table)
+        check = cls.conversion_check_name(table)
+
+        with schema_editor.connection.cursor() as cursor:
+            if cls.is_partitioned(cursor, table):
+                return
+            cursor.execute(
+                "SELECT 1 FROM pg_constraint WHERE conrelid = to_regclass(%s) AND conname = %s", [table, check]
+            )
+            if cursor.fetchone() is None:
+                logger.warning(f"{table} 未预先建立分区转换所需的索引和约束，将在锁内建立并扫描全表")
+            upper = cls._prepare(cursor, table, column, concurrently=False)
+
+            cursor.execute(
+                "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'", [table]
+            )
+            pkey = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT indexname, indexdef FROM pg_indexes "
+                "WHERE schemaname = current_schema() AND tablename = %s AND indexname NOT IN (%s, %s)",
+                [table, pkey, unique_index]
+            )
+            indexes = cursor.fetchall()
+            cursor.execute(
+                "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE conrelid = to_regclass(%s) AND contype = 'f'", [table]
+            )
+            foreign_keys = cursor.fetchall()
+            cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {qn(table)}")
+            max_id = cursor.fetchone()[0]
+
+            # 原表及其索引改名，腾出名称给父表；准备好的 (id, 时间) 唯一索引转为主键（列已非空，不扫描）
+            cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}")
+            for name, _ in indexes:
+                cursor.execute(f"ALTER INDEX {qn(name)} RENAME TO {qn(name[:56] + '_legacy')}")
+            cursor.execute(f"ALTER TABLE {qn(legacy)} DROP CONSTRAINT {qn(pkey)}")
+            cursor.execute(
+                f"ALTER TABLE {qn(legacy)} ADD CONSTRAINT {qn(pkey[:56] + '_legacy')} "
+                f"PRIMARY KEY USING INDEX {qn(unique_index)}"
+            )
+            cursor.execute(f"ALTER TABLE {qn(legacy)} ALTER COLUMN id DROP IDENTITY IF EXISTS")
+            cursor.execute(f"ALTER TABLE {qn(legacy)} ALTER COLUMN id DROP DEFAULT")
+
+            # 父表：id 改由独立序列生成，主键包含分区键
+            sequence = f"{table}_id_seq"
+            cursor.execute(
+                f"CREATE TABLE {qn(table)} (LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                f"PARTITION BY RANGE ({qn(column)})"
+            )
+            cursor.execute(f"ALTER TABLE {qn(table)} DROP CONSTRAINT {qn(check)}")
+            cursor.execute(f"CREATE SEQUENCE {qn(sequence)} AS bigint START WITH {max_id + 1} "
+                           f"OWNED BY {qn(table)}.id")
+            cursor.execute(f"ALTER TABLE {qn(table)} ALTER COLUMN id SET DEFAULT nextval('{sequence}'::regclass)")
+            cursor.execute(f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(pkey)} PRIMARY KEY (id, {qn(column)})")
+            for _, definition in indexes:
+                cursor.execute(definition)
+            for name, definition in foreign_keys:
+                cursor.execute(f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}")
+
+            # 原表挂为历史分区：等价的主键、索引和外键直接复用，已校验的 CHECK 约束蕴含分区范围，不再扫描
+            now = timezone.now()
+            cursor.execute(
+                f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(legacy)} FOR VALUES FROM (MINVALUE) TO (%s)",
+                [upper]
+            )
+            cursor.execute(f"ALTER TABLE {qn(legacy)} DROP CONSTRAINT {qn(check)}")
+            cursor.execute(f"CREATE TABLE {qn(table + '_default')} PARTITION OF {qn(table)} DEFAULT")
+            cls.ensure_partitions(cursor, table, column, getattr(settings, 'LOG_PARTITION_PREMAKE', 3), now=now)
+
+    @staticmethod
+    def _create_partition(cursor, table, column, name, start, end, default):
+        qn = connection.ops.quote_name
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {qn(default)} WHERE {qn(column)} >= %s AND {qn(column)} < %s)",
+            [start, end]
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                f"CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)", [start, end]
+            )
+            return
+
+        # 兜底分区里已有该周期的数据：先建独立表并迁入这些行，再挂载
+        logger.warning(f"默认分区 {default} 中有属于 {name} 的日志，迁入新分区")
+        cursor.execute(f"CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {qn(default)} WHERE {qn(column)} >= %s AND {qn(column)} < %s "
+            f"RETURNING *) INSERT INTO {qn(name)} SELECT * FROM moved",
+            [start, end]
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)", [start, end]
+        )
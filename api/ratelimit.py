@@ -0,0 +1,151 @@
+"""
+API频率限制（令牌桶）
+
+每个API密钥（可选再按客户端IP细分）一个令牌桶：容量为每分钟限额，按限额/60秒匀速补充。
+Redis 中的令牌桶由 Lua 脚本原子完成"补充 + 扣减"，时间取 Redis 服务器时间，
+多个 worker 之间无需加锁也不受各自时钟偏差影响。
+
+Redis 不可用（或缓存后端不是 Redis）时退回进程内令牌桶，此时限额按 worker 分别计算。
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from .redis_client import get_redis_client, make_redis_key
+
+logger = logging.getLogger(__name__)
+
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'limit', 'remaining', 'retry_after', 'reset'])
+
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = math.ceil((cost - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate) + 1000)
+return {allowed, math.floor(tokens), retry_after, math.ceil((capacity - tokens) / rate)}
+"""
+
+
+class RateLimiter:
+    """令牌桶频率限制器"""
+
+    KEY_PREFIX = 'ratelimit:'
+    WINDOW_SECONDS = 60
+
+    _script = None
+    _script_client = None
+    _local_lock = threading.Lock()
+    # 进程内令牌桶: bucket_key -> [tokens, 时间戳(毫秒)]
+    _local_buckets = OrderedDict()
+
+    @staticmethod
+    def is_enabled():
+        return getattr(settings, 'API_RATE_LIMIT_ENABLED', True)
+
+    @classmethod
+    def check(cls, identity, limit, window_seconds=None, cost=1):
+        """
+        消耗令牌并返回判定结果
+
+        Args:
+            identity: 限流对象标识（如 API 密钥 id、客户端 IP）
+            limit: 每个窗口允许的请求数，<=0 表示不限制
+            window_seconds: 窗口长度（秒），默认60
+            cost: 本次请求消耗的令牌数
+
+        Returns:
+            RateLimitResult | None: 不限制时返回None
+        """
+        if not cls.is_enabled() or not limit or limit <= 0:
+            return None
+
+        window_ms = (window_seconds or cls.WINDOW_SECONDS) * 1000
+        capacity = limit
+        rate = limit / window_ms
+        bucket_key = f"{cls.KEY_PREFIX}{identity}"
+
+        client = get_redis_client()
+        if client is not None:
+            try:
+                allowed, remaining, retry_after, reset = cls._get_script(client)(
+                    keys=[make_redis_key(bucket_key)], args=[capacity, rate, cost]
+                )
+                return cls._result(allowed, limit, remaining, retry_after, reset)
+            except Exception as e:
+                logger.warning(f"Redis频率限制不可用，使用进程内限制: {e}")
+
+        return cls._check_local(bucket_key, limit, capacity, rate, cost)
+
+    @classmethod
+    def _get_script(cls, client):
+        if cls._script is None or cls._script_client is not client:
+            cls._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+            cls._script_client = client
+        return cls._script
+
+    @classmethod
+    def _check_local(cls, bucket_key, limit, capacity, rate, cost):
+        now = time.monotonic() * 1000
+        max_buckets = getattr(settings, 'API_RATE_LIMIT_LOCAL_MAX_BUCKETS', 10000)
+        with cls._local_lock:
+            bucket = cls._local_buckets.get(bucket_key)
+            if bucket is None:
+                bucket = [capacity, now]
+                cls._local_buckets[bucket_key] = bucket
+                while len(cls._local_buckets) > max_buckets:
+                    cls._local_buckets.popitem(last=False)
+            else:
+                cls._local_buckets.move_to_end(bucket_key)
+
+            tokens = min(capacity, bucket[0] + max(0.0, now - bucket[1]) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                allowed, retry_after = 1, 0
+            else:
+                allowed, retry_after = 0, math.ceil((cost - tokens) / rate)
+            bucket[0], bucket[1] = tokens, now
+
+        return cls._result(allowed, limit, math.floor(tokens), retry_after, math.ceil((capacity - tokens) / rate))
+
+    @staticmethod
+    def _result(allowed, limit, remaining, retry_after_ms, reset_ms):
+        return RateLimitResult(
+            allowed=bool(allowed),
+            limit=limit,
+            remaining=max(0, int(remaining)),
+            retry_after=max(1, math.ceil(int(retry_after_ms) / 1000)) if not allowed else 0,
+            reset=math.ceil(int(reset_ms) / 1000),
+        )
+
+    @staticmethod
+    def apply_headers(response, result):
+        """写入 X-RateLimit-* 与 Retry-After 响应头"""
+        if result is None or response is None:
+            return response
+        response['X-RateLimit-Limit'] = str(result.limit)
+        response['X-RateLimit-Remaining'] = str(result.remaining)
+        response['X-RateLimit-Reset'] = str(result.reset)
+        if not result.allowed:
+            response['Retry-After'] = str(result.retry_after)
+        return response
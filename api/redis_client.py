@@ -0,0 +1,29 @@
+"""
+底层 Redis 客户端
+
+计数器、令牌桶等需要 HINCRBY / Lua 脚本的场景直接使用 django-redis 的底层连接，
+键名沿用缓存配置的 KEY_PREFIX，避免与其他应用冲突。
+"""
+import logging
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+def get_redis_client(alias='default'):
+    """
+    获取缓存别名对应的底层 Redis 客户端
+
+    Returns:
+        redis.Redis | None: 缓存后端不是 django-redis 时返回None
+    """
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection(alias)
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def make_redis_key(name, alias='default'):
+    """按缓存配置的前缀和版本生成完整键名"""
+    return caches[alias].make_key(name)
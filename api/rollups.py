@@ -0,0 +1,386 @@
+"""
+API调用日志与验证日志的增量汇总
+
+后台任务按日志 id 的高水位增量地把新日志累加到汇总表：
+- ApiCallHourlyRollup / ApiCallDailyRollup：按 (时间段, API密钥, 接口端点) 汇总调用次数、成功次数、
+  响应时间合计/最大值和响应时间直方图（api/histogram.py）；
+- VerificationHourlyRollup：按小时汇总验证次数和成功次数。
+
+统计接口和控制面板图表读取"汇总表 + 高水位之后尚未汇总的少量日志"，结果实时准确，
+耗时与日志总量无关。
+
+高水位推进方式：每次运行先记录当前最大 id 作为待汇总上界，至少 ROLLUP_SETTLE_SECONDS 秒后
+才汇总到该上界，避免并发事务中 id 较小、尚未提交的日志被跳过。每个批次的汇总结果和高水位
+在同一事务中提交，检查点行加锁，多个进程同时运行也不会重复累加。
+"""
+import logging
+import uuid
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+from cards.models import VerificationLog, VerificationHourlyRollup
+from .background import PeriodicFlusher
+from .histogram import BUCKET_COUNT, bucket_indexes, to_array
+from .models import ApiKey, ApiCallLog, ApiCallHourlyRollup, ApiCallDailyRollup, RollupCheckpoint
+
+logger = logging.getLogger(__name__)
+
+API_CALL_FIELDS = ['id', 'api_key_id', 'endpoint', 'call_time', 'success', 'response_time']
+VERIFICATION_FIELDS = ['id', 'verification_time', 'success']
+STAT_FIELDS = ['call_count', 'success_count', 'latency_sum', 'latency_max']
+
+
+class RollupService:
+    """日志汇总服务"""
+
+    API_CALL_SOURCE = 'api_call_log'
+    VERIFICATION_SOURCE = 'verification_log'
+    TASK_NAME = 'log_rollups'
+    LOCK_KEY = 'log_rollups:lock'
+    LOCK_TIMEOUT = 300
+    # 后台线程每次最多处理的批次数，历史数据回填交给 manage.py update_rollups
+    AUTO_MAX_CHUNKS = 10
+
+    PERIOD_MODELS = {'hour': ApiCallHourlyRollup, 'day': ApiCallDailyRollup}
+
+    @classmethod
+    def ensure_scheduled(cls):
+        """在当前进程的后台线程中定期汇总（ROLLUP_AUTO_UPDATE=False 时由独立进程执行 update_rollups）"""
+        if getattr(settings, 'ROLLUP_AUTO_UPDATE', True):
+            PeriodicFlusher.register(
+                cls.TASK_NAME, cls._auto_update, getattr(settings, 'ROLLUP_UPDATE_INTERVAL', 60)
+            )
+
+    @classmethod
+    def update(cls, max_chunks=None, chunk_size=None, settle=None):
+        """
+        把新日志累加到汇总表
+
+        Args:
+            max_chunks: 每个数据源最多处理的批次数，None 表示处理到最新
+            chunk_size: 每批日志条数
+            settle: 待汇总上界记录后至少等待的秒数，默认 ROLLUP_SETTLE_SECONDS
+
+        Returns:
+            dict: 数据源 -> 本次汇总的日志条数
+        """
+        chunk_size = chunk_size or getattr(settings, 'ROLLUP_CHUNK_SIZE', 50000)
+        if settle is None:
+            settle = getattr(settings, 'ROLLUP_SETTLE_SECONDS', 5)
+        settle = timedelta(seconds=settle)
+        return {
+            cls.API_CALL_SOURCE: cls._update_source(
+                cls.API_CALL_SOURCE, ApiCallLog, API_CALL_FIELDS, cls._apply_api_calls,
+                chunk_size, max_chunks, settle
+            ),
+            cls.VERIFICATION_SOURCE: cls._update_source(
+                cls.VERIFICATION_SOURCE, VerificationLog, VERIFICATION_FIELDS, cls._apply_verifications,
+                chunk_size, max_chunks, settle
+            ),
+        }
+
+    @classmethod
+    def _auto_update(cls):
+        # 多个 worker 同时到期时只有一个执行，其余直接跳过
+        token = uuid.uuid4().hex
+        if not cache.add(cls.LOCK_KEY, token, cls.LOCK_TIMEOUT):
+            return
+        try:
+            cls.update(max_chunks=cls.AUTO_MAX_CHUNKS)
+        finally:
+            if cache.get(cls.LOCK_KEY) == token:
+                cache.delete(cls.LOCK_KEY)
+
+    @classmethod
+    def _update_source(cls, name, model, fields, apply, chunk_size, max_chunks, settle):
+        RollupCheckpoint.objects.get_or_create(name=name)
+        processed = 0
+        chunks = 0
+        while max_chunks is None or chunks < max_chunks:
+            with transaction.atomic():
+                checkpoint = RollupCheckpoint.objects.select_for_update().get(name=name)
+                now = timezone.now()
+                if checkpoint.pending_id is None or now - checkpoint.pending_at < settle:
+                    if checkpoint.pending_id is None:
+                        checkpoint.pending_id = model.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+                        checkpoint.pending_at = now
+                        checkpoint.save()
+                    break
+
+                rows = list(model.objects.filter(
+                    pk__gt=checkpoint.last_id, pk__lte=checkpoint.pending_id
+                ).order_by('pk').values_list(*fields)[:chunk_size])
+                if rows:
+                    apply(rows)
+                    checkpoint.last_id = rows[-1][0]
+                    processed += len(rows)
+                    chunks += 1
+                caught_up = len(rows) < chunk_size
+                if caught_up:
+                    # 已汇总到上界，记录新的上界，下次运行时再汇总
+                    checkpoint.last_id = max(checkpoint.last_id, checkpoint.pending_id)
+                    checkpoint.pending_id = model.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+                    checkpoint.pending_at = now
+                checkpoint.save()
+            if caught_up:
+                break
+        return processed
+
+    @classmethod
+    def _apply_api_calls(cls, rows):
+        frame = cls._api_call_frame(rows)
+        valid_ids = set(ApiKey.objects.filter(
+            pk__in=frame['api_key_id'].unique().tolist()
+        ).values_list('pk', flat=True))
+        # 已删除的API密钥不再汇总
+        frame = frame[frame['api_key_id'].isin(valid_ids)]
+        for period, model in cls.PERIOD_MODELS.items():
+            cls._merge_api_calls(model, cls._aggregate(frame, [period, 'api_key_id', 'endpoint'], histogram=True))
+
+    @staticmethod
+    def _merge_api_calls(model, groups):
+        if not groups:
+            return
+        existing = {
+            (obj.bucket_start, obj.api_key_id, obj.endpoint): obj
+            for obj in model.objects.filter(
+                bucket_start__in={key[0] for key in groups},
+                api_key_id__in={key[1] for key in groups},
+                endpoint__in={key[2] for key in groups},
+            )
+        }
+        to_create, to_update = [], []
+        for (bucket_start, api_key_id, endpoint), stats in groups.items():
+            obj = existing.get((bucket_start, api_key_id, endpoint))
+            if obj is None:
+                to_create.append(model(
+                    bucket_start=bucket_start, api_key_id=api_key_id, endpoint=endpoint,
+                    call_count=stats['call_count'], success_count=stats['success_count'],
+                    latency_sum=stats['latency_sum'], latency_max=stats['latency_max'],
+                    latency_histogram=stats['histogram'].tolist(),
+                ))
+            else:
+                obj.call_count += stats['call_count']
+                obj.success_count += stats['success_count']
+                obj.latency_sum += stats['latency_sum']
+                obj.latency_max = max(obj.latency_max, stats['latency_max'])
+                obj.latency_histogram = (to_array(obj.latency_histogram) + stats['histogram']).tolist()
+                to_update.append(obj)
+        model.objects.bulk_create(to_create, batch_size=1000)
+        model.objects.bulk_update(to_update, STAT_FIELDS + ['latency_histogram'], batch_size=1000)
+
+    @classmethod
+    def _apply_verifications(cls, rows):
+        frame = pd.DataFrame(rows, columns=VERIFICATION_FIELDS)
+        frame['hour'] = pd.to_datetime(frame['verification_time'], utc=True).dt.floor('h')
+        grouped = frame.groupby('hour')['success'].agg(['size', 'sum'])
+        groups = {
+            hour.to_pydatetime(): (int(total), int(success))
+            for hour, (total, success) in zip(grouped.index, grouped.to_numpy())
+        }
+        existing = {
+            obj.bucket_start: obj
+            for obj in VerificationHourlyRollup.objects.filter(bucket_start__in=list(groups))
+        }
+        to_create, to_update = [], []
+        for bucket_start, (total, success) in groups.items():
+            obj = existing.get(bucket_start)
+            if obj is None:
+                to_create.append(VerificationHourlyRollup(
+                    bucket_start=bucket_start, total_count=total, success_count=success
+                ))
+            else:
+                obj.total_count += total
+                obj.success_count += success
+                to_update.append(obj)
+        VerificationHourlyRollup.objects.bulk_create(to_create)
+        VerificationHourlyRollup.objects.bulk_update(to_update, ['total_count', 'success_count'])
+
+    @staticmethod
+    def _api_call_frame(rows):
+        """日志行转为 DataFrame，并计算小时、本地自然日和直方图桶序号"""
+        frame = pd.DataFrame(rows, columns=API_CALL_FIELDS)
+        times = pd.to_datetime(frame['call_time'], utc=True)
+        frame['hour'] = times.dt.floor('h')
+        frame['day'] = times.dt.tz_convert(timezone.get_current_timezone_name()).dt.floor(
+            'D', ambiguous=False, nonexistent='shift_forward'
+        )
+        frame['bucket'] = bucket_indexes(frame['response_time'].to_numpy())
+        frame['success'] = frame['success'].astype(bool)
+        return frame
+
+    @staticmethod
+    def _aggregate(frame, group_by, histogram=False):
+        """
+        按 group_by 分组汇总
+
+        Returns:
+            dict: 分组键元组 -> {'call_count', 'success_count', 'latency_sum', 'latency_max'[, 'histogram']}
+        """
+        if frame.empty:
+            return {}
+        grouped = frame.groupby(group_by, sort=True)
+        stats = grouped.agg(
+            call_count=('id', 'size'),
+            success_count=('success', 'sum'),
+            latency_sum=('response_time', 'sum'),
+            latency_max=('response_time', 'max'),
+        )
+        if histogram:
+            histograms = np.zeros((len(stats), BUCKET_COUNT), dtype=np.int64)
+            np.add.at(histograms, (grouped.ngroup().to_numpy(), frame['bucket'].to_numpy()), 1)
+
+        result = {}
+        for index, key in enumerate(stats.index):
+            key = key if isinstance(key, tuple) else (key,)
+            key = tuple(
+                part.to_pydatetime() if isinstance(part, pd.Timestamp) else part.item() if isinstance(part, np.generic)
+                else part for part in key
+            )
+            row = stats.iloc[index]
+            result[key] = {
+                'call_count': int(row['call_count']),
+                'success_count': int(row['success_count']),
+                'latency_sum': float(row['latency_sum']),
+                'latency_max': float(row['latency_max']),
+            }
+            if histogram:
+                result[key]['histogram'] = histograms[index]
+        return result
+
+    # ---- 读取 ----
+
+    @classmethod
+    def api_call_tail(cls, api_key_id=None):
+        """尚未汇总的API调用日志（DataFrame）"""
+        last_id = RollupCheckpoint.objects.filter(
+            name=cls.API_CALL_SOURCE
+        ).values_list('last_id', flat=True).first() or 0
+        queryset = ApiCallLog.objects.filter(pk__gt=last_id)
+        if api_key_id:
+            queryset = queryset.filter(api_key_id=api_key_id)
+        limit = getattr(settings, 'ROLLUP_MAX_TAIL_ROWS', 200000)
+        rows = list(queryset.order_by().values_list(*API_CALL_FIELDS)[:limit])
+        if len(rows) >= limit:
+            logger.warning(f"尚未汇总的API调用日志超过 {limit} 条，统计结果不完整，请检查 update_rollups 是否在运行")
+        return cls._api_call_frame(rows)
+
+    @classmethod
+    def api_call_stats(cls, period, group_by=(), start=None, api_key_id=None, tail=None, histogram=False):
+        """
+        从汇总表（加上尚未汇总的日志）统计API调用
+
+        Args:
+            period: 'hour' 或 'day'，决定使用的汇总表和 bucket_start 的含义
+            group_by: 分组字段，可选 'bucket_start'、'api_key_id'、'endpoint'
+            start: 只统计 bucket_start >= start 的时间段（应与 period 的边界对齐）
+            api_key_id: 只统计指定API密钥
+            tail: api_call_tail() 的结果，同一请求内多次统计时复用
+            histogram: 是否同时合并各组的响应时间直方图（用于计算分位数）
+
+        Returns:
+            dict: 分组键元组 -> {'call_count', 'success_count', 'latency_sum', 'latency_max'[, 'histogram']}
+        """
+        group_by = list(group_by)
+        queryset = cls.PERIOD_MODELS[period].objects.all()
+        if start is not None:
+            queryset = queryset.filter(bucket_start__gte=start)
+        if api_key_id:
+            queryset = queryset.filter(api_key_id=api_key_id)
+        aggregates = {
+            'call_count': Sum('call_count'),
+            'success_count': Sum('success_count'),
+            'latency_sum': Sum('latency_sum'),
+            'latency_max': Max('latency_max'),
+        }
+        if group_by:
+            db_rows = queryset.values(*group_by).annotate(**aggregates).order_by()
+        else:
+            db_rows = [queryset.aggregate(**aggregates)]
+
+        result = {}
+        for row in db_rows:
+            if not row['call_count']:
+                continue
+            result[tuple(row[field] for field in group_by)] = {field: row[field] for field in STAT_FIELDS}
+
+        if histogram:
+            for stats in result.values():
+                stats['histogram'] = np.zeros(BUCKET_COUNT, dtype=np.int64)
+            for row in queryset.order_by().values_list(*group_by, 'latency_histogram').iterator(chunk_size=2000):
+                stats = result.get(tuple(row[:-1]))
+                if stats is not None:
+                    stats['histogram'] += to_array(row[-1])
+
+        if tail is None:
+            tail = cls.api_call_tail(api_key_id)
+        if not tail.empty:
+            if start is not None:
+                tail = tail[tail[period] >= pd.Timestamp(start)]
+            if api_key_id:
+                tail = tail[tail['api_key_id'] == api_key_id]
+            columns = [period if field == 'bucket_start' else field for field in group_by]
+            if columns:
+                tail_groups = cls._aggregate(tail, columns, histogram=histogram)
+            else:
+                tail_groups = cls._aggregate(tail.assign(_all=0), ['_all'], histogram=histogram)
+                tail_groups = {(): stats for stats in tail_groups.values()}
+            for key, stats in tail_groups.items():
+                cls._add_stats(result, key, stats)
+        return result
+
+    @classmethod
+    def verification_daily_counts(cls, start):
+        """
+        按本地自然日统计验证次数（汇总表加上尚未汇总的日志）
+
+        Returns:
+            dict: date -> (验证次数, 成功次数)
+        """
+        result = {}
+
+        def add(bucket_start, total, success):
+            day = timezone.localtime(bucket_start).date()
+            current = result.get(day, (0, 0))
+            result[day] = (current[0] + total, current[1] + success)
+
+        for bucket_start, total, success in VerificationHourlyRollup.objects.filter(
+            bucket_start__gte=start
+        ).values_list('bucket_start', 'total_count', 'success_count'):
+            add(bucket_start, total, success)
+
+        for verification_time, success in cls.verification_tail(start):
+            add(verification_time, 1, int(success))
+        return result
+
+    @classmethod
+    def verification_tail(cls, start, end=None):
+        """尚未汇总的验证日志 [(验证时间, 是否成功), ...]"""
+        last_id = RollupCheckpoint.objects.filter(
+            name=cls.VERIFICATION_SOURCE
+        ).values_list('last_id', flat=True).first() or 0
+        queryset = VerificationLog.objects.filter(pk__gt=last_id, verification_time__gte=start)
+        if end is not None:
+            queryset = queryset.filter(verification_time__lt=end)
+        limit = getattr(settings, 'ROLLUP_MAX_TAIL_ROWS', 200000)
+        return list(queryset.order_by().values_list('verification_time', 'success')[:limit])
+
+    @staticmethod
+    def _add_stats(result, key, stats):
+        current = result.get(key)
+        if current is None:
+            result[key] = {field: stats[field] for field in STAT_FIELDS}
+            if 'histogram' in stats:
+                result[key]['histogram'] = stats['histogram'].copy()
+            return
+        current['call_count'] += stats['call_count']
+        current['success_count'] += stats['success_count']
+        current['latency_sum'] += stats['latency_sum']
+        current['latency_max'] = max(current['latency_max'], stats['latency_max'])
+        if 'histogram' in stats:
+            current['histogram'] = current['histogram'] + stats['histogram']
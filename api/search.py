@@ -0,0 +1,43 @@
+"""
+API调用记录搜索（列表页和后台导出共用，搜索方式见 cards/search.py）
+"""
+from django.db.models import Q
+from cards.search import min_substring_length, normalize_term, parse_ip
+from .models import ApiCallDailyRollup, ApiKey
+
+
+def search_api_call_logs(queryset, term):
+    """
+    按API密钥名称/密钥、接口端点、IP搜索API调用记录（搜索方式见 cards/search.py）
+
+    API密钥和接口端点先在小表（API密钥表、每日汇总表）中匹配出取值，再按 (字段, 时间) 索引过滤日志。
+    """
+    term = normalize_term(term)
+    if not term:
+        return queryset
+
+    q = Q(endpoint=term)
+    api_key_ids = list(ApiKey.objects.filter(Q(name__icontains=term) | Q(key=term)).values_list('pk', flat=True))
+    if api_key_ids:
+        q |= Q(api_key_id__in=api_key_ids)
+    if len(term) >= min_substring_length():
+        endpoints = list(
+            ApiCallDailyRollup.objects.filter(endpoint__icontains=term).values_list('endpoint', flat=True).distinct()
+        )
+        if endpoints:
+            q |= Q(endpoint__in=endpoints)
+    ip = parse_ip(term)
+    if ip is not None:
+        q |= Q(ip_address=ip)
+    return queryset.filter(q)
+
+
+def filter_api_call_logs(queryset, params):
+    """按API调用记录列表页的搜索和筛选参数过滤"""
+    search = params.get('search')
+    if search:
+        queryset = search_api_call_logs(queryset, search)
+    success = params.get('success')
+    if success:
+        queryset = queryset.filter(success=success == 'true')
+    return queryset
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.utils import timezone
 from cards.models import Card, DeviceBinding, VerificationLog
 from .models import ApiKey, ApiCallLog
@@ -73,6 +74,35 @@ class CardQueryRequestSerializer(serializers.Serializer):
         return value.strip()
 
 
+class CardBatchVerifyRequestSerializer(serializers.Serializer):
+    """卡密批量验证请求序列化器"""
+    
+    api_key = serializers.CharField(
+        max_length=64,
+        required=True,
+        help_text="API密钥"
+    )
+    
+    items = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+        help_text="待验证条目列表，每项包含 card_key 和可选的 device_id"
+    )
+    
+    def validate_api_key(self, value):
+        """验证API密钥格式"""
+        if not value or len(value.strip()) == 0:
+            raise serializers.ValidationError("API密钥不能为空")
+        return value.strip()
+    
+    def validate_items(self, value):
+        """验证条目数量"""
+        max_items = getattr(settings, 'API_BATCH_VERIFY_MAX_ITEMS', 500)
+        if len(value) > max_items:
+            raise serializers.ValidationError(f"单次最多验证{max_items}个卡密")
+        return value
+
+
 class CardInfoSerializer(serializers.ModelSerializer):
     """卡密信息序列化器"""
     
@@ -143,6 +173,15 @@ class CardQueryResponseSerializer(serializers.Serializer):
     data = serializers.DictField(required=False, help_text="卡密详细信息")
 
 
+class CardBatchVerifyResponseSerializer(serializers.Serializer):
+    """卡密批量验证响应序列化器"""
+    
+    code = serializers.IntegerField(help_text="错误码")
+    success = serializers.BooleanField(help_text="是否成功")
+    message = serializers.CharField(help_text="响应消息")
+    data = serializers.DictField(required=False, help_text="按输入顺序排列的逐项验证结果")
+
+
 class ApiKeySerializer(serializers.ModelSerializer):
     """API密钥序列化器"""
     
@@ -1,12 +1,22 @@
 import hashlib
 import logging
+from asgiref.sync import sync_to_async
 from datetime import datetime, timedelta
+from django.conf import settings
 from django.utils import timezone
-from django.db import transaction
-from django.db.models import Q, Count, Avg, Sum
+from django.db import connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 from django.core.cache import cache
+from cards.cache import CardStateCache
+from cards.keyfilter import CardKeyFilter
 from cards.models import Card, DeviceBinding, VerificationLog
-from .models import ApiKey, ApiCallLog
+from .models import ApiKey
+from .latency import LatencyRecorder, summarize
+from .logbuffer import LogWriter
+from .rollups import RollupService
+from .timing import STAGES, StageLatencyRecorder, stage
+from .usage import ApiKeyUsageBuffer
 from .error_codes import ApiResponse, ApiErrorCode
 
 logger = logging.getLogger(__name__)
@@ -30,76 +40,468 @@ class CardVerificationService:
             tuple: (success, response_data, card_obj)
         """
         try:
-            with transaction.atomic():
-                # 查找卡密
-                card_key_hash = hashlib.sha1(card_key.encode()).hexdigest()
-                try:
-                    card = Card.objects.select_for_update().get(card_key_hash=card_key_hash)
-                except Card.DoesNotExist:
-                    return False, ApiResponse.card_not_found(), None
-                
-                # 检查卡密状态
-                if card.status == 'inactive':
-                    return False, ApiResponse.card_disabled(), card
-                elif card.status == 'expired':
-                    return False, ApiResponse.card_expired(), card
-                elif card.status == 'used_up':
-                    return False, ApiResponse.card_used_up(), card
-                
-                # 检查是否过期
-                if card.is_expired:
-                    card.status = 'expired'
-                    card.save()
-                    return False, ApiResponse.card_expired(), card
-                
-                # 处理设备绑定
-                device_binding = None
-                if device_id:
+            card_key_hash = hashlib.sha1(card_key.encode()).hexdigest()
+
+            # 先查热状态缓存，时间卡可直接在缓存上完成验证
+            with stage('card_lookup'):
+                state = CardStateCache.get(card_key_hash)
+            if state is not None:
+                cached_result = CardVerificationService._verify_from_state(
+                    state, api_key_obj, device_id, request
+                )
+                if cached_result is not None:
+                    return cached_result
+
+            # 过滤器确定不存在的卡密直接返回，不访问数据库
+            if state is None and not CardKeyFilter.might_contain(card_key_hash):
+                return False, ApiResponse.card_not_found(), None
+
+            # 查找卡密（不加行锁，所有写入都使用带条件的单条UPDATE）
+            try:
+                with stage('card_lookup'):
+                    card = Card.objects.get(card_key_hash=card_key_hash)
+            except Card.DoesNotExist:
+                CardKeyFilter.record_false_positive()
+                return False, ApiResponse.card_not_found(), None
+
+            known_devices = set(state['devices']) if state is not None else None
+
+            # 检查卡密状态
+            if card.status != 'active':
+                CardStateCache.store(card, known_devices)
+            if card.status == 'inactive':
+                return False, ApiResponse.card_disabled(), card
+            elif card.status == 'expired':
+                return False, ApiResponse.card_expired(), card
+            elif card.status == 'used_up':
+                return False, ApiResponse.card_used_up(), card
+
+            # 检查时间卡是否过期
+            if card.card_type == 'time' and card.is_expired:
+                Card.objects.filter(pk=card.pk, status='active').update(status='expired')
+                card.status = 'expired'
+                CardStateCache.store(card, known_devices)
+                return False, ApiResponse.card_expired(), card
+
+            # 处理设备绑定
+            device_binding = None
+            if device_id:
+                with stage('device_binding'):
                     device_binding_result = CardVerificationService._handle_device_binding(
                         card, device_id, request
                     )
-                    if not device_binding_result['success']:
-                        return False, device_binding_result['response'], card
-                    device_binding = device_binding_result['device_binding']
-                
-                # 更新卡密使用信息
-                if not card.first_used_at:
-                    card.first_used_at = timezone.now()
-                card.last_used_at = timezone.now()
-                
-                # 次数卡处理
+                if not device_binding_result['success']:
+                    return False, device_binding_result['response'], card
+                device_binding = device_binding_result['device_binding']
+                if known_devices is not None:
+                    known_devices.add(device_id)
+
+            # 更新卡密使用信息
+            now = timezone.now()
+            with stage('card_save'):
                 if card.card_type == 'count':
-                    if card.used_count >= card.total_count:
-                        card.status = 'used_up'
-                        card.save()
+                    # 次数卡：检查与扣减在同一条语句中完成
+                    if not CardVerificationService._consume_count(card, now):
+                        card.refresh_from_db(fields=['status', 'used_count', 'total_count'])
+                        if card.status == 'active':
+                            Card.objects.filter(pk=card.pk, status='active').update(status='used_up')
+                            card.status = 'used_up'
+                        CardStateCache.store(card, known_devices)
+                        if card.status == 'inactive':
+                            return False, ApiResponse.card_disabled(), card
+                        if card.status == 'expired':
+                            return False, ApiResponse.card_expired(), card
                         return False, ApiResponse.card_used_up(), card
-                    
-                    card.used_count += 1
-                
-                card.save()
-                
-                # 更新API密钥使用统计
-                api_key_obj.usage_count += 1
-                api_key_obj.last_used_at = timezone.now()
-                api_key_obj.save()
-                
-                # 构建成功响应数据
-                data = {
-                    'card_type': card.card_type,
-                    'expire_date': card.expire_date.isoformat() if card.expire_date else None,
-                    'remaining_count': card.remaining_count if card.card_type == 'count' else None,
-                    'device_binding': {
-                        'device_id': device_binding.device_id if device_binding else None,
-                        'is_new_device': device_binding_result.get('is_new_device', False) if device_id else False
-                    } if device_id else None
-                }
-                
-                return True, ApiResponse.success(data, '验证成功'), card
-                
+                else:
+                    # 带状态条件：读取之后卡密可能已被禁用，此时重新读取，不把读取时的旧状态写入缓存
+                    touched = Card.objects.filter(pk=card.pk, status='active').update(
+                        last_used_at=now,
+                        first_used_at=Coalesce(F('first_used_at'), Value(now))
+                    )
+                    if not touched:
+                        try:
+                            card.refresh_from_db()
+                        except Card.DoesNotExist:
+                            CardStateCache.invalidate(card_key_hash)
+                            return False, ApiResponse.card_not_found(), None
+                        CardStateCache.store(card, known_devices)
+                        if card.status == 'inactive':
+                            return False, ApiResponse.card_disabled(), card
+                        if card.status == 'used_up':
+                            return False, ApiResponse.card_used_up(), card
+                        return False, ApiResponse.card_expired(), card
+                    card.first_used_at = card.first_used_at or now
+                    card.last_used_at = now
+
+                CardStateCache.store(card, known_devices)
+
+            # 更新API密钥使用统计
+            with stage('api_key_save'):
+                CardVerificationService._record_api_key_usage(api_key_obj)
+
+            # 构建成功响应数据
+            data = {
+                'card_type': card.card_type,
+                'expire_date': card.expire_date.isoformat() if card.expire_date else None,
+                'remaining_count': card.remaining_count if card.card_type == 'count' else None,
+                'device_binding': {
+                    'device_id': device_binding.device_id if device_binding else None,
+                    'is_new_device': device_binding_result.get('is_new_device', False) if device_id else False
+                } if device_id else None
+            }
+
+            return True, ApiResponse.success(data, '验证成功'), card
+
         except Exception as e:
             logger.error(f"卡密验证失败: {e}", exc_info=True)
             return False, ApiResponse.system_error(f"验证过程中发生错误"), None
     
+    @staticmethod
+    def verify_cards_batch(api_key_obj, items, request=None):
+        """
+        批量验证卡密
+
+        一次IN查询锁定本批次涉及的卡密，在内存中按输入顺序逐项判定，
+        再用批量语句写回卡密、设备绑定、API密钥统计和验证日志。
+        同一卡密在批次中出现多次时按顺序依次生效（例如次数卡逐次扣减）。
+
+        Args:
+            api_key_obj: API密钥对象
+            items: [{'card_key': ..., 'device_id': ...}, ...]
+            request: 请求对象
+
+        Returns:
+            list: 与输入顺序一致的 (success, response_data, card_obj) 列表
+        """
+        try:
+            now = timezone.now()
+            ip_address = CardVerificationService._get_client_ip(request) if request else '127.0.0.1'
+            user_agent = request.META.get('HTTP_USER_AGENT', '')[:255] if request else ''
+
+            parsed = []
+            for item in items:
+                card_key = str(item.get('card_key') or '').strip()
+                device_id = str(item.get('device_id') or '').strip() or None
+                card_key_hash = hashlib.sha1(card_key.encode()).hexdigest() if card_key else None
+                parsed.append((card_key, card_key_hash, device_id))
+
+            results = []
+            with transaction.atomic():
+                # 过滤器确定不存在的卡密不参与加锁查询
+                hashes = {h for _, h, _ in parsed if h and CardKeyFilter.might_contain(h)}
+                cards = {
+                    card.card_key_hash: card
+                    for card in Card.objects.select_for_update().filter(
+                        card_key_hash__in=hashes
+                    ).order_by('pk')
+                }
+
+                # 本批次涉及卡密的全部设备绑定: card_id -> {device_id: binding}
+                bindings = {}
+                for binding in DeviceBinding.objects.filter(card_id__in=[c.pk for c in cards.values()]):
+                    bindings.setdefault(binding.card_id, {})[binding.device_id] = binding
+
+                changed_cards = {}
+                touched_binding_ids = set()
+                new_bindings = []
+                usage_count = 0
+
+                for card_key, card_key_hash, device_id in parsed:
+                    if not card_key:
+                        results.append((False, ApiResponse.missing_parameters(['card_key']), None))
+                        continue
+
+                    card = cards.get(card_key_hash)
+                    if card is None:
+                        if card_key_hash in hashes:
+                            CardKeyFilter.record_false_positive()
+                        results.append((False, ApiResponse.card_not_found(), None))
+                        continue
+
+                    if card.status == 'inactive':
+                        results.append((False, ApiResponse.card_disabled(), card))
+                        continue
+                    elif card.status == 'expired':
+                        results.append((False, ApiResponse.card_expired(), card))
+                        continue
+                    elif card.status == 'used_up':
+                        results.append((False, ApiResponse.card_used_up(), card))
+                        continue
+
+                    if card.card_type == 'time' and card.is_expired:
+                        card.status = 'expired'
+                        changed_cards[card.pk] = card
+                        results.append((False, ApiResponse.card_expired(), card))
+                        continue
+
+                    # 设备绑定（与单条验证规则一致：已绑定设备只刷新活跃时间，新设备受数量限制）
+                    is_new_device = False
+                    if device_id:
+                        card_bindings = bindings.setdefault(card.pk, {})
+                        active_count = sum(1 for b in card_bindings.values() if b.is_active)
+                        binding = card_bindings.get(device_id)
+                        if binding is None:
+                            if active_count + 1 > card.max_devices:
+                                results.append((False, ApiResponse.device_limit_exceeded(), card))
+                                continue
+                            binding = DeviceBinding(
+                                card=card, device_id=device_id,
+                                ip_address=ip_address, device_name=user_agent,
+                                first_bind_time=now, last_active_time=now
+                            )
+                            card_bindings[device_id] = binding
+                            new_bindings.append(binding)
+                            is_new_device = True
+                        else:
+                            if active_count > card.max_devices:
+                                results.append((False, ApiResponse.device_limit_exceeded(), card))
+                                continue
+                            if binding.pk:
+                                touched_binding_ids.add(binding.pk)
+
+                    if card.card_type == 'count':
+                        if card.total_count is None or card.used_count >= card.total_count:
+                            card.status = 'used_up'
+                            changed_cards[card.pk] = card
+                            results.append((False, ApiResponse.card_used_up(), card))
+                            continue
+                        card.used_count += 1
+                        if card.used_count >= card.total_count:
+                            card.status = 'used_up'
+
+                    if not card.first_used_at:
+                        card.first_used_at = now
+                    card.last_used_at = now
+                    changed_cards[card.pk] = card
+                    usage_count += 1
+
+                    data = {
+                        'card_type': card.card_type,
+                        'expire_date': card.expire_date.isoformat() if card.expire_date else None,
+                        'remaining_count': card.remaining_count if card.card_type == 'count' else None,
+                        'device_binding': {
+                            'device_id': device_id,
+                            'is_new_device': is_new_device
+                        } if device_id else None
+                    }
+                    results.append((True, ApiResponse.success(data, '验证成功'), card))
+
+                # 集合化写回
+                if changed_cards:
+                    Card.objects.bulk_update(
+                        list(changed_cards.values()),
+                        ['status', 'used_count', 'first_used_at', 'last_used_at']
+                    )
+                if new_bindings:
+                    DeviceBinding.objects.bulk_create(new_bindings, ignore_conflicts=True)
+                if touched_binding_ids:
+                    DeviceBinding.objects.filter(pk__in=touched_binding_ids).update(
+                        last_active_time=now, ip_address=ip_address
+                    )
+                if usage_count:
+                    transaction.on_commit(
+                        lambda: ApiKeyUsageBuffer.record(api_key_obj.pk, usage_count, now)
+                    )
+
+                CardStateCache.store_many([
+                    (card, [d for d, b in bindings.get(card.pk, {}).items() if b.is_active])
+                    for card in cards.values()
+                ])
+
+            return results
+
+        except Exception as e:
+            logger.error(f"批量卡密验证失败: {e}", exc_info=True)
+            return [(False, ApiResponse.system_error("验证过程中发生错误"), None) for _ in items]
+
+    @staticmethod
+    def _evaluate_state(state, device_id, now):
+        """
+        基于缓存状态判定验证结果（不访问数据库）
+
+        只处理无需加锁即可判定的情况：非启用状态直接返回错误；
+        已首次使用、未过期、设备已绑定的时间卡直接验证成功。
+
+        Returns:
+            tuple | None: ((success, response_data, card_obj), needs_touch)，
+            无法判定时返回None，交由数据库路径处理
+        """
+        status = state['status']
+        if status == 'inactive':
+            return (False, ApiResponse.card_disabled(), CardStateCache.to_card(state)), False
+        elif status == 'expired':
+            return (False, ApiResponse.card_expired(), CardStateCache.to_card(state)), False
+        elif status == 'used_up':
+            return (False, ApiResponse.card_used_up(), CardStateCache.to_card(state)), False
+
+        if state['card_type'] != 'time' or not state['first_used_at']:
+            return None
+
+        if state['expire_date'] and now > state['expire_date']:
+            return None
+
+        devices = state['devices']
+        if device_id and (device_id not in devices or len(devices) > state['max_devices']):
+            return None
+
+        # 按间隔节流更新最后使用时间，避免每次验证都写库
+        touch_interval = getattr(settings, 'CARD_STATE_TOUCH_INTERVAL', 60)
+        last_used_at = state['last_used_at']
+        needs_touch = not last_used_at or (now - last_used_at).total_seconds() >= touch_interval
+
+        data = {
+            'card_type': state['card_type'],
+            'expire_date': state['expire_date'].isoformat() if state['expire_date'] else None,
+            'remaining_count': None,
+            'device_binding': {
+                'device_id': device_id,
+                'is_new_device': False
+            } if device_id else None
+        }
+        return (True, ApiResponse.success(data, '验证成功'), CardStateCache.to_card(state)), needs_touch
+
+    @staticmethod
+    def _verify_from_state(state, api_key_obj, device_id, request):
+        """基于缓存状态验证卡密，无法判定时返回None"""
+        now = timezone.now()
+        verdict = CardVerificationService._evaluate_state(state, device_id, now)
+        if verdict is None:
+            return None
+        result, needs_touch = verdict
+
+        if needs_touch:
+            with stage('card_save'):
+                touched = Card.objects.filter(pk=state['id'], status='active').update(last_used_at=now)
+                if touched and device_id:
+                    DeviceBinding.objects.filter(card_id=state['id'], device_id=device_id).update(
+                        last_active_time=now,
+                        ip_address=CardVerificationService._get_client_ip(request) if request else '127.0.0.1'
+                    )
+                # 不回写缓存：读取缓存之后卡密可能已被禁用或修改并写入了新状态，回写会用旧状态覆盖它；
+                # 删除后由下一次验证从数据库重新加载
+                CardStateCache.delete(state['card_key_hash'])
+            if not touched:
+                # 卡密已不是启用状态，交由数据库路径判定
+                return None
+
+        if result[0]:
+            with stage('api_key_save'):
+                CardVerificationService._record_api_key_usage(api_key_obj)
+        return result
+
+    @staticmethod
+    async def averify_card(api_key_obj, card_key, device_id=None, request=None):
+        """
+        异步验证卡密
+
+        缓存命中的时间卡完全在事件循环中通过异步缓存和异步ORM完成；
+        需要数据库判定的路径在线程敏感的同步区段中执行 verify_card。
+
+        Returns:
+            tuple: (success, response_data, card_obj)
+        """
+        try:
+            card_key_hash = hashlib.sha1(card_key.encode()).hexdigest()
+            with stage('card_lookup'):
+                state = await CardStateCache.aget(card_key_hash)
+            if state is not None:
+                now = timezone.now()
+                verdict = CardVerificationService._evaluate_state(state, device_id, now)
+                if verdict is not None:
+                    result, needs_touch = verdict
+                    if needs_touch:
+                        with stage('card_save'):
+                            touched = await Card.objects.filter(
+                                pk=state['id'], status='active'
+                            ).aupdate(last_used_at=now)
+                            if touched and device_id:
+                                await DeviceBinding.objects.filter(
+                                    card_id=state['id'], device_id=device_id
+                                ).aupdate(
+                                    last_active_time=now,
+                                    ip_address=CardVerificationService._get_client_ip(request) if request else '127.0.0.1'
+                                )
+                            # 与 _verify_from_state 相同：删除而不是回写缓存
+                            await CardStateCache.adelete(card_key_hash)
+                        if not touched:
+                            result = None
+                    if result is not None:
+                        if result[0]:
+                            with stage('api_key_save'):
+                                await ApiKeyUsageBuffer.arecord(api_key_obj.pk, 1, now)
+                        return result
+            elif not await CardKeyFilter.amight_contain(card_key_hash):
+                return False, ApiResponse.card_not_found(), None
+        except Exception as e:
+            logger.warning(f"异步缓存验证失败，回退到数据库路径: {e}")
+
+        return await sync_to_async(CardVerificationService.verify_card, thread_sensitive=True)(
+            api_key_obj, card_key, device_id, request
+        )
+
+    @staticmethod
+    def _consume_count(card, now):
+        """
+        原子扣减次数卡
+
+        在一条UPDATE中完成剩余次数检查、扣减、用完时置为used_up，
+        只写入变化的字段，不需要行锁。成功时用返回值更新card对象。
+
+        Returns:
+            bool: 是否扣减成功
+        """
+        table = connection.ops.quote_name(Card._meta.db_table)
+        sql = (
+            f"UPDATE {table} SET "
+            f"used_count = used_count + 1, "
+            f"status = CASE WHEN used_count + 1 >= total_count THEN 'used_up' ELSE status END, "
+            f"last_used_at = %s, "
+            f"first_used_at = COALESCE(first_used_at, %s) "
+            f"WHERE id = %s AND status = 'active' AND used_count < total_count"
+        )
+        params = [now, now, card.pk]
+
+        with connection.cursor() as cursor:
+            if CardVerificationService._supports_update_returning():
+                # 一次往返拿到新值
+                cursor.execute(sql + " RETURNING used_count, status, first_used_at", params)
+                row = cursor.fetchone()
+                if row is None:
+                    return False
+                card.used_count, card.status = row[0], row[1]
+                card.first_used_at = card.first_used_at or now
+            else:
+                cursor.execute(sql, params)
+                if cursor.rowcount == 0:
+                    return False
+                card.refresh_from_db(fields=['used_count', 'status', 'first_used_at'])
+
+        card.last_used_at = now
+        return True
+
+    @staticmethod
+    def _supports_update_returning():
+        """
+        数据库是否支持 UPDATE ... RETURNING
+
+        只有 PostgreSQL 和 SQLite 3.35+ 支持；Django 没有对应的特性标志
+        （can_return_columns_from_insert 只表示 INSERT ... RETURNING，MariaDB 10.5+ 也为真但不支持 UPDATE ... RETURNING）。
+        """
+        if connection.vendor == 'postgresql':
+            return True
+        if connection.vendor == 'sqlite':
+            from django.db.backends.sqlite3.base import Database
+            return Database.sqlite_version_info >= (3, 35)
+        return False
+
+    @staticmethod
+    def _record_api_key_usage(api_key_obj):
+        """更新API密钥使用统计（写入写后缓冲，由后台线程批量写回）"""
+        now = timezone.now()
+        ApiKeyUsageBuffer.record(api_key_obj.pk, 1, now)
+        api_key_obj.usage_count += 1
+        api_key_obj.last_used_at = now
+
     @staticmethod
     def _handle_device_binding(card, device_id, request):
         """处理设备绑定"""
@@ -183,9 +585,13 @@ class CardQueryService:
         try:
             # 查找卡密
             card_key_hash = hashlib.sha1(card_key.encode()).hexdigest()
+            if not CardKeyFilter.might_contain(card_key_hash):
+                return False, ApiResponse.card_not_found()
             try:
-                card = Card.objects.get(card_key_hash=card_key_hash)
+                with stage('card_lookup'):
+                    card = Card.objects.get(card_key_hash=card_key_hash)
             except Card.DoesNotExist:
+                CardKeyFilter.record_false_positive()
                 return False, ApiResponse.card_not_found()
             
             # 获取设备绑定信息
@@ -196,106 +602,157 @@ class CardQueryService:
                 card=card
             ).order_by('-verification_time')[:10]
             
-            # 构建响应数据
-            data = {
-                'card_info': {
-                    'card_type': card.card_type,
-                    'status': card.status,
-                    'expire_date': card.expire_date.isoformat() if card.expire_date else None,
-                    'total_count': card.total_count if card.card_type == 'count' else None,
-                    'used_count': card.used_count if card.card_type == 'count' else None,
-                    'remaining_count': card.remaining_count if card.card_type == 'count' else None,
-                    'first_used_at': card.first_used_at.isoformat() if card.first_used_at else None,
-                    'last_used_at': card.last_used_at.isoformat() if card.last_used_at else None,
-                    'allow_multi_device': card.allow_multi_device,
-                    'max_devices': card.max_devices,
-                    'is_expired': card.is_expired
-                },
-                'device_bindings': [
-                    {
-                        'device_id': binding.device_id,
-                        'device_name': binding.device_name,
-                        'ip_address': binding.ip_address,
-                        'first_bind_time': binding.first_bind_time.isoformat(),
-                        'last_active_time': binding.last_active_time.isoformat()
-                    }
-                    for binding in device_bindings
-                ],
-                'recent_logs': [
-                    {
-                        'verification_time': log.verification_time.isoformat(),
-                        'ip_address': log.ip_address,
-                        'success': log.success,
-                        'error_message': log.error_message
-                    }
-                    for log in recent_logs
-                ]
-            }
+            data = CardQueryService._build_query_data(card, device_bindings, recent_logs)
+            return True, ApiResponse.success(data, '查询成功')
+            
+        except Exception as e:
+            logger.error(f"卡密查询失败: {e}", exc_info=True)
+            return False, ApiResponse.system_error("查询过程中发生错误")
+
+    @staticmethod
+    async def aquery_card(api_key_obj, card_key):
+        """
+        异步查询卡密信息（只读，全部使用异步ORM）
+        
+        Returns:
+            tuple: (success, response_data)
+        """
+        try:
+            card_key_hash = hashlib.sha1(card_key.encode()).hexdigest()
+            if not await CardKeyFilter.amight_contain(card_key_hash):
+                return False, ApiResponse.card_not_found()
+            try:
+                with stage('card_lookup'):
+                    card = await Card.objects.aget(card_key_hash=card_key_hash)
+            except Card.DoesNotExist:
+                CardKeyFilter.record_false_positive()
+                return False, ApiResponse.card_not_found()
+            
+            device_bindings = [
+                binding async for binding in DeviceBinding.objects.filter(card=card, is_active=True)
+            ]
+            recent_logs = [
+                log async for log in VerificationLog.objects.filter(
+                    card=card
+                ).order_by('-verification_time')[:10]
+            ]
             
+            data = CardQueryService._build_query_data(card, device_bindings, recent_logs)
             return True, ApiResponse.success(data, '查询成功')
             
         except Exception as e:
             logger.error(f"卡密查询失败: {e}", exc_info=True)
             return False, ApiResponse.system_error("查询过程中发生错误")
 
+    @staticmethod
+    def _build_query_data(card, device_bindings, recent_logs):
+        """构建卡密查询响应数据"""
+        return {
+            'card_info': {
+                'card_type': card.card_type,
+                'status': card.status,
+                'expire_date': card.expire_date.isoformat() if card.expire_date else None,
+                'total_count': card.total_count if card.card_type == 'count' else None,
+                'used_count': card.used_count if card.card_type == 'count' else None,
+                'remaining_count': card.remaining_count if card.card_type == 'count' else None,
+                'first_used_at': card.first_used_at.isoformat() if card.first_used_at else None,
+                'last_used_at': card.last_used_at.isoformat() if card.last_used_at else None,
+                'allow_multi_device': card.allow_multi_device,
+                'max_devices': card.max_devices,
+                'is_expired': card.is_expired
+            },
+            'device_bindings': [
+                {
+                    'device_id': binding.device_id,
+                    'device_name': binding.device_name,
+                    'ip_address': binding.ip_address,
+                    'first_bind_time': binding.first_bind_time.isoformat(),
+                    'last_active_time': binding.last_active_time.isoformat()
+                }
+                for binding in device_bindings
+            ],
+            'recent_logs': [
+                {
+                    'verification_time': log.verification_time.isoformat(),
+                    'ip_address': log.ip_address,
+                    'success': log.success,
+                    'error_message': log.error_message
+                }
+                for log in recent_logs
+            ]
+        }
+
 
 class ApiStatsService:
-    """API统计服务"""
+    """API统计服务（读取 api/rollups.py 维护的汇总表，耗时与日志总量无关）"""
     
     @staticmethod
-    def get_api_stats(api_key_obj=None, days=7):
+    def get_api_stats(api_key_obj=None, days=7, minutes=60):
         """
         获取API统计信息
         
         Args:
             api_key_obj: API密钥对象（可选，为None时统计所有）
-            days: 统计天数
+            days: 统计天数（包含今天的自然日）
+            minutes: 近期响应时间分位数的统计分钟数
             
         Returns:
             dict: 统计数据
         """
         try:
-            # 基础查询
-            queryset = ApiCallLog.objects.all()
-            if api_key_obj:
-                queryset = queryset.filter(api_key=api_key_obj)
-            
+            api_key_id = api_key_obj.pk if api_key_obj else None
+            tail = RollupService.api_call_tail(api_key_id)
+
             # 时间范围
-            end_date = timezone.now()
-            start_date = end_date - timedelta(days=days)
-            period_queryset = queryset.filter(call_time__gte=start_date)
-            
+            current_hour = timezone.localtime().replace(minute=0, second=0, microsecond=0)
+            today_start = current_hour.replace(hour=0)
+            period_start = today_start - timedelta(days=days - 1)
+
+            def stats(period, group_by=(), start=None, histogram=True):
+                groups = RollupService.api_call_stats(period, group_by, start, api_key_id, tail, histogram)
+                return summarize(groups)
+
             # 基础统计
-            total_calls = queryset.count()
-            successful_calls = queryset.filter(success=True).count()
+            totals = stats('day', histogram=False).get((), {})
+            total_calls = totals.get('call_count', 0)
+            successful_calls = totals.get('success_count', 0)
             failed_calls = total_calls - successful_calls
             success_rate = (successful_calls / total_calls * 100) if total_calls > 0 else 0
             
             # 平均响应时间
-            avg_response_time = queryset.aggregate(
-                avg_time=Avg('response_time')
-            )['avg_time'] or 0
+            avg_response_time = totals['latency_sum'] / total_calls if total_calls else 0
             
             # 今日和本小时统计
-            today = timezone.now().date()
-            calls_today = queryset.filter(call_time__date=today).count()
-            
-            current_hour = timezone.now().replace(minute=0, second=0, microsecond=0)
-            calls_this_hour = queryset.filter(call_time__gte=current_hour).count()
+            calls_today = stats('hour', start=today_start, histogram=False).get((), {}).get('call_count', 0)
+            calls_this_hour = stats('hour', start=current_hour, histogram=False).get((), {}).get('call_count', 0)
             
             # 按小时统计（最近24小时）
-            hourly_stats = ApiStatsService._get_hourly_stats(period_queryset)
+            hourly_stats = ApiStatsService._get_hourly_stats(
+                stats('hour', ['bucket_start'], current_hour - timedelta(hours=23)), current_hour
+            )
             
             # 按天统计
-            daily_stats = ApiStatsService._get_daily_stats(period_queryset, days)
+            daily_stats = ApiStatsService._get_daily_stats(
+                stats('day', ['bucket_start'], period_start), period_start, days
+            )
             
             # 按端点统计
-            endpoint_stats = ApiStatsService._get_endpoint_stats(period_queryset)
+            endpoint_stats = ApiStatsService._get_endpoint_stats(stats('day', ['endpoint'], period_start))
             
+            # 统计期内的响应时间分位数
+            period_totals = stats('day', start=period_start).get((), {})
+            latency = ApiStatsService._format_latency(period_totals)
+
+            # 近期（分钟级）响应时间分位数
+            recent_latency = ApiStatsService._get_recent_latency(api_key_id, minutes)
+
+            # 近期各阶段耗时分位数
+            stage_latency = ApiStatsService._get_stage_latency(api_key_id, minutes)
+
             # 如果不是特定API密钥，还要统计top API密钥
             top_api_keys = []
             if not api_key_obj:
-                top_api_keys = ApiStatsService._get_top_api_keys(period_queryset)
+                top_api_keys = ApiStatsService._get_top_api_keys(stats('day', ['api_key_id'], period_start))
             
             return {
                 'total_calls': total_calls,
@@ -303,6 +760,9 @@ class ApiStatsService:
                 'failed_calls': failed_calls,
                 'success_rate': round(success_rate, 2),
                 'avg_response_time': round(avg_response_time, 2),
+                'latency': latency,
+                'recent_latency': recent_latency,
+                'stage_latency': stage_latency,
                 'calls_today': calls_today,
                 'calls_this_hour': calls_this_hour,
                 'hourly_stats': hourly_stats,
@@ -316,50 +776,175 @@ class ApiStatsService:
             return {}
     
     @staticmethod
-    def _get_hourly_stats(queryset):
-        """获取按小时统计"""
-        # 实现按小时统计逻辑
-        return []
+    def _get_hourly_stats(groups, current_hour):
+        """获取按小时统计（最近24小时，无调用的小时补0）"""
+        hourly_stats = []
+        for offset in range(23, -1, -1):
+            hour = current_hour - timedelta(hours=offset)
+            item = groups.get((hour,), {})
+            hourly_stats.append(ApiStatsService._format_stats(item, hour=hour.strftime('%Y-%m-%d %H:00')))
+        return hourly_stats
     
     @staticmethod
-    def _get_daily_stats(queryset, days):
-        """获取按天统计"""
-        # 实现按天统计逻辑
-        return []
+    def _get_daily_stats(groups, period_start, days):
+        """获取按天统计（无调用的日期补0）"""
+        daily_stats = []
+        for offset in range(days):
+            day = period_start + timedelta(days=offset)
+            item = groups.get((day,), {})
+            daily_stats.append(ApiStatsService._format_stats(item, date=day.strftime('%Y-%m-%d')))
+        return daily_stats
     
     @staticmethod
-    def _get_endpoint_stats(queryset):
+    def _get_endpoint_stats(groups):
         """获取按端点统计"""
-        return list(queryset.values('endpoint').annotate(
-            count=Count('id'),
-            success_count=Count('id', filter=Q(success=True)),
-            avg_response_time=Avg('response_time')
-        ).order_by('-count')[:10])
+        endpoint_stats = [
+            ApiStatsService._format_stats(item, endpoint=endpoint) for (endpoint,), item in groups.items()
+        ]
+        return sorted(endpoint_stats, key=lambda item: -item['count'])[:10]
     
     @staticmethod
-    def _get_top_api_keys(queryset):
+    def _get_top_api_keys(groups):
         """获取使用最多的API密钥"""
-        return list(queryset.values('api_key__name').annotate(
-            count=Count('id'),
-            success_count=Count('id', filter=Q(success=True))
-        ).order_by('-count')[:10])
+        top = sorted(groups.items(), key=lambda entry: -entry[1]['call_count'])[:10]
+        names = dict(ApiKey.objects.filter(pk__in=[api_key_id for (api_key_id,), _ in top]).values_list('pk', 'name'))
+        return [
+            {
+                'api_key__name': names.get(api_key_id, ''),
+                'count': item['call_count'],
+                'success_count': item['success_count'],
+                **ApiStatsService._format_latency(item),
+            }
+            for (api_key_id,), item in top
+        ]
+
+    @staticmethod
+    def _format_stats(item, **extra):
+        count = item.get('call_count', 0)
+        return {
+            **extra,
+            'count': count,
+            'success_count': item.get('success_count', 0),
+            'avg_response_time': round(item['latency_sum'] / count, 2) if count else 0,
+            **ApiStatsService._format_latency(item),
+        }
+
+    @staticmethod
+    def _format_latency(item):
+        """响应时间分位数（毫秒，无调用时为 None）"""
+        return {
+            'p50': item.get('p50'),
+            'p95': item.get('p95'),
+            'p99': item.get('p99'),
+            'max': round(item['latency_max'], 2) if item.get('call_count') else None,
+        }
+
+    @staticmethod
+    def _get_recent_latency(api_key_id, minutes):
+        """最近若干分钟的响应时间分位数（整体及按端点，来自 Redis 中的分钟直方图）"""
+        minutes = max(1, min(minutes, getattr(settings, 'LATENCY_MINUTE_RETENTION', 180)))
+        groups = summarize(LatencyRecorder.histograms(minutes, ['endpoint'], api_key_id))
+        overall = {}
+        if groups:
+            overall = {(): {
+                'call_count': sum(item['call_count'] for item in groups.values()),
+                'latency_max': max(item['latency_max'] for item in groups.values()),
+                'histogram': sum(item['histogram'] for item in groups.values()),
+            }}
+            summarize(overall)
+        endpoints = sorted(groups.items(), key=lambda entry: -entry[1]['call_count'])[:10]
+        return {
+            'minutes': minutes,
+            'count': overall.get((), {}).get('call_count', 0),
+            **ApiStatsService._format_latency(overall.get((), {})),
+            'endpoints': [
+                {'endpoint': endpoint, 'count': item['call_count'], **ApiStatsService._format_latency(item)}
+                for (endpoint,), item in endpoints
+            ],
+        }
+
+    @staticmethod
+    def _get_stage_latency(api_key_id, minutes):
+        """最近若干分钟各端点的分阶段耗时分位数（来自 api/timing.py 的分钟直方图）"""
+        minutes = max(1, min(minutes, getattr(settings, 'LATENCY_MINUTE_RETENTION', 180)))
+        groups = summarize(StageLatencyRecorder.histograms(minutes, ['endpoint'], api_key_id))
+        order = {name: index for index, name in enumerate(STAGES + ('total',))}
+        endpoints = {}
+        for (field,), item in groups.items():
+            endpoint, stage_name = field.rsplit('|', 1)
+            endpoints.setdefault(endpoint, []).append(
+                {'stage': stage_name, 'count': item['call_count'], **ApiStatsService._format_latency(item)}
+            )
+        return {
+            'minutes': minutes,
+            'endpoints': [
+                {'endpoint': endpoint, 'stages': sorted(stages, key=lambda item: order.get(item['stage'], len(order)))}
+                for endpoint, stages in sorted(endpoints.items())
+            ],
+        }
 
 
 class LoggingService:
     """日志记录服务"""
+
+    @staticmethod
+    def log_verifications_bulk(entries, request, api_key):
+        """
+        批量记录验证日志
+
+        Args:
+            entries: [(card, success, error_message), ...]，card为None的条目不记录
+        """
+        try:
+            ip_address = CardVerificationService._get_client_ip(request) if request else '127.0.0.1'
+            user_agent = request.META.get('HTTP_USER_AGENT', '')[:500] if request else ''
+            LogWriter.write_many([
+                VerificationLog(
+                    card=card,
+                    ip_address=ip_address,
+                    user_agent=user_agent,
+                    success=success,
+                    error_message=error_message[:1000],
+                    api_key=api_key
+                )
+                for card, success, error_message in entries if card is not None
+            ])
+        except Exception as e:
+            logger.error(f"批量记录验证日志失败: {e}", exc_info=True)
     
     @staticmethod
     def log_verification(card, request, api_key, success, error_message='', device_binding=None):
         """记录验证日志"""
         try:
-            VerificationLog.objects.create(
-                card=card,
-                device_binding=device_binding,
-                ip_address=CardVerificationService._get_client_ip(request) if request else '127.0.0.1',
-                user_agent=request.META.get('HTTP_USER_AGENT', '')[:500] if request else '',
-                success=success,
-                error_message=error_message[:1000],
-                api_key=api_key
+            LogWriter.write(LoggingService._build_verification_log(
+                card, request, api_key, success, error_message, device_binding
+            ))
+        except Exception as e:
+            logger.error(f"记录验证日志失败: {e}", exc_info=True)
+
+    @staticmethod
+    async def alog_verification(card, request, api_key, success, error_message='', device_binding=None):
+        """异步记录验证日志"""
+        try:
+            verification_log = LoggingService._build_verification_log(
+                card, request, api_key, success, error_message, device_binding
             )
+            if LogWriter.is_enabled():
+                LogWriter.write(verification_log)
+            else:
+                await verification_log.asave()
         except Exception as e:
             logger.error(f"记录验证日志失败: {e}", exc_info=True)
+
+    @staticmethod
+    def _build_verification_log(card, request, api_key, success, error_message='', device_binding=None):
+        """构建验证日志对象"""
+        return VerificationLog(
+            card=card,
+            device_binding=device_binding,
+            ip_address=CardVerificationService._get_client_ip(request) if request else '127.0.0.1',
+            user_agent=request.META.get('HTTP_USER_AGENT', '')[:500] if request else '',
+            success=success,
+            error_message=error_message[:1000],
+            api_key=api_key
+        )
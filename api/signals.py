@@ -0,0 +1,22 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .cache import ApiKeyCache
+from .metrics import install_query_wrapper
+from .models import ApiKey
+
+# 只更新这些字段时不影响缓存内容
+USAGE_FIELDS = {'usage_count', 'last_used_at'}
+
+
+@receiver(post_save, sender=ApiKey)
+@receiver(post_delete, sender=ApiKey)
+def invalidate_api_key_cache(sender, instance, update_fields=None, **kwargs):
+    """API密钥新建、修改、启停或删除后通知所有worker失效本地缓存"""
+    if update_fields and set(update_fields) <= USAGE_FIELDS:
+        return
+    ApiKeyCache.invalidate()
+
+
+# 每个请求的数据库查询次数/耗时指标
+connection_created.connect(install_query_wrapper, dispatch_uid='api_metrics_query_wrapper')
@@ -0,0 +1,158 @@
+"""
+API日志本地落盘文件（spool）
+
+开启 API_LOG_SPOOL_ENABLED 后，API调用日志和验证日志不再写数据库，而是以 JSON Lines
+追加到本地分段文件，再由 ``manage.py ingest_logs`` 批量导入数据库。
+请求路径只有一次 write()，数据库写入吞吐与请求延迟完全解耦。
+
+- 每个进程写自己的分段文件 ``segment-<时间>-<pid>-<序号>.jsonl.open``，
+  超过 API_LOG_SPOOL_SEGMENT_BYTES 字节或 API_LOG_SPOOL_SEGMENT_SECONDS 秒后
+  fsync 并重命名为 ``.jsonl``（已关闭，可导入）。
+- fsync 策略 API_LOG_SPOOL_FSYNC：
+  ``always`` 每次写入后 fsync，进程或机器崩溃都不丢日志；
+  ``batch``（默认）由后台线程每个周期（约0.5秒）fsync 一次，进程崩溃不丢（数据已在页缓存），
+  机器掉电最多丢失一个周期。
+- 进程异常退出后遗留的 ``.open`` 文件（超过 ingest_logs --orphan-age 秒未修改，
+  正常写入的分段最多 API_LOG_SPOOL_SEGMENT_SECONDS 秒就会关闭）由 ingest_logs 当作已关闭文件导入，
+  末尾不完整的一行会被跳过。
+"""
+import atexit
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from .background import PeriodicFlusher
+
+logger = logging.getLogger(__name__)
+
+OPEN_SUFFIX = '.jsonl.open'
+CLOSED_SUFFIX = '.jsonl'
+
+
+def get_spool_dir():
+    return str(getattr(settings, 'API_LOG_SPOOL_DIR', os.path.join(settings.BASE_DIR, 'logs', 'spool')))
+
+
+class SpoolJSONEncoder(DjangoJSONEncoder):
+    """保留时间的微秒精度（DjangoJSONEncoder 会截断到毫秒）"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def serialize_log(obj):
+    """把日志模型实例序列化为一行JSON（字段按 attname 保存，外键保存为id）"""
+    record = {'model': obj._meta.label_lower}
+    for field in obj._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        record[field.attname] = field.value_from_object(obj)
+    return json.dumps(record, cls=SpoolJSONEncoder, ensure_ascii=False)
+
+
+class LogSpool:
+    """日志落盘写入器（每个进程一个当前分段）"""
+
+    TASK_NAME = 'api_log_spool'
+
+    _lock = threading.Lock()
+    _file = None
+    _path = None
+    _pid = None
+    _opened_at = 0.0
+    _sequence = 0
+    _dirty = False
+    _atexit_registered = False
+
+    @staticmethod
+    def is_enabled():
+        return getattr(settings, 'API_LOG_SPOOL_ENABLED', False)
+
+    @classmethod
+    def write_many(cls, objs):
+        """把日志追加到当前分段文件"""
+        lines = ''.join(serialize_log(obj) + '\n' for obj in objs)
+        fsync_always = getattr(settings, 'API_LOG_SPOOL_FSYNC', 'batch') == 'always'
+        with cls._lock:
+            spool_file = cls._current_file()
+            spool_file.write(lines)
+            if fsync_always:
+                spool_file.flush()
+                os.fsync(spool_file.fileno())
+            else:
+                cls._dirty = True
+            if spool_file.tell() >= getattr(settings, 'API_LOG_SPOOL_SEGMENT_BYTES', 64 * 1024 * 1024):
+                cls._close_current()
+
+        PeriodicFlusher.register(cls.TASK_NAME, cls.sync, PeriodicFlusher.TICK)
+
+    @classmethod
+    def sync(cls):
+        """fsync 当前分段，并关闭超时的分段"""
+        with cls._lock:
+            if cls._file is None or cls._pid != os.getpid():
+                return
+            if cls._dirty:
+                cls._file.flush()
+                os.fsync(cls._file.fileno())
+                cls._dirty = False
+            max_age = getattr(settings, 'API_LOG_SPOOL_SEGMENT_SECONDS', 60)
+            if time.monotonic() - cls._opened_at >= max_age:
+                cls._close_current()
+
+    @classmethod
+    def close(cls):
+        """关闭当前分段，使其可被导入"""
+        with cls._lock:
+            if cls._file is not None and cls._pid == os.getpid():
+                cls._close_current()
+
+    @classmethod
+    def _current_file(cls):
+        pid = os.getpid()
+        if cls._file is not None and cls._pid == pid:
+            return cls._file
+
+        # fork 后继承的文件句柄属于父进程，不能继续写入
+        spool_dir = get_spool_dir()
+        os.makedirs(spool_dir, exist_ok=True)
+        cls._sequence += 1
+        name = f"segment-{time.strftime('%Y%m%d%H%M%S')}-{pid}-{cls._sequence}{OPEN_SUFFIX}"
+        cls._path = os.path.join(spool_dir, name)
+        # 行缓冲：每次写入立即进入操作系统页缓存，进程崩溃不会丢失
+        cls._file = open(cls._path, 'a', encoding='utf-8', buffering=1)
+        cls._pid = pid
+        cls._opened_at = time.monotonic()
+        cls._dirty = False
+        if not cls._atexit_registered:
+            atexit.register(cls.close)
+            cls._atexit_registered = True
+        return cls._file
+
+    @classmethod
+    def _close_current(cls):
+        spool_file, path = cls._file, cls._path
+        cls._file = None
+        cls._path = None
+        try:
+            spool_file.flush()
+            os.fsync(spool_file.fileno())
+            spool_file.close()
+            if os.path.getsize(path) == 0:
+                os.remove(path)
+            else:
+                os.rename(path, path[:-len(OPEN_SUFFIX)] + CLOSED_SUFFIX)
+                # 保证重命名本身落盘
+                dir_fd = os.open(os.path.dirname(path), os.O_RDONLY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+        except Exception as e:
+            logger.error(f"关闭日志分段 {path} 失败: {e}")
@@ -1,3 +1,465 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
+import fakeredis
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from cards.models import Card
+from .error_codes import ApiErrorCode
+from .models import ApiKey
+from .partitions import LogPartitionManager
+from .ratelimit import RateLimiter
+from .redis_client import get_redis_client, make_redis_key
+from .services import CardVerificationService
+from .usage import ApiKeyUsageBuffer
 
-# Create your tests here.
+# 测试使用进程内缓存，并关闭会在后台线程中访问数据库的写后缓冲、过滤器、自动汇总以及指标
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+isolated_settings = override_settings(
+    CACHES=LOCAL_CACHES, CARD_KEY_FILTER_ENABLED=False, API_KEY_USAGE_WRITE_BEHIND=False,
+    API_LOG_BUFFER_ENABLED=False, ROLLUP_AUTO_UPDATE=False, METRICS_ENABLED=False,
+)
+# 需要 Redis 的测试使用 fakeredis（与 django-redis 相同的接口，支持 Lua 脚本）
+FAKE_REDIS_CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://fakeredis:6379/1',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'CONNECTION_POOL_KWARGS': {
+                'connection_class': fakeredis.FakeConnection, 'server': fakeredis.FakeServer(),
+            },
+        },
+        'KEY_PREFIX': 'test',
+    },
+    'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+
+@skipUnless(connection.vendor == 'postgresql', '日志分区只在 PostgreSQL 上使用')
+@override_settings(LOG_PARTITION_INTERVAL='month', LOG_PARTITION_PREMAKE=3)
+class LogPartitionTests(TransactionTestCase):
+    """日志表分区转换与维护（使用独立的测试表，CONCURRENTLY 需要在事务外执行）"""
+
+    table = 'partition_test_log'
+    column = 'logged_at'
+
+    def setUp(self):
+        self.now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE {self.table} (id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, "
+                f"{self.column} timestamptz NOT NULL, message text NOT NULL DEFAULT '')"
+            )
+            cursor.execute(f"CREATE INDEX {self.table}_time_idx ON {self.table} ({self.column})")
+            cursor.execute(
+                f"INSERT INTO {self.table} ({self.column}, message) "
+                f"SELECT %s - g * interval '1 day', 'old' FROM generate_series(1, 400) g",
+                [self.now]
+            )
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename LIKE %s",
+                [f"{self.table}%"]
+            )
+            for (name,) in cursor.fetchall():
+                cursor.execute(f"DROP TABLE IF EXISTS {name} CASCADE")
+
+    def convert(self):
+        with connection.schema_editor(atomic=False) as schema_editor:
+            LogPartitionManager.prepare_conversion(schema_editor, self.table, self.column)
+        with connection.schema_editor() as schema_editor:
+            LogPartitionManager.convert_to_partitioned(schema_editor, self.table, self.column)
+
+    def partitions(self):
+        """分区名 -> (下界, 上界)"""
+        with connection.cursor() as cursor:
+            partitions = LogPartitionManager.list_partitions(cursor, self.table)
+        return {name: (lower, upper) for name, lower, upper in partitions}
+
+    def future_partitions(self):
+        """按时间排列的新建分区名"""
+        return sorted((lower, name) for name, (lower, _) in self.partitions().items() if lower is not None)
+
+    def fetch(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def test_prepare_builds_index_and_validated_check(self):
+        with connection.schema_editor(atomic=False) as schema_editor:
+            LogPartitionManager.prepare_conversion(schema_editor, self.table, self.column)
+
+        index = LogPartitionManager.conversion_index_name(self.table)
+        self.assertEqual(self.fetch("SELECT indisunique, indisvalid FROM pg_index WHERE indexrelid = %s::regclass",
+                                    [index]), [(True, True)])
+        self.assertEqual(self.fetch(
+            "SELECT convalidated FROM pg_constraint WHERE conrelid = %s::regclass AND conname = %s",
+            [self.table, LogPartitionManager.conversion_check_name(self.table)]
+        ), [(True,)])
+
+    def test_convert_keeps_rows_and_attaches_legacy_partition(self):
+        self.convert()
+
+        with connection.cursor() as cursor:
+            self.assertTrue(LogPartitionManager.is_partitioned(cursor, self.table))
+        partitions = self.partitions()
+        legacy_lower, legacy_upper = partitions.pop(f"{self.table}_legacy")
+        self.assertEqual(partitions.pop(f"{self.table}_default"), (None, None))
+        # 历史分区至少覆盖到下个周期结束，之后按预建数量逐个周期建分区
+        self.assertIsNone(legacy_lower)
+        self.assertGreater(legacy_upper - self.now, timedelta(days=28))
+        self.assertEqual(len(partitions), 2)
+        self.assertEqual(min(lower for lower, _ in partitions.values()), legacy_upper)
+
+        self.assertEqual(self.fetch(f"SELECT count(*) FROM {self.table}"), [(400,)])
+        # 准备好的唯一索引成为历史分区的主键，临时的上界约束已删除
+        self.assertEqual(self.fetch(
+            "SELECT pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype IN ('p', 'c')", [f"{self.table}_legacy"]
+        ), [(f"PRIMARY KEY (id, {self.column})",)])
+        self.assertEqual(self.fetch(
+            "SELECT count(*) FROM pg_constraint WHERE contype = 'c' AND conrelid = %s::regclass", [self.table]
+        ), [(0,)])
+
+        # 新写入的行由新序列继续编号，落在历史分区中
+        rows = self.fetch(
+            f"INSERT INTO {self.table} ({self.column}) VALUES (%s) RETURNING id, tableoid::regclass::text", [self.now]
+        )
+        self.assertEqual(rows, [(401, f"{self.table}_legacy")])
+
+    def test_ensure_partitions_moves_rows_out_of_default(self):
+        self.convert()
+        last = self.future_partitions()[-1][1]
+        future = self.partitions()[last][1] + timedelta(days=40)
+        self.fetch(f"INSERT INTO {self.table} ({self.column}) VALUES (%s) RETURNING id", [future])
+        self.assertEqual(self.fetch(f"SELECT count(*) FROM {self.table}_default"), [(1,)])
+
+        with connection.cursor() as cursor:
+            created = LogPartitionManager.ensure_partitions(cursor, self.table, self.column, 0, now=future)
+            self.assertEqual(LogPartitionManager.ensure_partitions(cursor, self.table, self.column, 0, now=future), [])
+
+        self.assertIn(LogPartitionManager.partition_name(self.table, future, 'month'), created)
+        self.assertEqual(self.fetch(f"SELECT count(*) FROM {self.table}_default"), [(0,)])
+        self.assertEqual(self.fetch(
+            f"SELECT tableoid::regclass::text FROM {self.table} WHERE {self.column} = %s", [future]
+        ), [(LogPartitionManager.partition_name(self.table, future, 'month'),)])
+
+    def test_expire_partitions(self):
+        self.convert()
+        legacy = f"{self.table}_legacy"
+        first_future = self.future_partitions()[0][1]
+        cutoff = self.partitions()[first_future][1]
+
+        with connection.cursor() as cursor:
+            expired = LogPartitionManager.expire_partitions(cursor, self.table, cutoff, dry_run=True)
+            self.assertEqual(expired, [legacy, first_future])
+            self.assertEqual(len(self.partitions()), 4)
+
+            # 分离：不再属于分区表，数据保留在独立表中
+            LogPartitionManager.expire_partitions(cursor, self.table, self.partitions()[legacy][1], detach=True)
+            self.assertNotIn(legacy, self.partitions())
+            self.assertEqual(self.fetch(f"SELECT count(*) FROM {legacy}"), [(400,)])
+
+            self.assertEqual(LogPartitionManager.expire_partitions(cursor, self.table, cutoff), [first_future])
+        self.assertEqual(self.fetch("SELECT to_regclass(%s)", [first_future]), [(None,)])
+        self.assertEqual(self.fetch(f"SELECT count(*) FROM {self.table}"), [(0,)])
+
+
+@isolated_settings
+class ConsumeCountTests(TestCase):
+    """次数卡原子扣减（按数据库选择 UPDATE ... RETURNING 或回退路径）"""
+
+    # None 表示按数据库判断，子类固定走某一路径
+    update_returning = None
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw', status='approved')
+        cls.api_key = ApiKey.objects.create(name='test', created_by=cls.user)
+
+    def setUp(self):
+        if self.update_returning is not None:
+            patcher = mock.patch.object(
+                CardVerificationService, '_supports_update_returning', return_value=self.update_returning
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_card(self, used_count, total_count=2):
+        return Card.objects.create(
+            card_key=f"COUNT{used_count}{total_count}", card_type='count', total_count=total_count,
+            used_count=used_count, created_by=self.user,
+        )
+
+    def test_last_use_moves_card_to_used_up(self):
+        card = self.make_card(used_count=1)
+        now = timezone.now()
+
+        self.assertTrue(CardVerificationService._consume_count(card, now))
+
+        self.assertEqual((card.used_count, card.status, card.first_used_at), (2, 'used_up', now))
+        card.refresh_from_db()
+        self.assertEqual((card.used_count, card.status, card.last_used_at), (2, 'used_up', now))
+
+    def test_use_before_last_keeps_card_active(self):
+        card = self.make_card(used_count=0)
+
+        self.assertTrue(CardVerificationService._consume_count(card, timezone.now()))
+
+        card.refresh_from_db()
+        self.assertEqual((card.used_count, card.status), (1, 'active'))
+
+    def test_exhausted_card_is_rejected_without_increment(self):
+        card = self.make_card(used_count=2)
+
+        self.assertFalse(CardVerificationService._consume_count(card, timezone.now()))
+
+        card.refresh_from_db()
+        self.assertEqual((card.used_count, card.status, card.last_used_at), (2, 'active', None))
+
+    def test_verify_card_reports_used_up_after_last_use(self):
+        card = self.make_card(used_count=1)
+
+        success, _, _ = CardVerificationService.verify_card(self.api_key, card.card_key)
+        self.assertTrue(success)
+        success, response, _ = CardVerificationService.verify_card(self.api_key, card.card_key)
+        self.assertFalse(success)
+        self.assertEqual(response['message'], '卡密使用次数已用完')
+
+        card.refresh_from_db()
+        self.assertEqual((card.used_count, card.status), (2, 'used_up'))
+
+    def test_update_returning_support_follows_vendor(self):
+        if self.update_returning is not None:
+            self.skipTest('已固定扣减路径')
+        supported = CardVerificationService._supports_update_returning()
+        if connection.vendor == 'postgresql':
+            self.assertTrue(supported)
+        elif connection.vendor == 'sqlite':
+            self.assertEqual(supported, connection.Database.sqlite_version_info >= (3, 35))
+        else:
+            self.assertFalse(supported)
+
+
+class ConsumeCountFallbackTests(ConsumeCountTests):
+    """不支持 UPDATE ... RETURNING 的数据库：UPDATE 后重新读取"""
+
+    update_returning = False
+
+
+@override_settings(CACHES=FAKE_REDIS_CACHES, API_KEY_USAGE_WRITE_BEHIND=True)
+@isolated_settings
+class ApiKeyUsageBufferTests(TestCase):
+    """API密钥使用统计写后缓冲（Redis 哈希交接、刷新锁续期、批量写回）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        cls.keys = [ApiKey.objects.create(name=f"key{i}", created_by=user) for i in range(5)]
+
+    def setUp(self):
+        self.client_redis = get_redis_client()
+        self.client_redis.flushdb()
+        # 由测试显式刷新，不启动后台刷新线程
+        patcher = mock.patch.object(ApiKeyUsageBuffer, '_ensure_flusher')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def usage_count(self, api_key):
+        api_key.refresh_from_db()
+        return api_key.usage_count
+
+    def processing_keys(self):
+        return list(self.client_redis.scan_iter(match=make_redis_key(ApiKeyUsageBuffer.PROCESSING_KEY_PREFIX) + '*'))
+
+    def test_increments_arriving_during_flush_are_kept_for_next_flush(self):
+        first, second = self.keys[:2]
+        ApiKeyUsageBuffer.record(first.pk, 3)
+        ApiKeyUsageBuffer.record(second.pk, 1)
+        apply = ApiKeyUsageBuffer._apply
+
+        def apply_while_recording(usage):
+            # 待刷新哈希已改名为 processing，此时到达的计数写入新的待刷新哈希
+            ApiKeyUsageBuffer.record(first.pk, 5)
+            apply(usage)
+
+        with mock.patch.object(ApiKeyUsageBuffer, '_apply', side_effect=apply_while_recording):
+            self.assertEqual(ApiKeyUsageBuffer.flush(), 2)
+
+        self.assertEqual((self.usage_count(first), self.usage_count(second)), (3, 1))
+        self.assertEqual(ApiKeyUsageBuffer.pending([first.pk])[first.pk][0], 5)
+        self.assertEqual(ApiKeyUsageBuffer.flush(), 1)
+        self.assertEqual(self.usage_count(first), 8)
+        self.assertEqual(ApiKeyUsageBuffer.pending([first.pk]), {})
+        self.assertEqual(self.processing_keys(), [])
+
+    def test_leftover_processing_hash_is_applied_once_after_crash(self):
+        api_key = self.keys[0]
+        ApiKeyUsageBuffer.record(api_key.pk, 4)
+
+        # 写库前崩溃：processing 哈希留在 Redis 中，锁已释放
+        with mock.patch.object(ApiKeyUsageBuffer, '_apply', side_effect=RuntimeError('crash')):
+            with self.assertRaises(RuntimeError):
+                ApiKeyUsageBuffer.flush()
+        self.assertEqual(len(self.processing_keys()), 1)
+        self.assertEqual(self.usage_count(api_key), 0)
+
+        ApiKeyUsageBuffer.record(api_key.pk, 2)
+        self.assertEqual(ApiKeyUsageBuffer.flush(), 2)
+        self.assertEqual(self.usage_count(api_key), 6)
+        self.assertEqual(self.processing_keys(), [])
+        self.assertEqual(ApiKeyUsageBuffer.flush(), 0)
+        self.assertEqual(self.usage_count(api_key), 6)
+
+    def test_lock_is_extended_while_applying(self):
+        api_key = self.keys[0]
+        ApiKeyUsageBuffer.record(api_key.pk, 7)
+        apply = ApiKeyUsageBuffer._apply
+        concurrent = []
+
+        def slow_apply(usage):
+            apply(usage)
+            if concurrent:
+                return
+            # 超过锁的初始有效期后另一个 worker 尝试刷新：锁仍被续期持有，不会重复写入
+            time.sleep(ApiKeyUsageBuffer.LOCK_TIMEOUT + 1)
+            concurrent.append(None)
+            concurrent[0] = ApiKeyUsageBuffer._flush_redis(self.client_redis)
+
+        with mock.patch.object(ApiKeyUsageBuffer, 'LOCK_TIMEOUT', 2), \
+                mock.patch.object(ApiKeyUsageBuffer, '_apply', side_effect=slow_apply):
+            self.assertEqual(ApiKeyUsageBuffer.flush(), 1)
+
+        self.assertEqual(concurrent, [0])
+        self.assertEqual(self.usage_count(api_key), 7)
+        self.assertIsNone(self.client_redis.get(make_redis_key(ApiKeyUsageBuffer.LOCK_KEY)))
+
+    def test_batch_is_rolled_back_when_lock_is_lost(self):
+        api_key = self.keys[0]
+        ApiKeyUsageBuffer.record(api_key.pk, 7)
+        lock_key = make_redis_key(ApiKeyUsageBuffer.LOCK_KEY)
+        apply = ApiKeyUsageBuffer._apply
+
+        def apply_after_lock_taken(usage):
+            apply(usage)
+            # 锁被其他 worker 取得，续期线程发现后放弃本批次
+            self.client_redis.set(lock_key, 'other-worker')
+            time.sleep(ApiKeyUsageBuffer.LOCK_TIMEOUT / 3 + 0.5)
+
+        with mock.patch.object(ApiKeyUsageBuffer, 'LOCK_TIMEOUT', 3), \
+                mock.patch.object(ApiKeyUsageBuffer, '_apply', side_effect=apply_after_lock_taken):
+            self.assertEqual(ApiKeyUsageBuffer.flush(), 0)
+
+        self.assertEqual(self.usage_count(api_key), 0)
+        self.assertEqual(len(self.processing_keys()), 1)
+        self.assertEqual(self.client_redis.get(lock_key), b'other-worker')
+
+        self.client_redis.delete(lock_key)
+        self.assertEqual(ApiKeyUsageBuffer.flush(), 1)
+        self.assertEqual(self.usage_count(api_key), 7)
+
+    def test_apply_in_chunks_and_last_used_only_moves_forward(self):
+        now = timezone.now()
+        newest = self.keys[0]
+        ApiKey.objects.filter(pk=newest.pk).update(usage_count=10, last_used_at=now)
+        usage = {api_key.pk: [i + 1, now - timedelta(minutes=i + 1)] for i, api_key in enumerate(self.keys)}
+
+        with mock.patch.object(ApiKeyUsageBuffer, 'UPDATE_CHUNK_SIZE', 2):
+            ApiKeyUsageBuffer._apply(usage)
+
+        for i, api_key in enumerate(self.keys):
+            api_key.refresh_from_db()
+            if api_key.pk == newest.pk:
+                self.assertEqual((api_key.usage_count, api_key.last_used_at), (11, now))
+            else:
+                self.assertEqual((api_key.usage_count, api_key.last_used_at), (i + 1, now - timedelta(minutes=i + 1)))
+
+
+@isolated_settings
+class RateLimitTests(TestCase):
+    """按API密钥的令牌桶限流（进程内令牌桶；子类使用 Redis Lua 脚本）"""
+
+    redis = False
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        cls.api_key = ApiKey.objects.create(name='limited', created_by=user, rate_limit=5)
+
+    def setUp(self):
+        RateLimiter._local_buckets.clear()
+        client = get_redis_client()
+        self.assertEqual(client is not None, self.redis)
+        if client is not None:
+            client.flushdb()
+        # 确认走的是期望的实现：Redis 可用时不应退回进程内令牌桶
+        patcher = mock.patch.object(RateLimiter, '_check_local', wraps=RateLimiter._check_local)
+        self.check_local = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.assertEqual(self.check_local.called, not self.redis)
+
+    def verify(self):
+        return self.client.post(
+            reverse('api:verify'), {'api_key': self.api_key.key, 'card_key': 'MISSING'},
+            content_type='application/json',
+        )
+
+    def verify_batch(self, count):
+        items = [{'card_key': f"MISSING{i}"} for i in range(count)]
+        return self.client.post(
+            reverse('api:verify_batch'), {'api_key': self.api_key.key, 'items': items},
+            content_type='application/json',
+        )
+
+    def assertRateLimited(self, response, remaining=0):
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['code'], ApiErrorCode.RATE_LIMITED)
+        self.assertEqual(response['X-RateLimit-Limit'], '5')
+        self.assertEqual(response['X-RateLimit-Remaining'], str(remaining))
+        # 每分钟5次即每12秒补充1个令牌
+        self.assertTrue(1 <= int(response['Retry-After']) <= 12)
+
+    def test_first_request_over_limit_is_rejected(self):
+        for remaining in range(4, -1, -1):
+            response = self.verify()
+            self.assertNotEqual(response.status_code, 429)
+            self.assertEqual(response['X-RateLimit-Limit'], '5')
+            self.assertEqual(response['X-RateLimit-Remaining'], str(remaining))
+            self.assertTrue(1 <= int(response['X-RateLimit-Reset']) <= 60)
+            self.assertNotIn('Retry-After', response)
+
+        self.assertRateLimited(self.verify())
+
+    def test_batch_is_charged_per_card(self):
+        response = self.verify_batch(3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-RateLimit-Remaining'], '2')
+
+        # 剩余令牌不足以覆盖整批：拒绝，且只按一次请求扣减
+        self.assertRateLimited(self.verify_batch(3), remaining=1)
+        response = self.verify_batch(1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-RateLimit-Remaining'], '0')
+        self.assertRateLimited(self.verify_batch(1))
+
+    def test_batch_larger_than_limit_is_rejected(self):
+        response = self.verify_batch(6)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['code'], ApiErrorCode.RATE_LIMITED)
+        self.assertEqual(response['X-RateLimit-Remaining'], '4')
+
+
+@override_settings(CACHES=FAKE_REDIS_CACHES)
+class RedisRateLimitTests(RateLimitTests):
+    redis = True
@@ -0,0 +1,121 @@
+"""
+请求分阶段计时
+
+验证、查询等接口把一次请求拆成若干阶段，用 ``time.perf_counter_ns()`` 计时：
+
+- 请求开始时 start_request() 在当前上下文（contextvars，同步线程和异步任务都适用）中放入 RequestTimer，
+  业务代码用 ``with stage('card_lookup'):`` 标记阶段，没有计时器时为空操作；
+- 响应返回前 finish_request() 把各阶段耗时写入 ``Server-Timing`` 响应头（浏览器开发者工具可直接查看），
+  并按 (API密钥, 端点, 阶段) 计入分钟直方图 StageLatencyRecorder（与 api/latency.py 相同的 Redis 合并方式），
+  /api/v1/stats/ 的 stage_latency 给出最近若干分钟各阶段的分位数。
+"""
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from .latency import LatencyRecorder
+
+logger = logging.getLogger(__name__)
+
+# 阶段名称（同一阶段多次进入时累加）
+STAGES = (
+    'parse', 'api_key', 'rate_limit', 'serializer', 'card_lookup', 'device_binding',
+    'card_save', 'api_key_save', 'verification_log', 'call_log',
+)
+
+_current_timer = contextvars.ContextVar('request_timer', default=None)
+
+
+class RequestTimer:
+    """一次请求的各阶段耗时（纳秒）"""
+
+    __slots__ = ('start_ns', 'stages')
+
+    def __init__(self, start_ns=None):
+        self.start_ns = start_ns or time.perf_counter_ns()
+        self.stages = {}
+
+    def add(self, name, duration_ns):
+        self.stages[name] = self.stages.get(name, 0) + duration_ns
+
+    def elapsed_ns(self):
+        return time.perf_counter_ns() - self.start_ns
+
+    def header_value(self, total_ns):
+        """Server-Timing 响应头的值（毫秒，保留 3 位小数）"""
+        parts = [f"{name};dur={duration / 1e6:.3f}" for name, duration in self.stages.items()]
+        parts.append(f"total;dur={total_ns / 1e6:.3f}")
+        return ', '.join(parts)
+
+
+def is_enabled():
+    return getattr(settings, 'STAGE_TIMING_ENABLED', True)
+
+
+def start_request(start_ns=None):
+    """为当前请求创建计时器，关闭计时时返回 None"""
+    if not is_enabled():
+        return None
+    timer = RequestTimer(start_ns)
+    _current_timer.set(timer)
+    return timer
+
+
+def current_timer():
+    return _current_timer.get()
+
+
+@contextmanager
+def stage(name):
+    """标记一个阶段，计入当前请求的计时器（没有计时器时不计时）"""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter_ns() - start)
+
+
+def finish_request(response, timer, api_key_obj=None, endpoint=''):
+    """写入 Server-Timing 响应头并记录各阶段直方图，返回 response"""
+    if timer is None:
+        return response
+    _current_timer.set(None)
+    total_ns = timer.elapsed_ns()
+    try:
+        if getattr(settings, 'SERVER_TIMING_HEADER', True):
+            response['Server-Timing'] = timer.header_value(total_ns)
+        if api_key_obj is not None:
+            StageLatencyRecorder.record_stages(api_key_obj.pk, endpoint, timer.stages, total_ns)
+    except Exception as e:
+        logger.warning(f"记录请求分阶段耗时失败: {e}")
+    return response
+
+
+class StageLatencyRecorder(LatencyRecorder):
+    """各阶段耗时的分钟直方图，端点字段保存为 ``<端点>|<阶段>``"""
+
+    KEY_PREFIX = 'stage_latency:'
+    MAX_KEY_PREFIX = 'stage_latency:max:'
+    TASK_NAME = 'stage_latency_histograms'
+
+    _lock = threading.Lock()
+    _pending = {}
+    _local = {}
+
+    @staticmethod
+    def is_enabled():
+        return is_enabled() and getattr(settings, 'LATENCY_HISTOGRAM_ENABLED', True)
+
+    @classmethod
+    def record_stages(cls, api_key_id, endpoint, stages, total_ns, now=None):
+        """记录一次请求的各阶段耗时（纳秒）和总耗时"""
+        now = now or time.time()
+        for name, duration in stages.items():
+            cls.record(api_key_id, f"{endpoint}|{name}", duration / 1e6, now)
+        cls.record(api_key_id, f"{endpoint}|total", total_ns / 1e6, now)
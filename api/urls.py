@@ -1,12 +1,22 @@
+from django.conf import settings
 from django.urls import path, include
-from . import views
+from . import views, async_views
 
 app_name = 'api'
 
+# ASGI部署时验证/查询接口使用原生异步视图
+if settings.API_ASYNC_VIEWS:
+    verify_view = async_views.AsyncVerifyCardView.as_view()
+    query_view = async_views.AsyncQueryCardView.as_view()
+else:
+    verify_view = views.VerifyCardView.as_view()
+    query_view = views.QueryCardView.as_view()
+
 # API接口路由
 api_patterns = [
-    path('verify/', views.VerifyCardView.as_view(), name='verify'),
-    path('query/', views.QueryCardView.as_view(), name='query'),
+    path('verify/', verify_view, name='verify'),
+    path('verify/batch/', views.BatchVerifyCardView.as_view(), name='verify_batch'),
+    path('query/', query_view, name='query'),
     path('health/', views.health_check, name='health_check'),
     path('stats/', views.ApiStatsView.as_view(), name='stats'),
 ]
@@ -19,6 +29,10 @@ management_patterns = [
     path('keys/<int:pk>/delete/', views.ApiKeyDeleteView.as_view(), name='key_delete'),
     path('keys/<int:pk>/toggle-status/', views.toggle_api_key_status, name='toggle_api_key_status'),
     path('logs/', views.ApiCallLogListView.as_view(), name='call_logs'),
+    path('exports/', views.ExportJobListView.as_view(), name='export_jobs'),
+    path('exports/create/', views.ExportJobCreateView.as_view(), name='export_job_create'),
+    path('exports/<int:pk>/status/', views.ExportJobStatusView.as_view(), name='export_job_status'),
+    path('exports/download/<str:token>/', views.ExportJobDownloadView.as_view(), name='export_job_download'),
 ]
 
 urlpatterns = api_patterns + management_patterns
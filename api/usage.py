@@ -0,0 +1,295 @@
+"""
+API密钥使用统计写后缓冲
+
+验证成功时不再逐次 UPDATE api_apikey 行，而是把 usage_count 增量和最后使用时间
+累加到 Redis 哈希中，由后台线程定期用一条 UPDATE（F('usage_count') + CASE 增量）批量写回。
+
+交接流程（保证计数不丢失）：
+1. 持有 Redis 刷新锁的 worker 把待刷新哈希 RENAME 为 processing:<token>，
+   之后的新增计数写入新的待刷新哈希；
+2. 把 processing 哈希写入数据库，成功后才删除；
+3. 写库前进程崩溃时 processing 哈希保留在 Redis 中，下一次获得锁的 worker 先补写它。
+   只有在数据库提交之后、删除之前崩溃才会重复计数一次（至少一次语义）。
+
+刷新期间由后台线程定期续期刷新锁（只续期自己持有的锁），锁不会在写库途中过期、被其他 worker 取得后
+把仍在写入的 processing 哈希当作遗留批次重复补写；续期失败（锁已丢失）时放弃写入并回滚，留给新的持有者。
+
+Redis 不可用时退回进程内缓冲，由本进程后台线程直接写库，进程异常退出时会丢失最后一个刷新周期的计数。
+"""
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Case, When, Value, IntegerField, DateTimeField
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from .background import PeriodicFlusher
+from .models import ApiKey
+from .redis_client import get_redis_client, make_redis_key
+
+logger = logging.getLogger(__name__)
+
+# 只在锁仍由自己持有时续期
+EXTEND_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class _LockLost(Exception):
+    """刷新锁已被其他 worker 取得"""
+
+
+class ApiKeyUsageBuffer:
+    """API密钥使用统计写后缓冲"""
+
+    PENDING_KEY = 'api_key_usage:pending'
+    PROCESSING_KEY_PREFIX = 'api_key_usage:processing:'
+    LOCK_KEY = 'api_key_usage:flush_lock'
+    LOCK_TIMEOUT = 60
+    UPDATE_CHUNK_SIZE = 500
+
+    _lock = threading.Lock()
+    # 进程内缓冲: api_key_id -> [增量, 最后使用时间]
+    _local = {}
+
+    @staticmethod
+    def is_enabled():
+        return getattr(settings, 'API_KEY_USAGE_WRITE_BEHIND', True)
+
+    @classmethod
+    def record(cls, api_key_id, count=1, now=None):
+        """记录API密钥使用次数"""
+        now = now or timezone.now()
+        if not cls.is_enabled():
+            cls._apply({api_key_id: [count, now]})
+            return
+
+        cls._ensure_flusher()
+        client = get_redis_client()
+        if client is not None:
+            try:
+                pending_key = make_redis_key(cls.PENDING_KEY)
+                pipe = client.pipeline(transaction=False)
+                pipe.hincrby(pending_key, f"c:{api_key_id}", count)
+                pipe.hset(pending_key, f"t:{api_key_id}", now.timestamp())
+                pipe.execute()
+                return
+            except Exception as e:
+                logger.warning(f"写入API密钥使用计数到Redis失败，改用进程内缓冲: {e}")
+
+        cls._add_local({api_key_id: [count, now]})
+
+    @classmethod
+    async def arecord(cls, api_key_id, count=1, now=None):
+        """异步记录API密钥使用次数"""
+        await sync_to_async(cls.record, thread_sensitive=False)(api_key_id, count, now)
+
+    @classmethod
+    def pending(cls, api_key_ids):
+        """
+        尚未写回数据库的使用统计，用于列表页展示近实时数据
+
+        Returns:
+            dict: api_key_id -> (增量, 最后使用时间)
+        """
+        result = {}
+        with cls._lock:
+            for api_key_id in api_key_ids:
+                if api_key_id in cls._local:
+                    count, last_used_at = cls._local[api_key_id]
+                    result[api_key_id] = (count, last_used_at)
+
+        client = get_redis_client() if cls.is_enabled() else None
+        if client is None or not api_key_ids:
+            return result
+        try:
+            fields = []
+            for api_key_id in api_key_ids:
+                fields.extend([f"c:{api_key_id}", f"t:{api_key_id}"])
+            values = client.hmget(make_redis_key(cls.PENDING_KEY), fields)
+            for index, api_key_id in enumerate(api_key_ids):
+                count, timestamp = values[index * 2], values[index * 2 + 1]
+                if count is None:
+                    continue
+                local_count, local_last_used = result.get(api_key_id, (0, None))
+                last_used_at = cls._from_timestamp(timestamp)
+                if local_last_used and (last_used_at is None or local_last_used > last_used_at):
+                    last_used_at = local_last_used
+                result[api_key_id] = (local_count + int(count), last_used_at)
+        except Exception as e:
+            logger.warning(f"读取待刷新的API密钥使用计数失败: {e}")
+        return result
+
+    @classmethod
+    def flush(cls):
+        """
+        把缓冲的使用统计写回数据库
+
+        Returns:
+            int: 写回的API密钥数量
+        """
+        flushed = cls._flush_local()
+        client = get_redis_client()
+        if client is not None:
+            flushed += cls._flush_redis(client)
+        return flushed
+
+    @classmethod
+    def _ensure_flusher(cls):
+        PeriodicFlusher.register(
+            'api_key_usage', cls.flush, getattr(settings, 'API_KEY_USAGE_FLUSH_INTERVAL', 5)
+        )
+
+    @classmethod
+    def _add_local(cls, usage):
+        with cls._lock:
+            for api_key_id, (count, last_used_at) in usage.items():
+                entry = cls._local.get(api_key_id)
+                if entry is None:
+                    cls._local[api_key_id] = [count, last_used_at]
+                else:
+                    entry[0] += count
+                    if last_used_at and (entry[1] is None or last_used_at > entry[1]):
+                        entry[1] = last_used_at
+
+    @classmethod
+    def _flush_local(cls):
+        with cls._lock:
+            usage, cls._local = cls._local, {}
+        if not usage:
+            return 0
+        try:
+            cls._apply(usage)
+        except Exception:
+            # 写库失败时放回缓冲，下个周期重试
+            cls._add_local(usage)
+            raise
+        return len(usage)
+
+    @classmethod
+    def _flush_redis(cls, client):
+        lock_key = make_redis_key(cls.LOCK_KEY)
+        token = uuid.uuid4().hex
+        try:
+            if not client.set(lock_key, token, nx=True, ex=cls.LOCK_TIMEOUT):
+                return 0
+        except Exception as e:
+            logger.warning(f"获取API密钥使用计数刷新锁失败: {e}")
+            return 0
+
+        flushed = 0
+        keeper = _LockKeeper(client, lock_key, token, cls.LOCK_TIMEOUT)
+        try:
+            with keeper:
+                # 先补写上次中断遗留的批次（锁持续续期，持有锁时不存在其他进行中的批次）
+                for processing_key in client.scan_iter(match=make_redis_key(cls.PROCESSING_KEY_PREFIX) + '*'):
+                    flushed += cls._apply_processing(client, processing_key, keeper)
+
+                pending_key = make_redis_key(cls.PENDING_KEY)
+                if client.exists(pending_key):
+                    processing_key = make_redis_key(f"{cls.PROCESSING_KEY_PREFIX}{token}")
+                    client.rename(pending_key, processing_key)
+                    flushed += cls._apply_processing(client, processing_key, keeper)
+        except _LockLost:
+            logger.warning("API密钥使用计数刷新锁已丢失，未写入的批次留给下一次刷新")
+        finally:
+            if client.get(lock_key) == token.encode():
+                client.delete(lock_key)
+        return flushed
+
+    @classmethod
+    def _apply_processing(cls, client, processing_key, keeper):
+        usage = {}
+        for field, value in client.hgetall(processing_key).items():
+            kind, api_key_id = field.decode().split(':', 1)
+            entry = usage.setdefault(int(api_key_id), [0, None])
+            if kind == 'c':
+                entry[0] = int(value)
+            else:
+                entry[1] = cls._from_timestamp(value)
+        if usage:
+            with transaction.atomic():
+                cls._apply(usage)
+                # 提交前确认锁仍由自己持有，否则回滚，避免与新的持有者重复写入
+                keeper.ensure_held()
+        client.delete(processing_key)
+        return len(usage)
+
+    @classmethod
+    def _apply(cls, usage):
+        """用一条UPDATE批量累加使用次数并更新最后使用时间（只前进不后退）"""
+        items = list(usage.items())
+        with transaction.atomic():
+            for offset in range(0, len(items), cls.UPDATE_CHUNK_SIZE):
+                chunk = items[offset:offset + cls.UPDATE_CHUNK_SIZE]
+                ApiKey.objects.filter(pk__in=[api_key_id for api_key_id, _ in chunk]).update(
+                    usage_count=F('usage_count') + Case(
+                        *[When(pk=api_key_id, then=Value(count)) for api_key_id, (count, _) in chunk],
+                        default=Value(0),
+                        output_field=IntegerField()
+                    ),
+                    last_used_at=Case(
+                        *[When(pk=api_key_id, then=Greatest(
+                            Coalesce(F('last_used_at'), Value(last_used_at)), Value(last_used_at)
+                        )) for api_key_id, (_, last_used_at) in chunk if last_used_at],
+                        default=F('last_used_at'),
+                        output_field=DateTimeField()
+                    )
+                )
+
+    @staticmethod
+    def _from_timestamp(value):
+        if value is None:
+            return None
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+
+
+class _LockKeeper:
+    """持有 Redis 刷新锁期间在后台线程中每 timeout/3 秒续期一次"""
+
+    def __init__(self, client, key, token, timeout):
+        self.client = client
+        self.key = key
+        self.token = token
+        self.timeout = timeout
+        self.lost = False
+        # 最近一次确认持有锁后锁的过期时间（单调时钟）
+        self.expires_at = time.monotonic() + timeout
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name='api-key-usage-lock', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def ensure_held(self):
+        """锁已丢失或续期长时间失败（可能已过期）时抛出 _LockLost"""
+        if self.lost or time.monotonic() >= self.expires_at - 1:
+            raise _LockLost()
+
+    def _run(self):
+        script = self.client.register_script(EXTEND_LOCK_SCRIPT)
+        while not self._stop.wait(self.timeout / 3):
+            started = time.monotonic()
+            try:
+                extended = script(keys=[self.key], args=[self.token, self.timeout])
+            except Exception as e:
+                logger.warning(f"续期API密钥使用计数刷新锁失败: {e}")
+                continue
+            if not extended:
+                self.lost = True
+                return
+            self.expires_at = started + self.timeout
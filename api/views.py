@@ -1,9 +1,11 @@
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
+from django.views import View
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
-from django.urls import reverse_lazy
-from django.http import JsonResponse
+from django.urls import reverse, reverse_lazy
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.utils.decorators import method_decorator
 from django.utils import timezone
 from django.db.models import Q
@@ -18,19 +20,31 @@ from rest_framework.permissions import AllowAny
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 import hashlib
+import hmac
 import json
 import logging
 
-from .models import ApiKey, ApiCallLog
+from .models import ApiKey, ApiCallLog, ExportJob
+from cards.export import CONTENT_TYPES, EXPORT_FORMATS
+from cards.keyfilter import CardKeyFilter
 from cards.models import Card, DeviceBinding, VerificationLog
+from cards.pagination import KeysetPaginationMixin
 from accounts.mixins import ApprovedUserRequiredMixin
 from .error_codes import ApiResponse, ApiErrorCode, get_http_status
-from .mixins import BaseApiView, api_monitor, require_api_key
+from .exports import (
+    EXPORT_DATASETS, ExportJobRunner, check_download_token, get_download_name, get_export_dir, make_download_token,
+)
+from .mixins import BaseApiView, api_monitor, require_api_key, rate_limit
+from .metrics import Metrics, record_verify_outcome
+from .search import filter_api_call_logs
+from .timing import stage
 from .serializers import (
     CardVerifyRequestSerializer, CardVerifyResponseSerializer,
+    CardBatchVerifyRequestSerializer, CardBatchVerifyResponseSerializer,
     CardQueryRequestSerializer, CardQueryResponseSerializer,
     ErrorResponseSerializer
 )
+from .usage import ApiKeyUsageBuffer
 from .services import CardVerificationService, CardQueryService, LoggingService
 
 logger = logging.getLogger(__name__)
@@ -61,6 +75,7 @@ class VerifyCardView(BaseApiView):
             200: CardVerifyResponseSerializer,
             400: ErrorResponseSerializer,
             401: ErrorResponseSerializer,
+            429: ErrorResponseSerializer,
             403: ErrorResponseSerializer,
             500: ErrorResponseSerializer,
         },
@@ -68,14 +83,18 @@ class VerifyCardView(BaseApiView):
     )
     @api_monitor
     @require_api_key
+    @rate_limit()
     def post(self, request):
         """验证卡密"""
         try:
             # 验证请求数据
             serializer = CardVerifyRequestSerializer(data=request.parsed_data)
-            if not serializer.is_valid():
+            with stage('serializer'):
+                is_valid = serializer.is_valid()
+            if not is_valid:
                 error_msg = '; '.join([f"{k}: {', '.join(v)}" for k, v in serializer.errors.items()])
                 response_data = ApiResponse.error(ApiErrorCode.CARD_ERROR, f"参数验证失败: {error_msg}")
+                record_verify_outcome(response_data, 'invalid_params')
                 self.log_api_call(request.api_key_obj, request, 400, self.start_time, False, error_msg)
                 return Response(response_data, status=get_http_status(response_data['code']))
 
@@ -87,13 +106,15 @@ class VerifyCardView(BaseApiView):
             success, response_data, card = CardVerificationService.verify_card(
                 request.api_key_obj, card_key, device_id, request
             )
+            record_verify_outcome(response_data)
 
             # 记录验证日志
             if card:
-                LoggingService.log_verification(
-                    card, request, validated_data['api_key'],
-                    success, response_data.get('message', ''), None
-                )
+                with stage('verification_log'):
+                    LoggingService.log_verification(
+                        card, request, validated_data['api_key'],
+                        success, response_data.get('message', ''), None
+                    )
 
             # 记录API调用日志
             status_code = get_http_status(response_data['code'])
@@ -110,6 +131,120 @@ class VerifyCardView(BaseApiView):
             self.log_api_call(None, request, 500, self.start_time, False, str(e))
             return Response(response_data, status=get_http_status(response_data['code']))
 
+class BatchVerifyCardView(BaseApiView):
+    """
+    卡密批量验证API
+
+    在一次请求中验证多个卡密，结果按输入顺序返回。
+    """
+
+    @swagger_auto_schema(
+        operation_description="批量验证卡密",
+        request_body=CardBatchVerifyRequestSerializer,
+        responses={
+            200: CardBatchVerifyResponseSerializer,
+            400: ErrorResponseSerializer,
+            401: ErrorResponseSerializer,
+            429: ErrorResponseSerializer,
+            500: ErrorResponseSerializer,
+        },
+        tags=['卡密验证']
+    )
+    @api_monitor
+    @require_api_key
+    @rate_limit()
+    def post(self, request):
+        """批量验证卡密"""
+        try:
+            # 验证请求数据
+            serializer = CardBatchVerifyRequestSerializer(data=request.parsed_data)
+            with stage('serializer'):
+                is_valid = serializer.is_valid()
+            if not is_valid:
+                error_msg = '; '.join([
+                    f"{k}: {', '.join(map(str, v)) if isinstance(v, list) else v}"
+                    for k, v in serializer.errors.items()
+                ])
+                response_data = ApiResponse.error(ApiErrorCode.CARD_ERROR, f"参数验证失败: {error_msg}")
+                record_verify_outcome(response_data, 'invalid_params')
+                self.log_api_call(request.api_key_obj, request, 400, self.start_time, False, error_msg)
+                return Response(response_data, status=get_http_status(response_data['code']))
+
+            validated_data = serializer.validated_data
+            items = validated_data['items']
+
+            # 按卡密数量消耗频率限制额度（rate_limit 装饰器已消耗1次）
+            rate_limited = self._charge_batch_rate_limit(request, len(items))
+            if rate_limited is not None:
+                return rate_limited
+
+            # 调用业务逻辑服务
+            results = CardVerificationService.verify_cards_batch(
+                request.api_key_obj, items, request
+            )
+            for _, item_response, _ in results:
+                record_verify_outcome(item_response)
+
+            # 批量记录验证日志
+            with stage('verification_log'):
+                LoggingService.log_verifications_bulk(
+                    [(card, success, item_response.get('message', ''))
+                     for success, item_response, card in results],
+                    request, validated_data['api_key']
+                )
+
+            success_count = sum(1 for success, _, _ in results if success)
+            response_data = ApiResponse.success({
+                'total': len(results),
+                'success_count': success_count,
+                'failed_count': len(results) - success_count,
+                'results': [
+                    dict(item_response, card_key=str(item.get('card_key') or ''))
+                    for item, (_, item_response, _) in zip(items, results)
+                ]
+            }, '批量验证完成')
+
+            # 记录API调用日志（整批一条）
+            self.log_api_call(
+                request.api_key_obj, request, 200, self.start_time, True,
+                f"批量验证 {len(results)} 项，成功 {success_count} 项"
+            )
+
+            return Response(response_data, status=200)
+
+        except Exception as e:
+            logger.error(f"卡密批量验证异常: {e}", exc_info=True)
+            response_data = ApiResponse.system_error("验证过程中发生错误")
+            self.log_api_call(None, request, 500, self.start_time, False, str(e))
+            return Response(response_data, status=get_http_status(response_data['code']))
+
+    def _charge_batch_rate_limit(self, request, item_count):
+        """
+        批量验证按卡密数量计入频率限制：在装饰器已消耗的1次之外再消耗 item_count - 1 次
+
+        Returns:
+            Response | None: 超过限额时返回 429 响应
+        """
+        api_key_obj = request.api_key_obj
+        if item_count <= 1 or request.rate_limit_result is None:
+            return None
+        if item_count > api_key_obj.rate_limit:
+            response_data = ApiResponse.error(
+                ApiErrorCode.RATE_LIMITED,
+                f"批量验证的卡密数（{item_count}）超过API密钥的频率限制（{api_key_obj.rate_limit} 次/分钟）"
+            )
+        else:
+            result = self.check_rate_limit(request, api_key_obj, cost=item_count - 1)
+            if result is None or result.allowed:
+                request.rate_limit_result = result or request.rate_limit_result
+                return None
+            request.rate_limit_result = result
+            response_data = ApiResponse.rate_limited(result.retry_after)
+        status_code = get_http_status(response_data['code'])
+        self.log_api_call(api_key_obj, request, status_code, self.start_time, False, response_data['message'])
+        return Response(response_data, status=status_code)
+
+
 class QueryCardView(BaseApiView):
     """
     卡密查询API
@@ -124,6 +259,7 @@ class QueryCardView(BaseApiView):
             200: CardQueryResponseSerializer,
             400: ErrorResponseSerializer,
             401: ErrorResponseSerializer,
+            429: ErrorResponseSerializer,
             404: ErrorResponseSerializer,
             500: ErrorResponseSerializer,
         },
@@ -131,12 +267,15 @@ class QueryCardView(BaseApiView):
     )
     @api_monitor
     @require_api_key
+    @rate_limit()
     def post(self, request):
         """查询卡密信息"""
         try:
             # 验证请求数据
             serializer = CardQueryRequestSerializer(data=request.parsed_data)
-            if not serializer.is_valid():
+            with stage('serializer'):
+                is_valid = serializer.is_valid()
+            if not is_valid:
                 error_msg = '; '.join([f"{k}: {', '.join(v)}" for k, v in serializer.errors.items()])
                 response_data = ApiResponse.error(ApiErrorCode.CARD_ERROR, f"参数验证失败: {error_msg}")
                 self.log_api_call(request.api_key_obj, request, 400, self.start_time, False, error_msg)
@@ -192,7 +331,8 @@ def health_check(request):
                 'total_api_keys': total_api_keys,
                 'total_cards': total_cards,
                 'active_api_keys': ApiKey.objects.filter(is_active=True).count()
-            }
+            },
+            'card_key_filter': CardKeyFilter.stats()
         }
 
         return Response(health_data, status=200)
@@ -206,6 +346,29 @@ def health_check(request):
         }, status=503)
 
 
+@require_http_methods(['GET'])
+def metrics(request):
+    """
+    Prometheus 指标端点（文本格式，见 api/metrics.py）
+
+    默认拒绝访问（404）：来源地址（REMOTE_ADDR）在 METRICS_ALLOWED_IPS 中时直接放行；
+    设置了 METRICS_TOKEN 时其他来源需要 ``Authorization: Bearer <METRICS_TOKEN>`` 请求头，否则返回 401。
+    """
+    if not Metrics.is_enabled():
+        raise Http404
+    # 不使用 X-Forwarded-For，客户端可以伪造
+    if request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', []):
+        return HttpResponse(Metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        raise Http404
+    if not hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()
+    ):
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain; charset=utf-8')
+    return HttpResponse(Metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class ApiStatsView(BaseApiView):
     """
     API统计信息端点
@@ -225,22 +388,30 @@ class ApiStatsView(BaseApiView):
                 'days', openapi.IN_QUERY,
                 description="统计天数（默认7天）",
                 type=openapi.TYPE_INTEGER
+            ),
+            openapi.Parameter(
+                'minutes', openapi.IN_QUERY,
+                description="近期响应时间分位数的统计分钟数（默认60分钟）",
+                type=openapi.TYPE_INTEGER
             )
         ],
         responses={
             200: "统计信息",
             401: ErrorResponseSerializer,
+            429: ErrorResponseSerializer,
             500: ErrorResponseSerializer,
         },
         tags=['API统计']
     )
     @api_monitor
+    @rate_limit()
     def get(self, request):
         """获取API统计信息"""
         try:
             # 获取查询参数
             api_key = request.GET.get('api_key')
             days = int(request.GET.get('days', 7))
+            minutes = int(request.GET.get('minutes', 60))
 
             # 验证API密钥（如果提供）
             api_key_obj = None
@@ -251,7 +422,7 @@ class ApiStatsView(BaseApiView):
 
             # 获取统计数据
             from .services import ApiStatsService
-            stats_data = ApiStatsService.get_api_stats(api_key_obj, days)
+            stats_data = ApiStatsService.get_api_stats(api_key_obj, days, minutes)
 
             response_data = ApiResponse.success(stats_data, '统计信息获取成功')
             return Response(response_data, status=200)
@@ -325,6 +496,17 @@ class ApiKeyListView(ApprovedUserRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['search'] = self.request.GET.get('search', '')
+
+        # 叠加尚未写回数据库的使用统计，列表页显示近实时数据
+        api_keys = list(context['api_keys'])
+        pending = ApiKeyUsageBuffer.pending([api_key.pk for api_key in api_keys])
+        for api_key in api_keys:
+            if api_key.pk in pending:
+                count, last_used_at = pending[api_key.pk]
+                api_key.usage_count += count
+                if last_used_at and (not api_key.last_used_at or last_used_at > api_key.last_used_at):
+                    api_key.last_used_at = last_used_at
+        context['api_keys'] = api_keys
         return context
 
 
@@ -364,34 +546,108 @@ class ApiKeyDeleteView(ApprovedUserRequiredMixin, DeleteView):
         return super().delete(request, *args, **kwargs)
 
 
-class ApiCallLogListView(ApprovedUserRequiredMixin, ListView):
+class ApiCallLogListView(ApprovedUserRequiredMixin, KeysetPaginationMixin, ListView):
     """API调用记录列表视图"""
     model = ApiCallLog
     template_name = 'api/call_logs.html'
     context_object_name = 'logs'
     paginate_by = 50
+    cursor_field = 'call_time'
 
     def get_queryset(self):
         queryset = ApiCallLog.objects.select_related('api_key').order_by('-call_time')
+        # 搜索和筛选（与导出共用）
+        return filter_api_call_logs(queryset, self.request.GET)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['search'] = self.request.GET.get('search', '')
+        context['success'] = self.request.GET.get('success', '')
+        return context
 
-        # 搜索功能
-        search = self.request.GET.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(api_key__name__icontains=search) |
-                Q(endpoint__icontains=search) |
-                Q(ip_address__icontains=search)
-            )
 
-        # 筛选功能
-        success = self.request.GET.get('success')
-        if success:
-            queryset = queryset.filter(success=success == 'true')
+class ExportJobListView(ApprovedUserRequiredMixin, ListView):
+    """导出任务列表视图"""
+    model = ExportJob
+    template_name = 'api/export_jobs.html'
+    context_object_name = 'jobs'
+    paginate_by = 20
 
+    def get_queryset(self):
+        # 进程重启后由页面访问拉起导出线程，继续未完成的任务
+        ExportJobRunner.ensure_started()
+        queryset = ExportJob.objects.order_by('-created_at')
+        if not self.request.user.is_superuser:
+            queryset = queryset.filter(created_by=self.request.user)
         return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['search'] = self.request.GET.get('search', '')
-        context['success'] = self.request.GET.get('success', '')
+        jobs = list(context['jobs'])
+        for job in jobs:
+            job.download_url = _export_download_url(job)
+        context['jobs'] = jobs
         return context
+
+
+class ExportJobCreateView(ApprovedUserRequiredMixin, View):
+    """创建导出任务（筛选条件取自列表页的查询参数）"""
+
+    def post(self, request):
+        dataset = request.POST.get('dataset')
+        export_format = request.POST.get('export_format', 'xlsx')
+        if dataset not in EXPORT_DATASETS or export_format not in EXPORT_FORMATS:
+            messages.error(request, '导出参数无效！')
+            return redirect('api:export_jobs')
+
+        job = ExportJobRunner.create(request.user, dataset, export_format, request.POST)
+        logger.info(f"用户 {request.user.username} 创建了导出任务 {job.pk}（{job.get_dataset_display()}）")
+        messages.success(request, '导出任务已创建，完成后可在此页面下载。')
+        return redirect('api:export_jobs')
+
+
+class ExportJobStatusView(ApprovedUserRequiredMixin, View):
+    """导出任务进度（供页面轮询）"""
+
+    def get(self, request, pk):
+        ExportJobRunner.ensure_started()
+        job = get_object_or_404(_visible_export_jobs(request.user), pk=pk)
+        return JsonResponse({
+            'status': job.status,
+            'status_text': job.get_status_display(),
+            'progress': job.progress,
+            'written_rows': job.written_rows,
+            'total_rows': job.total_rows,
+            'error_message': job.error_message,
+            'download_url': _export_download_url(job),
+        })
+
+
+class ExportJobDownloadView(ApprovedUserRequiredMixin, View):
+    """通过限时签名链接下载导出文件"""
+
+    def get(self, request, token):
+        job_id = check_download_token(token)
+        if job_id is None:
+            raise Http404('下载链接无效或已过期')
+        job = get_object_or_404(_visible_export_jobs(request.user), pk=job_id, status='completed')
+        path = get_export_dir() / job.file_name
+        if not job.file_name or not path.exists():
+            raise Http404('导出文件不存在或已过期')
+        return FileResponse(
+            open(path, 'rb'), as_attachment=True, filename=get_download_name(job),
+            content_type=CONTENT_TYPES[job.export_format]
+        )
+
+
+def _visible_export_jobs(user):
+    """当前用户可以查看的导出任务"""
+    if user.is_superuser:
+        return ExportJob.objects.all()
+    return ExportJob.objects.filter(created_by=user)
+
+
+def _export_download_url(job):
+    if job.status != 'completed':
+        return None
+    return reverse('api:export_job_download', args=[make_download_token(job)])
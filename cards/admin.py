@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
+from .cache import CardStateCache
 from .models import Card, DeviceBinding, VerificationLog
 
 
@@ -34,6 +35,11 @@ class CardAdmin(admin.ModelAdmin):
         }),
     )
 
+    def save_model(self, request, obj, form, change):
+        """保存后写穿卡密状态缓存"""
+        super().save_model(request, obj, form, change)
+        CardStateCache.store(obj)
+
     def card_key_display(self, obj):
         """显示部分卡密"""
         return f"{obj.card_key[:8]}***"
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CardsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cards'
+
+    def ready(self):
+        """注册卡密缓存失效信号"""
+        from . import signals
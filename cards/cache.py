@@ -0,0 +1,176 @@
+"""
+卡密热状态缓存
+
+以 card_key_hash 为键缓存卡密的状态、类型、过期时间、次数和已绑定设备集合，
+让时间卡验证可以不加行锁、不访问数据库直接得出结论。
+
+写穿策略：所有修改卡密的路径（验证、状态切换、编辑、后台管理）在事务提交后
+调用 ``CardStateCache.store()`` 写入最新状态；信号处理器在任意保存/删除时失效缓存，
+兜底覆盖未显式写穿的路径。
+验证命中缓存后节流更新最后使用时间时只删除缓存、不回写，避免用读取时的旧状态覆盖
+期间管理员写入的新状态（例如刚被禁用的卡密）。
+"""
+import logging
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from CardVerification.metrics import cache_access
+
+logger = logging.getLogger(__name__)
+
+# 缓存中保存的卡密字段
+CARD_STATE_FIELDS = (
+    'id', 'card_key_hash', 'card_type', 'status', 'expire_date',
+    'total_count', 'used_count', 'allow_multi_device', 'max_devices',
+    'first_used_at', 'last_used_at',
+)
+
+
+class CardStateCache:
+    """卡密状态缓存（写穿）"""
+
+    KEY_PREFIX = 'card_state:'
+
+    @staticmethod
+    def is_enabled():
+        return getattr(settings, 'CARD_STATE_CACHE_ENABLED', True)
+
+    @staticmethod
+    def _get_cache():
+        return caches[getattr(settings, 'CARD_STATE_CACHE_ALIAS', 'default')]
+
+    @classmethod
+    def make_key(cls, card_key_hash):
+        return f"{cls.KEY_PREFIX}{card_key_hash}"
+
+    @classmethod
+    def get(cls, card_key_hash):
+        """读取卡密状态，未命中或缓存不可用时返回None"""
+        if not cls.is_enabled():
+            return None
+        try:
+            state = cls._get_cache().get(cls.make_key(card_key_hash))
+        except Exception as e:
+            logger.warning(f"读取卡密状态缓存失败: {e}")
+            return None
+        cache_access('card_state', state is not None)
+        return state
+
+    @classmethod
+    async def aget(cls, card_key_hash):
+        """异步读取卡密状态"""
+        if not cls.is_enabled():
+            return None
+        try:
+            state = await cls._get_cache().aget(cls.make_key(card_key_hash))
+        except Exception as e:
+            logger.warning(f"读取卡密状态缓存失败: {e}")
+            return None
+        cache_access('card_state', state is not None)
+        return state
+
+    @classmethod
+    def set(cls, state):
+        """直接写入卡密状态"""
+        if not cls.is_enabled():
+            return
+        try:
+            cls._get_cache().set(
+                cls.make_key(state['card_key_hash']), state,
+                getattr(settings, 'CARD_STATE_CACHE_TIMEOUT', 3600)
+            )
+        except Exception as e:
+            logger.warning(f"写入卡密状态缓存失败: {e}")
+
+    @classmethod
+    async def aset(cls, state):
+        """异步写入卡密状态"""
+        if not cls.is_enabled():
+            return
+        try:
+            await cls._get_cache().aset(
+                cls.make_key(state['card_key_hash']), state,
+                getattr(settings, 'CARD_STATE_CACHE_TIMEOUT', 3600)
+            )
+        except Exception as e:
+            logger.warning(f"写入卡密状态缓存失败: {e}")
+
+    @classmethod
+    def delete(cls, card_key_hashes):
+        """直接删除一个或多个卡密状态"""
+        if not cls.is_enabled():
+            return
+        if isinstance(card_key_hashes, str):
+            card_key_hashes = [card_key_hashes]
+        try:
+            cls._get_cache().delete_many([cls.make_key(h) for h in card_key_hashes])
+        except Exception as e:
+            logger.warning(f"删除卡密状态缓存失败: {e}")
+
+    @classmethod
+    async def adelete(cls, card_key_hash):
+        """异步删除卡密状态"""
+        if not cls.is_enabled():
+            return
+        try:
+            await cls._get_cache().adelete(cls.make_key(card_key_hash))
+        except Exception as e:
+            logger.warning(f"删除卡密状态缓存失败: {e}")
+
+    @staticmethod
+    def build_state(card, device_ids=None):
+        """根据卡密对象构建缓存状态，未提供设备集合时从数据库读取"""
+        if device_ids is None:
+            from .models import DeviceBinding
+            device_ids = DeviceBinding.objects.filter(
+                card_id=card.pk, is_active=True
+            ).values_list('device_id', flat=True)
+
+        state = {field: getattr(card, field) for field in CARD_STATE_FIELDS}
+        state['devices'] = sorted(set(device_ids))
+        return state
+
+    @classmethod
+    def store(cls, card, device_ids=None):
+        """写穿：在当前事务提交后写入卡密的最新状态"""
+        if not cls.is_enabled():
+            return
+        state = cls.build_state(card, device_ids)
+        transaction.on_commit(lambda: cls.set(state))
+
+    @classmethod
+    def store_many(cls, cards_with_devices):
+        """批量写穿：[(card, device_ids), ...]，提交后一次写入"""
+        if not cls.is_enabled():
+            return
+        states = [cls.build_state(card, device_ids) for card, device_ids in cards_with_devices]
+        if not states:
+            return
+
+        def _set_many():
+            try:
+                cls._get_cache().set_many(
+                    {cls.make_key(state['card_key_hash']): state for state in states},
+                    getattr(settings, 'CARD_STATE_CACHE_TIMEOUT', 3600)
+                )
+            except Exception as e:
+                logger.warning(f"批量写入卡密状态缓存失败: {e}")
+
+        transaction.on_commit(_set_many)
+
+    @classmethod
+    def invalidate(cls, card_key_hash):
+        """在当前事务提交后失效卡密状态"""
+        if not cls.is_enabled():
+            return
+        transaction.on_commit(lambda: cls.delete(card_key_hash))
+
+    @staticmethod
+    def to_card(state):
+        """把缓存状态还原为（只读用途的）卡密对象，供日志记录和响应构建使用"""
+        from .models import Card
+
+        card = Card(**{field: state[field] for field in CARD_STATE_FIELDS})
+        card._state.adding = False
+        card._state.db = 'default'
+        return card
@@ -0,0 +1,125 @@
+"""
+卡密过期清理
+
+验证时才发现过期（verify_card 中的 is_expired 判断）会让状态统计失真，且过期后的首次验证
+要多写一次库。CardExpirySweeper 定期把到期的时间卡置为 expired、次数已用完的次数卡置为 used_up：
+
+- 按 (status, expire_date) 索引和次数卡的部分索引分批取出待转换卡密，每批一条带条件的 UPDATE；
+- 条件中重复检查 status='active'，与验证路径、后台编辑并发时不会覆盖其他状态；
+- PostgreSQL 上用 advisory lock 保证多个节点同时运行时只有一个在清理，其他数据库使用缓存锁；
+- 转换后失效卡密状态缓存。
+
+验证路径中的惰性判断保留，作为两次清理之间的兜底。
+"""
+import logging
+import uuid
+import zlib
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .cache import CardStateCache
+from .models import Card
+
+logger = logging.getLogger(__name__)
+
+
+class CardExpirySweeper:
+    """批量转换过期/用完的卡密状态"""
+
+    LOCK_NAME = 'card_expiry_sweep'
+    LOCK_TIMEOUT = 600
+
+    @staticmethod
+    def get_chunk_size():
+        return getattr(settings, 'CARD_EXPIRY_SWEEP_CHUNK_SIZE', 5000)
+
+    @classmethod
+    def sweep(cls, chunk_size=None, now=None):
+        """
+        执行一次清理
+
+        Returns:
+            dict | None: {'expired': 转为过期的时间卡数, 'used_up': 转为用完的次数卡数}，
+            其他节点正在清理时返回 None
+        """
+        chunk_size = chunk_size or cls.get_chunk_size()
+        now = now or timezone.now()
+        with cls._lock() as acquired:
+            if not acquired:
+                logger.info("其他节点正在清理过期卡密，跳过本次执行")
+                return None
+            counts = {
+                'expired': cls._transition(
+                    Card.objects.filter(status='active', expire_date__lt=now, card_type='time'),
+                    'expired', chunk_size, order_by='expire_date',
+                ),
+                'used_up': cls._transition(
+                    Card.objects.filter(status='active', card_type='count', used_count__gte=F('total_count')),
+                    'used_up', chunk_size, order_by='pk',
+                ),
+            }
+        if counts['expired'] or counts['used_up']:
+            logger.info(f"过期卡密清理完成：过期 {counts['expired']} 张，用完 {counts['used_up']} 张")
+        return counts
+
+    @staticmethod
+    def _transition(queryset, status, chunk_size, order_by):
+        transitioned = 0
+        while True:
+            with transaction.atomic():
+                rows = list(queryset.order_by(order_by).values_list('pk', 'card_key_hash')[:chunk_size])
+                if not rows:
+                    return transitioned
+                # 重复原条件，跳过取出后已被验证路径或后台修改的卡密
+                updated = queryset.filter(pk__in=[pk for pk, _ in rows]).update(status=status)
+                CardStateCache.invalidate([card_key_hash for _, card_key_hash in rows])
+            transitioned += updated
+            if len(rows) < chunk_size:
+                return transitioned
+
+    @classmethod
+    def _lock(cls):
+        if connection.vendor == 'postgresql':
+            return _AdvisoryLock(zlib.crc32(cls.LOCK_NAME.encode()))
+        return _CacheLock(f"{cls.LOCK_NAME}:lock", cls.LOCK_TIMEOUT)
+
+
+class _AdvisoryLock:
+    """PostgreSQL 会话级 advisory lock（非阻塞），连接断开时自动释放"""
+
+    def __init__(self, key):
+        self.key = key
+        self.acquired = False
+
+    def __enter__(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [self.key])
+            self.acquired = cursor.fetchone()[0]
+        return self.acquired
+
+    def __exit__(self, *exc_info):
+        if self.acquired:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [self.key])
+        return False
+
+
+class _CacheLock:
+    """基于 cache.add 的互斥锁（共享缓存时跨节点有效）"""
+
+    def __init__(self, key, timeout):
+        self.key = key
+        self.timeout = timeout
+        self.token = uuid.uuid4().hex
+        self.acquired = False
+
+    def __enter__(self):
+        self.acquired = cache.add(self.key, self.token, self.timeout)
+        return self.acquired
+
+    def __exit__(self, *exc_info):
+        if self.acquired and cache.get(self.key) == self.token:
+            cache.delete(self.key)
+        return False
@@ -0,0 +1,219 @@
+"""
+卡密/验证记录导出
+
+按 ``.values_list()`` 分批读取，不构造模型对象和整表列表，内存占用与行数无关：
+
+- csv / csv.gz：边查询边编码（gz 为流式压缩），通过 StreamingHttpResponse 逐块发送；
+- xlsx：openpyxl 只写模式逐行写入临时文件，完成后以 FileResponse 分块发送。
+
+ExportDataset 描述一种可导出的数据：表头、字段、行格式和筛选条件。筛选函数同时供列表页使用，
+保证导出结果与列表页看到的一致。后台导出任务见 api/exports.py。
+"""
+import csv
+import tempfile
+import zlib
+from io import StringIO
+from django.conf import settings
+from openpyxl import Workbook
+from .models import Card, VerificationLog
+from .search import search_cards, search_verification_logs
+
+EXPORT_FORMATS = ('xlsx', 'csv', 'csv.gz')
+
+CONTENT_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+    'csv.gz': 'application/gzip',
+}
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def filter_cards(queryset, params):
+    """按卡密列表页的搜索和筛选参数过滤"""
+    search = params.get('search')
+    if search:
+        queryset = search_cards(queryset, search)
+    card_type = params.get('card_type')
+    if card_type:
+        queryset = queryset.filter(card_type=card_type)
+    status = params.get('status')
+    if status:
+        queryset = queryset.filter(status=status)
+    return queryset
+
+
+def filter_verification_logs(queryset, params):
+    """按验证记录列表页的搜索和筛选参数过滤"""
+    search = params.get('search')
+    if search:
+        queryset = search_verification_logs(queryset, search)
+    success = params.get('success')
+    if success:
+        queryset = queryset.filter(success=success == 'true')
+    return queryset
+
+
+def encode_csv(rows, header=None):
+    """把若干行编码为 UTF-8 CSV 字节，提供 header 时在开头写入 BOM 和表头"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    if header is not None:
+        buffer.write('\ufeff')
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+class ExportDataset:
+    """可导出的数据集"""
+
+    name = ''
+    label = ''
+    model = None
+    headers = []
+    fields = ()
+    # 与列表页一致的筛选参数
+    filter_params = ()
+
+    @classmethod
+    def get_queryset(cls, params):
+        """按筛选参数构建查询集（不含排序）"""
+        raise NotImplementedError
+
+    @staticmethod
+    def format_row(values):
+        """把 fields 对应的值转为与表头对应的一行"""
+        raise NotImplementedError
+
+    @classmethod
+    def rows(cls, queryset, chunk_size=None):
+        """逐行生成导出内容"""
+        chunk_size = chunk_size or getattr(settings, 'CARD_EXPORT_CHUNK_SIZE', 2000)
+        for values in queryset.values_list(*cls.fields).iterator(chunk_size=chunk_size):
+            yield cls.format_row(values)
+
+
+class CardExportDataset(ExportDataset):
+    name = 'cards'
+    label = '卡密'
+    model = Card
+    headers = [
+        '卡密', '类型', '状态', '有效天数', '过期时间', '总次数', '已使用次数',
+        '允许多设备', '最大设备数', '创建者', '创建时间', '备注',
+    ]
+    fields = (
+        'card_key', 'card_type', 'status', 'valid_days', 'expire_date', 'total_count', 'used_count',
+        'allow_multi_device', 'max_devices', 'created_by__username', 'created_at', 'note',
+    )
+    filter_params = ('search', 'card_type', 'status')
+
+    _card_types = dict(Card.CARD_TYPE_CHOICES)
+    _statuses = dict(Card.STATUS_CHOICES)
+
+    @classmethod
+    def get_queryset(cls, params):
+        return filter_cards(Card.objects.all(), params)
+
+    @classmethod
+    def format_row(cls, values):
+        (card_key, card_type, status, valid_days, expire_date, total_count, used_count,
+         allow_multi_device, max_devices, username, created_at, note) = values
+        is_time = card_type == 'time'
+        return [
+            card_key,
+            cls._card_types.get(card_type, card_type),
+            cls._statuses.get(status, status),
+            valid_days if is_time and valid_days is not None else '',
+            expire_date.strftime(DATETIME_FORMAT) if expire_date else '',
+            total_count if not is_time and total_count is not None else '',
+            used_count if not is_time else '',
+            '是' if allow_multi_device else '否',
+            max_devices,
+            username,
+            created_at.strftime(DATETIME_FORMAT),
+            note,
+        ]
+
+
+class VerificationLogExportDataset(ExportDataset):
+    name = 'verification_logs'
+    label = '验证记录'
+    model = VerificationLog
+    headers = ['验证时间', '卡密', '设备ID', 'IP地址', 'API密钥', '验证结果', '错误信息', '用户代理']
+    fields = (
+        'verification_time', 'card__card_key', 'device_binding__device_id', 'ip_address',
+        'api_key', 'success', 'error_message', 'user_agent',
+    )
+    filter_params = ('search', 'success')
+
+    @classmethod
+    def get_queryset(cls, params):
+        return filter_verification_logs(VerificationLog.objects.all(), params)
+
+    @staticmethod
+    def format_row(values):
+        verification_time, card_key, device_id, ip_address, api_key, success, error_message, user_agent = values
+        return [
+            verification_time.strftime(DATETIME_FORMAT),
+            card_key,
+            device_id or '',
+            ip_address,
+            api_key,
+            '成功' if success else '失败',
+            error_message,
+            user_agent,
+        ]
+
+
+class CardExporter:
+    """请求内流式导出"""
+
+    @staticmethod
+    def iter_csv(queryset, compress=False, flush_rows=1000, dataset=CardExportDataset):
+        """
+        逐块生成 CSV 字节（UTF-8 带 BOM，Excel 可直接打开中文）
+
+        Args:
+            compress: 是否输出 gzip 流
+            flush_rows: 每多少行输出一块
+        """
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        header = dataset.headers
+        rows = []
+        for row in dataset.rows(queryset):
+            rows.append(row)
+            if len(rows) >= flush_rows:
+                data = encode_csv(rows, header)
+                header, rows = None, []
+                if compressor is not None:
+                    data = compressor.compress(data)
+                if data:
+                    yield data
+        data = encode_csv(rows, header) if rows or header is not None else b''
+        if compressor is not None:
+            data = compressor.compress(data) + compressor.flush()
+        if data:
+            yield data
+
+    @staticmethod
+    def write_xlsx(queryset, file=None, dataset=CardExportDataset):
+        """
+        以只写模式写入 xlsx
+
+        Args:
+            file: 目标文件对象，默认新建临时文件
+
+        Returns:
+            file: 已定位到开头的文件对象
+        """
+        if file is None:
+            file = tempfile.TemporaryFile()
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(f'{dataset.label}列表')
+        sheet.append(dataset.headers)
+        for row in dataset.rows(queryset):
+            sheet.append(row)
+        workbook.save(file)
+        file.seek(0)
+        return file
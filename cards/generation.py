@@ -0,0 +1,317 @@
+"""
+批量生成卡密
+
+生成过程不再逐个查询卡密是否存在：
+
+- 一次从 os.urandom 读取整批随机数，切分为 32 位十六进制卡密，在循环中计算 SHA1 并在内存中去重；
+- 按批执行 ``INSERT ... ON CONFLICT DO NOTHING RETURNING card_key_hash``（PostgreSQL / SQLite 3.35+），
+  由唯一约束判断冲突，只为未插入的极少数卡密重新生成；
+- 同一批卡密的其他字段完全相同，只预处理一次数据库值，逐行只替换卡密和哈希，不构造模型对象。
+
+数量较大时由 CardGenerationJobRunner 在后台分批生成，每批卡密与任务进度在同一事务中提交，
+进程中断后从已提交的数量继续，不会多生成或少生成。
+"""
+import hashlib
+import logging
+import os
+import queue
+import socket
+import threading
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .keyfilter import CardKeyFilter
+from .models import Card, CardGenerationJob
+
+logger = logging.getLogger(__name__)
+
+# 卡密为 16 字节随机数的十六进制表示，与原先的 uuid4().hex 长度一致
+KEY_BYTES = 16
+
+
+def generate_card_keys(count):
+    """一次读取整批随机数，返回 count 个互不相同的卡密及其哈希 {card_key_hash: card_key}"""
+    sha1 = hashlib.sha1
+    keys = {}
+    while len(keys) < count:
+        missing = count - len(keys)
+        raw = os.urandom(KEY_BYTES * missing).hex()
+        step = KEY_BYTES * 2
+        for offset in range(0, len(raw), step):
+            card_key = raw[offset:offset + step]
+            keys[sha1(card_key.encode()).hexdigest()] = card_key
+    return keys
+
+
+def card_attrs(user, card_type, valid_days=None, total_count=None, allow_multi_device=False, max_devices=1, note=''):
+    """批量生成时每张卡密共用的字段（与单个创建的规则一致：时间卡只保留有效天数，次数卡只保留总次数）"""
+    return {
+        'created_by': user,
+        'card_type': card_type,
+        'valid_days': valid_days if card_type == 'time' and valid_days else None,
+        'total_count': total_count if card_type == 'count' and total_count else None,
+        'allow_multi_device': allow_multi_device,
+        'max_devices': max_devices,
+        'note': note or '',
+    }
+
+
+class CardGenerator:
+    """批量生成卡密"""
+
+    # 单批内连续冲突超过该轮数时放弃（正常情况下 128 位随机卡密几乎不会冲突）
+    MAX_ATTEMPTS = 10
+
+    @classmethod
+    def generate(cls, count, attrs, chunk_size=None, on_chunk=None):
+        """
+        生成 count 张相同配置的卡密
+
+        Args:
+            attrs: 除卡密外的字段，见 card_attrs()
+            chunk_size: 每批插入的数量
+            on_chunk: 每批提交前在同一事务中调用 on_chunk(created, collisions)，用于推进任务进度
+
+        Returns:
+            dict: {'created': 生成数量, 'collisions': 因冲突重新生成的数量}
+        """
+        chunk_size = chunk_size or getattr(settings, 'CARD_GENERATION_CHUNK_SIZE', 5000)
+        created = collisions = 0
+        while created < count:
+            with transaction.atomic():
+                inserted, chunk_collisions = cls.generate_chunk(min(chunk_size, count - created), attrs)
+                if on_chunk is not None:
+                    on_chunk(len(inserted), chunk_collisions)
+            created += len(inserted)
+            collisions += chunk_collisions
+        return {'created': created, 'collisions': collisions}
+
+    @classmethod
+    def generate_chunk(cls, size, attrs):
+        """
+        生成并插入一批卡密，冲突的部分重新生成
+
+        Returns:
+            tuple: (插入的卡密哈希列表, 冲突数量)
+        """
+        template = cls._row_template(attrs)
+        inserted = []
+        collisions = 0
+        for attempt in range(cls.MAX_ATTEMPTS):
+            keys = generate_card_keys(size - len(inserted))
+            added = cls._insert(keys, template)
+            inserted.extend(added)
+            collisions += len(keys) - len(added)
+            if len(inserted) >= size:
+                break
+        else:
+            raise RuntimeError(f'卡密生成连续 {cls.MAX_ATTEMPTS} 轮发生冲突')
+
+        # 不经过 post_save，需显式登记到存在性过滤器
+        CardKeyFilter.add_many(inserted)
+        return inserted, collisions
+
+    @staticmethod
+    def _row_template(attrs):
+        """
+        预处理一批卡密共用的数据库值
+
+        Returns:
+            tuple: (字段列表, 卡密列下标, 哈希列下标, 共用的一行值)
+        """
+        attrs = dict(attrs)
+        if attrs['card_type'] == 'time' and attrs.get('valid_days'):
+            attrs['expire_date'] = timezone.now() + timedelta(days=attrs['valid_days'])
+        card = Card(card_key='', card_key_hash='', **attrs)
+        fields = [field for field in Card._meta.concrete_fields if not field.primary_key]
+        row = [field.get_db_prep_save(getattr(card, field.attname), connection=connection) for field in fields]
+        names = [field.name for field in fields]
+        return fields, names.index('card_key'), names.index('card_key_hash'), row
+
+    @classmethod
+    def _insert(cls, keys, template):
+        """插入 {card_key_hash: card_key}，已存在的跳过，返回实际插入的卡密哈希"""
+        fields, key_index, hash_index, row = template
+        rows = []
+        for card_key_hash, card_key in keys.items():
+            values = row.copy()
+            values[key_index] = card_key
+            values[hash_index] = card_key_hash
+            rows.append(values)
+
+        if not connection.features.can_return_rows_from_bulk_insert:
+            return cls._insert_fallback(keys, fields, rows)
+
+        ops = connection.ops
+        columns = ', '.join(ops.quote_name(field.column) for field in fields)
+        placeholder = f"({', '.join(['%s'] * len(fields))})"
+        sql_prefix = f"INSERT INTO {ops.quote_name(Card._meta.db_table)} ({columns}) VALUES "
+        sql_suffix = f" ON CONFLICT DO NOTHING RETURNING {ops.quote_name('card_key_hash')}"
+        batch_size = max(ops.bulk_batch_size(fields, rows), 1)
+
+        inserted = []
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                params = [value for values in batch for value in values]
+                cursor.execute(sql_prefix + ', '.join([placeholder] * len(batch)) + sql_suffix, params)
+                inserted.extend(card_key_hash for card_key_hash, in cursor.fetchall())
+        return inserted
+
+    @staticmethod
+    def _insert_fallback(keys, fields, rows):
+        """不支持 RETURNING 的数据库：忽略冲突插入后，按哈希和卡密都一致确认插入成功的行"""
+        cards = []
+        for values in rows:
+            card = Card()
+            for field, value in zip(fields, values):
+                setattr(card, field.attname, field.to_python(value))
+            cards.append(card)
+        Card.objects.bulk_create(cards, ignore_conflicts=True)
+        existing = Card.objects.filter(card_key_hash__in=list(keys)).values_list('card_key_hash', 'card_key')
+        return [card_key_hash for card_key_hash, card_key in existing if keys[card_key_hash] == card_key]
+
+
+class _ClaimLost(Exception):
+    """任务已被其他进程接管"""
+
+
+class CardGenerationJobRunner:
+    """批量生成任务执行器（调度方式与 api/exports.py 的导出任务相同）"""
+
+    TASK_POLL_INTERVAL = 30
+
+    _queue = queue.Queue()
+    _lock = threading.Lock()
+    _thread = None
+    _pid = None
+
+    @classmethod
+    def create(cls, user, card_type, count, valid_days=None, total_count=None,
+               allow_multi_device=False, max_devices=1, note=''):
+        """创建生成任务并在事务提交后放入队列"""
+        job = CardGenerationJob.objects.create(
+            created_by=user, card_type=card_type, count=count,
+            valid_days=valid_days, total_count=total_count,
+            allow_multi_device=allow_multi_device, max_devices=max_devices, note=note or '',
+        )
+        if not job.note:
+            # 便于在卡密列表中按备注搜索、导出这批卡密
+            job.note = f'批量生成任务 #{job.pk}'
+            job.save(update_fields=['note'])
+        if cls.is_in_process():
+            transaction.on_commit(lambda: cls._enqueue(job.pk))
+        return job
+
+    @staticmethod
+    def is_in_process():
+        return getattr(settings, 'CARD_GENERATION_IN_PROCESS', True)
+
+    @classmethod
+    def _enqueue(cls, job_id):
+        cls.ensure_started()
+        cls._queue.put(job_id)
+
+    @classmethod
+    def ensure_started(cls):
+        """确保当前进程的生成线程在运行（进程重启后由页面访问触发，继续未完成的任务）"""
+        if not cls.is_in_process():
+            return
+        pid = os.getpid()
+        if cls._pid == pid and cls._thread is not None and cls._thread.is_alive():
+            return
+        with cls._lock:
+            if cls._pid == pid and cls._thread is not None and cls._thread.is_alive():
+                return
+            cls._pid = pid
+            cls._queue = queue.Queue()
+            cls._thread = threading.Thread(target=cls._run, name='card-generation-jobs', daemon=True)
+            cls._thread.start()
+
+    @classmethod
+    def _run(cls):
+        while True:
+            try:
+                cls.run_pending()
+            except Exception as e:
+                logger.error(f"批量生成线程执行失败: {e}", exc_info=True)
+            finally:
+                close_old_connections()
+            try:
+                cls._queue.get(timeout=cls.TASK_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+
+    @classmethod
+    def run_pending(cls):
+        """依次领取并执行可执行的任务，返回执行的任务数"""
+        count = 0
+        while True:
+            job = cls.claim()
+            if job is None:
+                return count
+            cls.run(job)
+            count += 1
+
+    @staticmethod
+    def _claimable():
+        stale = timezone.now() - timedelta(seconds=getattr(settings, 'CARD_GENERATION_STALE_SECONDS', 60))
+        return Q(status='pending') | Q(status='running', heartbeat_at__lt=stale)
+
+    @classmethod
+    def claim(cls):
+        """领取一个排队中或执行进程已失联的任务"""
+        worker = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        candidates = CardGenerationJob.objects.filter(
+            cls._claimable()
+        ).order_by('created_at').values_list('pk', flat=True)
+        for job_id in candidates[:10]:
+            now = timezone.now()
+            claimed = CardGenerationJob.objects.filter(cls._claimable(), pk=job_id).update(
+                status='running', worker=worker, heartbeat_at=now,
+                started_at=Coalesce(F('started_at'), Value(now)),
+            )
+            if claimed:
+                return CardGenerationJob.objects.get(pk=job_id)
+        return None
+
+    @classmethod
+    def run(cls, job):
+        """执行（或继续）已领取的任务"""
+        if job.generated_count:
+            logger.info(f"批量生成任务 {job.pk} 从第 {job.generated_count} 张继续")
+
+        def on_chunk(created, collisions):
+            cls._checkpoint(
+                job, generated_count=job.generated_count + created, collisions=job.collisions + collisions
+            )
+
+        attrs = card_attrs(
+            job.created_by, job.card_type, job.valid_days, job.total_count,
+            job.allow_multi_device, job.max_devices, job.note,
+        )
+        try:
+            CardGenerator.generate(job.count - job.generated_count, attrs, on_chunk=on_chunk)
+            cls._checkpoint(job, status='completed', finished_at=timezone.now())
+            logger.info(f"批量生成任务 {job.pk} 完成：{job.generated_count} 张，冲突重试 {job.collisions} 次")
+        except _ClaimLost:
+            logger.warning(f"批量生成任务 {job.pk} 已被其他进程接管，停止执行")
+        except Exception as e:
+            logger.error(f"批量生成任务 {job.pk} 失败: {e}", exc_info=True)
+            CardGenerationJob.objects.filter(pk=job.pk, worker=job.worker).update(
+                status='failed', error_message=str(e)[:1000], finished_at=timezone.now()
+            )
+
+    @staticmethod
+    def _checkpoint(job, **fields):
+        """在仍持有任务的前提下更新字段和心跳（失去任务时抛出 _ClaimLost，当前批随事务回滚）"""
+        fields['heartbeat_at'] = timezone.now()
+        updated = CardGenerationJob.objects.filter(pk=job.pk, worker=job.worker, status='running').update(**fields)
+        if not updated:
+            raise _ClaimLost()
+        for name, value in fields.items():
+            setattr(job, name, value)
@@ -0,0 +1,392 @@
+"""
+从 CSV / XLSX 批量导入卡密
+
+用于从其他系统迁移卡密：
+
+- 读取：CSV（含 .csv.gz）由 pandas 按块读取，XLSX 由 openpyxl 只读模式逐行读取后按块组装，内存占用与文件大小无关；
+- 校验：每块在 DataFrame 上整列校验和转换，出错的行记录行号和原因后跳过，不影响同一块中的其他行；
+- 写入：按 card_key_hash 执行 ``INSERT ... ON CONFLICT (card_key_hash) DO UPDATE``，已存在的卡密只更新文件中出现的列，
+  每块一个事务；某块因其他约束（如卡密相同但哈希不同）失败时，该块退化为逐行写入，只有冲突的行记为错误。
+
+表头可以使用字段名（card_key、card_type ...）或卡密导出文件的中文表头，导出的文件可以直接导入；无法识别的列被忽略。
+"""
+import hashlib
+import logging
+import time
+import pandas as pd
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from openpyxl import load_workbook
+from .cache import CardStateCache
+from .keyfilter import CardKeyFilter
+from .models import Card
+
+logger = logging.getLogger(__name__)
+
+IMPORT_FORMATS = ('csv', 'csv.gz', 'xlsx')
+
+# 表头 -> 字段名
+COLUMN_ALIASES = {
+    'card_key': 'card_key', '卡密': 'card_key',
+    'card_type': 'card_type', '类型': 'card_type', '卡密类型': 'card_type',
+    'status': 'status', '状态': 'status',
+    'valid_days': 'valid_days', '有效天数': 'valid_days',
+    'expire_date': 'expire_date', '过期时间': 'expire_date',
+    'total_count': 'total_count', '总次数': 'total_count',
+    'used_count': 'used_count', '已使用次数': 'used_count',
+    'allow_multi_device': 'allow_multi_device', '允许多设备': 'allow_multi_device',
+    'max_devices': 'max_devices', '最大设备数': 'max_devices',
+    'note': 'note', '备注': 'note',
+}
+REQUIRED_COLUMNS = ('card_key', 'card_type')
+
+# 写入的列；已存在的卡密只更新文件中出现的列
+IMPORT_FIELDS = (
+    'card_key', 'card_key_hash', 'card_type', 'status', 'valid_days', 'expire_date', 'total_count', 'used_count',
+    'allow_multi_device', 'max_devices', 'note',
+)
+# 文件中出现某列时一并更新的列
+UPDATE_FIELDS = {
+    'card_type': ('card_type',),
+    'status': ('status',),
+    'valid_days': ('valid_days', 'expire_date'),
+    'expire_date': ('expire_date',),
+    'total_count': ('total_count',),
+    'used_count': ('used_count',),
+    'allow_multi_device': ('allow_multi_device',),
+    'max_devices': ('max_devices',),
+    'note': ('note',),
+}
+
+CARD_TYPES = {value: value for value, _ in Card.CARD_TYPE_CHOICES}
+CARD_TYPES.update({label: value for value, label in Card.CARD_TYPE_CHOICES})
+STATUSES = {value: value for value, _ in Card.STATUS_CHOICES}
+STATUSES.update({label: value for value, label in Card.STATUS_CHOICES})
+BOOLEANS = {
+    '': False, '是': True, '否': False, 'true': True, 'false': False,
+    '1': True, '0': False, 'yes': True, 'no': False, 'y': True, 'n': False,
+}
+
+
+class CardImportError(ValueError):
+    """文件无法导入（格式不支持、缺少必需列等）"""
+
+
+def detect_format(file_name):
+    """按文件名判断格式"""
+    name = file_name.lower()
+    if name.endswith('.csv.gz') or name.endswith('.gz'):
+        return 'csv.gz'
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith('.xlsx'):
+        return 'xlsx'
+    raise CardImportError('仅支持 .csv、.csv.gz 和 .xlsx 文件')
+
+
+def read_chunks(file, file_format, chunk_size):
+    """按块读取文件，每块为全部列均为字符串的 DataFrame"""
+    if file_format == 'xlsx':
+        yield from _read_xlsx_chunks(file, chunk_size)
+        return
+    reader = pd.read_csv(
+        file, dtype=str, keep_default_na=False, chunksize=chunk_size, encoding='utf-8-sig',
+        compression='gzip' if file_format == 'csv.gz' else None,
+    )
+    with reader:
+        yield from reader
+
+
+def _read_xlsx_chunks(file, chunk_size):
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = ['' if value is None else str(value) for value in header]
+        batch = []
+        for row in rows:
+            batch.append(['' if value is None else str(value) for value in row[:len(header)]])
+            if len(batch) >= chunk_size:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+class _Errors:
+    """按行收集第一个错误原因（整列操作）"""
+
+    def __init__(self, index):
+        self.messages = pd.Series('', index=index, dtype=object)
+
+    def add(self, mask, message):
+        self.messages = self.messages.mask(mask & (self.messages == ''), message)
+
+    @property
+    def valid(self):
+        return self.messages == ''
+
+
+class CardImporter:
+    """批量导入卡密"""
+
+    @classmethod
+    def import_file(cls, file, file_format, user, chunk_size=None, max_errors=None):
+        """
+        导入文件
+
+        Args:
+            file: 文件路径或二进制文件对象
+            file_format: csv / csv.gz / xlsx
+            user: 新建卡密的创建者
+            max_errors: 最多返回的错误明细条数（错误总数仍完整统计）
+
+        Returns:
+            dict: {'total', 'created', 'updated', 'failed', 'errors': [{'row', 'card_key', 'message'}], 'elapsed'}
+        """
+        if file_format not in IMPORT_FORMATS:
+            raise CardImportError('仅支持 .csv、.csv.gz 和 .xlsx 文件')
+        chunk_size = chunk_size or getattr(settings, 'CARD_IMPORT_CHUNK_SIZE', 10000)
+        max_errors = max_errors if max_errors is not None else getattr(settings, 'CARD_IMPORT_MAX_ERRORS', 1000)
+
+        result = {'total': 0, 'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+        start = time.perf_counter()
+        update_columns = None
+        for chunk in read_chunks(file, file_format, chunk_size):
+            if update_columns is None:
+                columns = cls._map_columns(chunk.columns)
+                update_columns = [
+                    field for column in columns.values() if column in UPDATE_FIELDS
+                    for field in UPDATE_FIELDS[column]
+                ]
+                update_columns = list(dict.fromkeys(update_columns))
+            chunk = chunk[list(columns)].rename(columns=columns)
+            # 数据行号（表头为第 1 行）
+            chunk.index = pd.RangeIndex(result['total'] + 2, result['total'] + 2 + len(chunk))
+            result['total'] += len(chunk)
+
+            frame, errors = cls.validate(chunk, user)
+            created, updated, write_errors = cls._write(frame, update_columns)
+            result['created'] += created
+            result['updated'] += updated
+            errors.extend(write_errors)
+            result['failed'] += len(errors)
+            room = max_errors - len(result['errors'])
+            if room > 0:
+                result['errors'].extend(errors[:room])
+
+        if update_columns is None:
+            raise CardImportError('文件中没有数据')
+        result['elapsed'] = time.perf_counter() - start
+        logger.info(
+            f"导入卡密完成：共 {result['total']} 行，新建 {result['created']}，更新 {result['updated']}，"
+            f"失败 {result['failed']}，耗时 {result['elapsed']:.2f}s"
+        )
+        return result
+
+    @staticmethod
+    def _map_columns(header):
+        """识别表头，返回 {原列名: 字段名}"""
+        columns = {}
+        for column in header:
+            field = COLUMN_ALIASES.get(str(column).strip())
+            if field and field not in columns.values():
+                columns[column] = field
+        missing = [field for field in REQUIRED_COLUMNS if field not in columns.values()]
+        if missing:
+            raise CardImportError(f"缺少必需列：{', '.join(missing)}")
+        return columns
+
+    @classmethod
+    def validate(cls, chunk, user):
+        """
+        整列校验和转换一块数据
+
+        Returns:
+            tuple: (可写入的 DataFrame，列为 IMPORT_FIELDS 加 created_by_id/created_at, 错误列表)
+        """
+        # 逐列调用 str 方法比 pandas 的 .str 访问器快数倍
+        chunk = chunk.apply(lambda column: pd.Series([value.strip() for value in column.tolist()], index=column.index))
+        errors = _Errors(chunk.index)
+        frame = pd.DataFrame(index=chunk.index)
+
+        card_key = chunk['card_key']
+        errors.add(card_key == '', '卡密为空')
+        max_length = Card._meta.get_field('card_key').max_length
+        errors.add(pd.Series([len(key) > max_length for key in card_key.tolist()], index=chunk.index), '卡密长度超过64')
+        frame['card_key'] = card_key
+
+        card_type = chunk['card_type'].map(CARD_TYPES)
+        errors.add(card_type.isna(), '卡密类型无效（应为 time/count 或 时间卡/次数卡）')
+        frame['card_type'] = card_type
+        is_time = card_type == 'time'
+        is_count = card_type == 'count'
+
+        status = cls._column(chunk, 'status')
+        frame['status'] = status.map(STATUSES).where(status != '', 'active')
+        errors.add(frame['status'].isna(), '状态无效')
+
+        valid_days = cls._integer(chunk, 'valid_days', errors, '有效天数无效', minimum=1)
+        total_count = cls._integer(chunk, 'total_count', errors, '总次数无效', minimum=1)
+        used_count = cls._integer(chunk, 'used_count', errors, '已使用次数无效', minimum=0)
+        max_devices = cls._integer(chunk, 'max_devices', errors, '最大设备数无效', minimum=1)
+
+        expire_text = cls._column(chunk, 'expire_date')
+        expire_date = cls._datetime(expire_text)
+        errors.add((expire_text != '') & expire_date.isna(), '过期时间格式无效')
+        # 与单个创建一致：只填写有效天数时，过期时间从导入时起计算
+        now = timezone.now()
+        from_days = (now + pd.to_timedelta(valid_days.fillna(0), unit='D')).where(valid_days.notna())
+        expire_date = expire_date.where(expire_date.notna(), from_days)
+        # 文件中没有相应的列时不检查：新卡密使用默认值，已有卡密保留原值
+        if 'valid_days' in chunk or 'expire_date' in chunk:
+            errors.add(is_time & expire_date.isna(), '时间卡需要有效天数或过期时间')
+        if 'total_count' in chunk:
+            errors.add(is_count & total_count.isna(), '次数卡需要总次数')
+
+        allow_multi_device = cls._column(chunk, 'allow_multi_device').map(lambda value: BOOLEANS.get(value.lower()))
+        errors.add(allow_multi_device.isna(), '允许多设备无效（应为 是/否）')
+
+        frame['valid_days'] = valid_days.where(is_time)
+        frame['expire_date'] = expire_date.where(is_time)
+        frame['total_count'] = total_count.where(is_count)
+        frame['used_count'] = used_count.fillna(0)
+        frame['allow_multi_device'] = allow_multi_device.eq(True)
+        frame['max_devices'] = max_devices.fillna(1)
+        frame['note'] = cls._column(chunk, 'note')
+
+        # 同一文件中重复的卡密以最后一次出现为准（跨块时后写入的块覆盖前面的块）
+        valid = errors.valid
+        duplicated = valid & card_key.where(valid).duplicated(keep='last')
+        errors.add(duplicated, '卡密在文件中重复出现，以最后一次为准')
+
+        valid = errors.valid
+        frame = frame[valid].copy()
+        sha1 = hashlib.sha1
+        frame['card_key_hash'] = [sha1(key.encode()).hexdigest() for key in frame['card_key']]
+        frame['created_by_id'] = user.pk
+        frame['created_at'] = now
+
+        failed = errors.messages[~valid]
+        error_list = [
+            {'row': int(row), 'card_key': key, 'message': message}
+            for row, key, message in zip(failed.index, card_key[~valid], failed)
+        ]
+        return frame, error_list
+
+    @staticmethod
+    def _column(chunk, name):
+        if name in chunk:
+            return chunk[name]
+        return pd.Series('', index=chunk.index, dtype=object)
+
+    @classmethod
+    def _integer(cls, chunk, name, errors, message, minimum):
+        """解析整数列：空值为 NaN，非整数或小于 minimum 记为错误"""
+        text = cls._column(chunk, name)
+        values = pd.to_numeric(text, errors='coerce')
+        invalid = (text != '') & (values.isna() | (values < minimum) | (values % 1 != 0))
+        errors.add(invalid, message)
+        return values.where(~invalid)
+
+    @staticmethod
+    def _datetime(text):
+        """解析时间列：不带时区的按 TIME_ZONE 处理，无法解析的为 NaT"""
+        values = pd.to_datetime(text.where(text != ''), errors='coerce', format='mixed')
+        if values.dt.tz is None:
+            values = values.dt.tz_localize(
+                timezone.get_current_timezone_name(), ambiguous='NaT', nonexistent='NaT'
+            )
+        return values.dt.tz_convert('UTC')
+
+    # ---- 写入 ----
+
+    @classmethod
+    def _write(cls, frame, update_columns):
+        """
+        按 card_key_hash 写入一块数据
+
+        Returns:
+            tuple: (新建数量, 更新数量, 写入失败的行错误列表)
+        """
+        if frame.empty:
+            return 0, 0, []
+        rows = cls._to_rows(frame)
+        hashes = frame['card_key_hash'].tolist()
+        try:
+            with transaction.atomic():
+                existing = cls._existing(hashes)
+                cls._upsert(rows, update_columns)
+                cls._after_write(hashes, existing)
+            return len(hashes) - len(existing), len(existing), []
+        except IntegrityError as e:
+            logger.warning(f"导入卡密批量写入失败，改为逐行写入: {e}")
+
+        created = updated = 0
+        errors = []
+        for row_number, card_key, card_key_hash, row in zip(frame.index, frame['card_key'], hashes, rows):
+            try:
+                with transaction.atomic():
+                    existing = cls._existing([card_key_hash])
+                    cls._upsert([row], update_columns)
+                    cls._after_write([card_key_hash], existing)
+            except IntegrityError:
+                errors.append({'row': int(row_number), 'card_key': card_key, 'message': '卡密与已有卡密冲突'})
+                continue
+            if existing:
+                updated += 1
+            else:
+                created += 1
+        return created, updated, errors
+
+    @staticmethod
+    def _to_rows(frame):
+        """转为数据库参数行（NaN/NaT 转为 None）"""
+        adapt_datetime = connection.ops.adapt_datetimefield_value
+        columns = []
+        for field in IMPORT_FIELDS + ('created_by_id', 'created_at'):
+            series = frame[field]
+            if field in ('valid_days', 'total_count', 'used_count', 'max_devices'):
+                values = series.astype('Int64').to_numpy(dtype=object, na_value=None).tolist()
+            elif field in ('expire_date', 'created_at'):
+                # 同一批中的时间通常大量重复，每个不同的值只转换一次
+                adapted = {value: adapt_datetime(value.to_pydatetime()) for value in series.dropna().unique()}
+                values = series.map(adapted).astype(object).where(series.notna(), None).tolist()
+            else:
+                values = series.tolist()
+            columns.append(values)
+        return list(zip(*columns))
+
+    @staticmethod
+    def _existing(hashes):
+        return set(Card.objects.filter(card_key_hash__in=hashes).values_list('card_key_hash', flat=True))
+
+    @staticmethod
+    def _upsert(rows, update_columns):
+        ops = connection.ops
+        fields = [Card._meta.get_field(name) for name in IMPORT_FIELDS] + [
+            Card._meta.get_field('created_by'), Card._meta.get_field('created_at'),
+        ]
+        columns = ', '.join(ops.quote_name(field.column) for field in fields)
+        placeholder = f"({', '.join(['%s'] * len(fields))})"
+        updates = ', '.join(f"{ops.quote_name(name)} = EXCLUDED.{ops.quote_name(name)}" for name in update_columns)
+        sql_prefix = f"INSERT INTO {ops.quote_name(Card._meta.db_table)} ({columns}) VALUES "
+        sql_suffix = f" ON CONFLICT ({ops.quote_name('card_key_hash')}) DO UPDATE SET {updates}"
+        batch_size = max(ops.bulk_batch_size(fields, rows), 1)
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                params = [value for row in batch for value in row]
+                cursor.execute(sql_prefix + ', '.join([placeholder] * len(batch)) + sql_suffix, params)
+
+    @staticmethod
+    def _after_write(hashes, existing):
+        # 不经过 post_save：新卡密登记到存在性过滤器，已有卡密失效状态缓存
+        CardKeyFilter.add_many(h for h in hashes if h not in existing)
+        if existing:
+            CardStateCache.invalidate(list(existing))
@@ -0,0 +1,415 @@
+"""
+卡密存在性过滤器（布隆过滤器）
+
+对全部 card_key_hash 建立布隆过滤器，验证/查询接口在访问数据库前先判断：
+过滤器确定不存在的卡密直接返回"卡密不存在"，不再访问 PostgreSQL。
+
+- 每个 worker 持有本地过滤器，首次使用时在后台线程中从 Card 表构建，
+  构建完成前所有判断都回退到数据库。
+- 新增卡密通过共享缓存中的"代数 + 增量列表"广播给所有 worker：
+  每次新增使 generation 加一，并在 ``card_key_filter:add:<generation>`` 下保存新增的哈希；
+  其他 worker 发现代数变化时拉取增量，拉取不到时视为过期并在后台重建。
+  过期期间的判断同样回退到数据库，因此不会出现误判"不存在"。
+- 删除无法从布隆过滤器中移除，只会提高误判"可能存在"的概率；
+  累计删除比例过高时自动重建。
+- 可选把构建结果快照共享到 Redis，其他 worker 重建时直接加载快照而不扫描数据库。
+
+依赖一个所有 worker 共享的缓存（默认即 Redis）；缓存不可用时过滤器不生效。
+"""
+import logging
+import math
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.utils import timezone
+from CardVerification.metrics import FILTER_FALSE_POSITIVES, cache_access, inc
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    布隆过滤器
+
+    元素本身就是SHA1十六进制哈希，直接取其中两段作为双重哈希的种子，
+    无需再次计算哈希函数。
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bit_size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hash_count = max(1, int(round(self.bit_size / capacity * math.log(2))))
+        self.bits = bytearray((self.bit_size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, card_key_hash):
+        h1 = int(card_key_hash[:16], 16)
+        h2 = int(card_key_hash[16:32], 16) | 1
+        bit_size = self.bit_size
+        return [(h1 + i * h2) % bit_size for i in range(self.hash_count)]
+
+    def add(self, card_key_hash):
+        bits = self.bits
+        for position in self._positions(card_key_hash):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, card_key_hash):
+        bits = self.bits
+        for position in self._positions(card_key_hash):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def estimated_fp_rate(self):
+        """按当前元素数量估算的误判率"""
+        if not self.count:
+            return 0.0
+        return (1 - math.exp(-self.hash_count * self.count / self.bit_size)) ** self.hash_count
+
+    def to_snapshot(self):
+        return {
+            'capacity': self.capacity,
+            'error_rate': self.error_rate,
+            'bit_size': self.bit_size,
+            'hash_count': self.hash_count,
+            'count': self.count,
+            'bits': bytes(self.bits),
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        bloom = cls.__new__(cls)
+        bloom.capacity = snapshot['capacity']
+        bloom.error_rate = snapshot['error_rate']
+        bloom.bit_size = snapshot['bit_size']
+        bloom.hash_count = snapshot['hash_count']
+        bloom.count = snapshot['count']
+        bloom.bits = bytearray(snapshot['bits'])
+        return bloom
+
+
+class CardKeyFilter:
+    """卡密存在性过滤器（进程内单例）"""
+
+    GENERATION_KEY = 'card_key_filter:generation'
+    ADDITIONS_KEY_PREFIX = 'card_key_filter:add:'
+    SNAPSHOT_KEY = 'card_key_filter:snapshot'
+    ADDITIONS_TIMEOUT = 86400
+    # 落后超过该代数时直接重建，而不是逐条回放
+    MAX_REPLAY_GENERATIONS = 1000
+
+    _lock = threading.Lock()
+    _filter = None
+    _generation = None
+    _building = False
+    _missing_since = None
+    _deleted_count = 0
+
+    # 指标
+    _rebuild_seconds = None
+    _last_rebuild_at = None
+    _definite_misses = 0
+    _false_positives = 0
+    _lookups = 0
+
+    @staticmethod
+    def is_enabled():
+        return getattr(settings, 'CARD_KEY_FILTER_ENABLED', True)
+
+    @staticmethod
+    def _get_cache():
+        return caches[getattr(settings, 'CARD_KEY_FILTER_CACHE_ALIAS', 'default')]
+
+    @classmethod
+    def might_contain(cls, card_key_hash):
+        """
+        判断卡密是否可能存在
+
+        返回False表示确定不存在；过滤器未就绪、已过期或缓存不可用时一律返回True。
+        """
+        if not cls.is_enabled():
+            return True
+
+        bloom = cls._filter
+        if bloom is None:
+            cls._schedule_rebuild()
+            return True
+
+        if not cls._sync():
+            return True
+
+        cls._lookups += 1
+        if card_key_hash in bloom:
+            cache_access('card_key_filter', False)
+            return True
+        cls._definite_misses += 1
+        cache_access('card_key_filter', True)
+        return False
+
+    @classmethod
+    async def amight_contain(cls, card_key_hash):
+        """
+        异步判断卡密是否可能存在
+
+        代数未变化时（绝大多数请求）只有一次异步缓存读取；需要拉取增量时回退到同步实现。
+        """
+        if not cls.is_enabled():
+            return True
+
+        bloom = cls._filter
+        if bloom is None:
+            cls._schedule_rebuild()
+            return True
+
+        try:
+            shared_generation = await cls._get_cache().aget(cls.GENERATION_KEY) or 0
+        except Exception as e:
+            logger.warning(f"同步卡密过滤器失败: {e}")
+            return True
+
+        if shared_generation != cls._generation:
+            return await sync_to_async(cls.might_contain, thread_sensitive=False)(card_key_hash)
+
+        cls._lookups += 1
+        if card_key_hash in bloom:
+            cache_access('card_key_filter', False)
+            return True
+        cls._definite_misses += 1
+        cache_access('card_key_filter', True)
+        return False
+
+    @classmethod
+    def record_false_positive(cls):
+        """过滤器判断可能存在、数据库中实际不存在时调用，用于统计实际误判率"""
+        if cls._filter is not None and cls._generation is not None:
+            cls._false_positives += 1
+            inc(FILTER_FALSE_POSITIVES)
+
+    @classmethod
+    def add(cls, card_key_hash):
+        cls.add_many([card_key_hash])
+
+    @classmethod
+    def add_many(cls, card_key_hashes):
+        """登记新增卡密：写入本地过滤器并广播给其他worker"""
+        if not cls.is_enabled():
+            return
+        card_key_hashes = list(card_key_hashes)
+        if not card_key_hashes:
+            return
+
+        bloom = cls._filter
+        if bloom is not None:
+            for card_key_hash in card_key_hashes:
+                bloom.add(card_key_hash)
+
+        # 提交后再广播：其他worker看到新代数时，重建扫描一定能读到这些卡密
+        transaction.on_commit(lambda: cls._publish_additions(card_key_hashes))
+
+    @classmethod
+    def _publish_additions(cls, card_key_hashes):
+        try:
+            cache = cls._get_cache()
+            cache.add(cls.GENERATION_KEY, 0, None)
+            generation = cache.incr(cls.GENERATION_KEY)
+            cache.set(f"{cls.ADDITIONS_KEY_PREFIX}{generation}", card_key_hashes, cls.ADDITIONS_TIMEOUT)
+            with cls._lock:
+                # 本进程已包含这批新增，只在代数连续时直接前进
+                if cls._generation is not None and cls._generation == generation - 1:
+                    cls._generation = generation
+        except Exception as e:
+            logger.warning(f"广播卡密过滤器新增失败: {e}")
+
+        bloom = cls._filter
+        if bloom is not None and bloom.count > bloom.capacity:
+            cls._schedule_rebuild(force=True)
+
+    @classmethod
+    def remove(cls, card_key_hash):
+        """登记删除的卡密：布隆过滤器无法删除，只统计删除量，比例过高时重建"""
+        if not cls.is_enabled():
+            return
+        cls._deleted_count += 1
+        bloom = cls._filter
+        ratio = getattr(settings, 'CARD_KEY_FILTER_REBUILD_DELETE_RATIO', 0.2)
+        if bloom is not None and bloom.count and cls._deleted_count > bloom.count * ratio:
+            cls._schedule_rebuild(force=True)
+
+    @classmethod
+    def _sync(cls):
+        """与共享代数对齐，返回本地过滤器当前是否可信"""
+        try:
+            cache = cls._get_cache()
+            shared_generation = cache.get(cls.GENERATION_KEY) or 0
+            local_generation = cls._generation
+            if local_generation is None:
+                return False
+            if shared_generation == local_generation:
+                cls._missing_since = None
+                return True
+            if shared_generation < local_generation:
+                # 共享代数被重置（例如缓存被清空），本地状态无法对齐
+                cls._schedule_rebuild(force=True)
+                return False
+
+            additions = cls._load_additions(cache, local_generation, shared_generation)
+            if additions is None:
+                # 增量尚未写入或已过期：短暂缺失时先回退数据库，持续缺失则重建
+                now = time.monotonic()
+                if cls._missing_since is None:
+                    cls._missing_since = now
+                elif now - cls._missing_since > getattr(settings, 'CARD_KEY_FILTER_SYNC_GRACE', 5):
+                    cls._schedule_rebuild(force=True)
+                return False
+
+            bloom = cls._filter
+            with cls._lock:
+                if cls._generation != local_generation:
+                    return False
+                for card_key_hash in additions:
+                    bloom.add(card_key_hash)
+                cls._generation = shared_generation
+                cls._missing_since = None
+            return True
+        except Exception as e:
+            logger.warning(f"同步卡密过滤器失败: {e}")
+            return False
+
+    @classmethod
+    def _load_additions(cls, cache, from_generation, to_generation):
+        """读取 (from_generation, to_generation] 区间内的新增哈希，有缺失时返回None"""
+        if to_generation - from_generation > cls.MAX_REPLAY_GENERATIONS:
+            return None
+        keys = [f"{cls.ADDITIONS_KEY_PREFIX}{g}" for g in range(from_generation + 1, to_generation + 1)]
+        found = cache.get_many(keys)
+        if len(found) != len(keys):
+            return None
+        return [card_key_hash for key in keys for card_key_hash in found[key]]
+
+    @classmethod
+    def _schedule_rebuild(cls, force=False):
+        """在后台线程中重建过滤器"""
+        with cls._lock:
+            if cls._building or (cls._filter is not None and not force):
+                return
+            cls._building = True
+        if force:
+            # 重建期间本地过滤器不可信
+            cls._generation = None
+        # 强制重建（容量不足、删除过多、代数无法对齐）必须扫描数据库：
+        # 共享快照同样过满或包含已删除的卡密，重新加载它无法解决问题
+        threading.Thread(
+            target=cls._rebuild_in_background, args=(not force,),
+            name='card-key-filter-rebuild', daemon=True,
+        ).start()
+
+    @classmethod
+    def _rebuild_in_background(cls, use_snapshot=True):
+        try:
+            cls.rebuild(use_snapshot=use_snapshot)
+        except Exception as e:
+            logger.error(f"重建卡密过滤器失败: {e}", exc_info=True)
+        finally:
+            cls._building = False
+            connections.close_all()
+
+    @classmethod
+    def rebuild(cls, use_snapshot=True):
+        """
+        重建过滤器
+
+        优先加载共享快照（快照之后的新增由增量同步补齐），否则扫描Card表构建，
+        并在开启共享时发布快照，供其他worker替换过满或过旧的快照。
+
+        Args:
+            use_snapshot: 为False时忽略共享快照，总是扫描数据库
+
+        Returns:
+            float: 重建耗时（秒）
+        """
+        from .models import Card
+
+        started = time.perf_counter()
+        cache = cls._get_cache()
+        share_snapshot = getattr(settings, 'CARD_KEY_FILTER_SHARE_SNAPSHOT', False)
+
+        bloom = None
+        generation = None
+        if use_snapshot and share_snapshot:
+            try:
+                snapshot = cache.get(cls.SNAPSHOT_KEY)
+                shared_generation = cache.get(cls.GENERATION_KEY) or 0
+                # 快照之后的增量必须仍可回放，否则改为扫描数据库
+                if snapshot is not None and cls._load_additions(
+                    cache, snapshot['generation'], shared_generation
+                ) is not None:
+                    bloom = BloomFilter.from_snapshot(snapshot)
+                    generation = snapshot['generation']
+            except Exception as e:
+                logger.warning(f"加载卡密过滤器快照失败: {e}")
+
+        if bloom is None:
+            try:
+                cache.add(cls.GENERATION_KEY, 0, None)
+                generation = cache.get(cls.GENERATION_KEY) or 0
+            except Exception as e:
+                logger.warning(f"读取卡密过滤器代数失败: {e}")
+                generation = None
+
+            total = Card.objects.count()
+            capacity = max(
+                getattr(settings, 'CARD_KEY_FILTER_MIN_CAPACITY', 100000),
+                int(total * 2)
+            )
+            bloom = BloomFilter(capacity, getattr(settings, 'CARD_KEY_FILTER_ERROR_RATE', 0.001))
+            hashes = Card.objects.values_list('card_key_hash', flat=True).order_by().iterator(chunk_size=10000)
+            for card_key_hash in hashes:
+                bloom.add(card_key_hash)
+
+            if share_snapshot and generation is not None:
+                try:
+                    cache.set(cls.SNAPSHOT_KEY, dict(bloom.to_snapshot(), generation=generation), None)
+                except Exception as e:
+                    logger.warning(f"发布卡密过滤器快照失败: {e}")
+
+        with cls._lock:
+            cls._filter = bloom
+            cls._generation = generation
+            cls._deleted_count = 0
+            cls._missing_since = None
+            cls._rebuild_seconds = time.perf_counter() - started
+            cls._last_rebuild_at = timezone.now()
+
+        logger.info(f"卡密过滤器重建完成: {bloom.count} 个卡密，耗时 {cls._rebuild_seconds:.2f}s")
+        return cls._rebuild_seconds
+
+    @classmethod
+    def stats(cls):
+        """过滤器指标"""
+        bloom = cls._filter
+        checked_misses = cls._false_positives + cls._definite_misses
+        return {
+            'enabled': cls.is_enabled(),
+            'ready': bloom is not None and cls._generation is not None,
+            'building': cls._building,
+            'count': bloom.count if bloom else 0,
+            'capacity': bloom.capacity if bloom else 0,
+            'bit_size': bloom.bit_size if bloom else 0,
+            'hash_count': bloom.hash_count if bloom else 0,
+            'estimated_fp_rate': bloom.estimated_fp_rate if bloom else None,
+            'observed_fp_rate': cls._false_positives / checked_misses if checked_misses else None,
+            'lookups': cls._lookups,
+            'definite_misses': cls._definite_misses,
+            'false_positives': cls._false_positives,
+            'deleted_since_rebuild': cls._deleted_count,
+            'generation': cls._generation,
+            'rebuild_seconds': cls._rebuild_seconds,
+            'last_rebuild_at': cls._last_rebuild_at.isoformat() if cls._last_rebuild_at else None,
+        }
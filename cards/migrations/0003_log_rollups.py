@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0002_partition_verificationlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VerificationHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField(unique=True, verbose_name='时间段起点')),
+                ('total_count', models.BigIntegerField(default=0, verbose_name='验证次数')),
+                ('success_count', models.BigIntegerField(default=0, verbose_name='成功次数')),
+            ],
+            options={
+                'verbose_name': '验证小时汇总',
+                'verbose_name_plural': '验证小时汇总',
+                'ordering': ['-bucket_start'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0003_log_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['status', 'expire_date'], name='cards_card_status_exp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(condition=models.Q(('card_type', 'count'), ('used_count__gte', models.F('total_count'))), fields=['status'], name='cards_card_exhausted_idx'),
+        ),
+    ]
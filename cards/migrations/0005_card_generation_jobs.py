@@ -0,0 +1,46 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0004_card_expiry_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardGenerationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('card_type', models.CharField(choices=[('time', '时间卡'), ('count', '次数卡')], max_length=10, verbose_name='卡密类型')),
+                ('count', models.IntegerField(verbose_name='生成数量')),
+                ('valid_days', models.IntegerField(blank=True, null=True, verbose_name='有效天数')),
+                ('total_count', models.IntegerField(blank=True, null=True, verbose_name='总次数')),
+                ('allow_multi_device', models.BooleanField(default=False, verbose_name='允许多设备')),
+                ('max_devices', models.IntegerField(default=1, verbose_name='最大设备数')),
+                ('note', models.TextField(blank=True, verbose_name='备注')),
+                ('status', models.CharField(choices=[('pending', '排队中'), ('running', '生成中'), ('completed', '已完成'), ('failed', '失败')], default='pending', max_length=10, verbose_name='状态')),
+                ('generated_count', models.IntegerField(default=0, verbose_name='已生成数量')),
+                ('collisions', models.IntegerField(default=0, verbose_name='冲突重试次数')),
+                ('error_message', models.TextField(blank=True, verbose_name='错误信息')),
+                ('worker', models.CharField(blank=True, max_length=64, verbose_name='执行进程')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='心跳时间')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='创建者')),
+            ],
+            options={
+                'verbose_name': '批量生成任务',
+                'verbose_name_plural': '批量生成任务',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'heartbeat_at'], name='cards_genjob_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0005_card_generation_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['created_at', 'id'], name='cards_card_created_idx'),
+        ),
+    ]
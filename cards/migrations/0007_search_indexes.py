@@ -0,0 +1,60 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:25
+
+import logging
+from django.db import DatabaseError, migrations, models, transaction
+
+logger = logging.getLogger(__name__)
+
+# (模型, 字段, 索引名)：表达式与 icontains 生成的 UPPER("字段"::text) 一致，ILIKE/LIKE '%词%' 才能使用索引
+TRIGRAM_INDEXES = [
+    ('cards', 'Card', 'note', 'cards_card_note_trgm_idx'),
+    ('accounts', 'CustomUser', 'username', 'accounts_user_name_trgm_idx'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """PostgreSQL 上创建 pg_trgm 扩展和备注、用户名的三元组 GIN 索引（其他数据库不处理）"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError as e:
+        # 没有创建扩展的权限时跳过，子串搜索仍可用，只是不走索引
+        logger.warning(f"无法创建 pg_trgm 扩展，跳过三元组索引: {e}")
+        return
+    quote = schema_editor.quote_name
+    for app_label, model_name, field_name, index_name in TRIGRAM_INDEXES:
+        model = apps.get_model(app_label, model_name)
+        column = model._meta.get_field(field_name).column
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {quote(index_name)} ON {quote(model._meta.db_table)} '
+            f'USING gin ((UPPER({quote(column)}::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for _, _, _, index_name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {schema_editor.quote_name(index_name)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_customuser_managers'),
+        ('cards', '0006_card_created_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='verificationlog',
+            index=models.Index(fields=['ip_address', 'verification_time'], name='cards_vlog_ip_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verificationlog',
+            index=models.Index(fields=['api_key', 'verification_time'], name='cards_vlog_apikey_time_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
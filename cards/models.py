@@ -51,6 +51,15 @@ class Card(models.Model):
         verbose_name = '卡密'
         verbose_name_plural = '卡密'
         ordering = ['-created_at']
+        # 过期清理（cards/expiry.py）按前两个索引找出待转换的卡密；列表页按 (created_at, id) 游标分页
+        indexes = [
+            models.Index(fields=['status', 'expire_date'], name='cards_card_status_exp_idx'),
+            models.Index(
+                fields=['status'], name='cards_card_exhausted_idx',
+                condition=models.Q(card_type='count', used_count__gte=models.F('total_count')),
+            ),
+            models.Index(fields=['created_at', 'id'], name='cards_card_created_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.card_key_hash:
@@ -118,6 +127,79 @@ class VerificationLog(models.Model):
         verbose_name = '验证记录'
         verbose_name_plural = '验证记录'
         ordering = ['-verification_time']
+        # PostgreSQL 上按 verification_time 分区，见 api/partitions.py
+        indexes = [
+            models.Index(fields=['verification_time'], name='cards_vlog_time_idx'),
+            models.Index(fields=['card', 'verification_time'], name='cards_vlog_card_time_idx'),
+            # 搜索框按 IP、API密钥精确匹配（见 cards/search.py）
+            models.Index(fields=['ip_address', 'verification_time'], name='cards_vlog_ip_time_idx'),
+            models.Index(fields=['api_key', 'verification_time'], name='cards_vlog_apikey_time_idx'),
+        ]
 
     def __str__(self):
         return f"{self.card} - {self.verification_time}"
+
+
+class VerificationHourlyRollup(models.Model):
+    """验证记录小时汇总，由 api/rollups.py 增量维护"""
+    bucket_start = models.DateTimeField('时间段起点', unique=True)
+    total_count = models.BigIntegerField('验证次数', default=0)
+    success_count = models.BigIntegerField('成功次数', default=0)
+
+    class Meta:
+        verbose_name = '验证小时汇总'
+        verbose_name_plural = '验证小时汇总'
+        ordering = ['-bucket_start']
+
+    def __str__(self):
+        return f"{self.bucket_start} - {self.total_count}"
+
+
+class CardGenerationJob(models.Model):
+    """后台批量生成任务，由 cards/generation.py 的 CardGenerationJobRunner 分批执行，每批与进度在同一事务中提交"""
+    STATUS_CHOICES = [
+        ('pending', '排队中'),
+        ('running', '生成中'),
+        ('completed', '已完成'),
+        ('failed', '失败'),
+    ]
+
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='创建者')
+    card_type = models.CharField('卡密类型', max_length=10, choices=Card.CARD_TYPE_CHOICES)
+    count = models.IntegerField('生成数量')
+    valid_days = models.IntegerField('有效天数', null=True, blank=True)
+    total_count = models.IntegerField('总次数', null=True, blank=True)
+    allow_multi_device = models.BooleanField('允许多设备', default=False)
+    max_devices = models.IntegerField('最大设备数', default=1)
+    note = models.TextField('备注', blank=True)
+    status = models.CharField('状态', max_length=10, choices=STATUS_CHOICES, default='pending')
+
+    generated_count = models.IntegerField('已生成数量', default=0)
+    collisions = models.IntegerField('冲突重试次数', default=0)
+    error_message = models.TextField('错误信息', blank=True)
+
+    worker = models.CharField('执行进程', max_length=64, blank=True)
+    heartbeat_at = models.DateTimeField('心跳时间', null=True, blank=True)
+    created_at = models.DateTimeField('创建时间', default=timezone.now)
+    started_at = models.DateTimeField('开始时间', null=True, blank=True)
+    finished_at = models.DateTimeField('完成时间', null=True, blank=True)
+
+    class Meta:
+        verbose_name = '批量生成任务'
+        verbose_name_plural = '批量生成任务'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'heartbeat_at'], name='cards_genjob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_card_type_display()} x {self.count} - {self.get_status_display()}"
+
+    @property
+    def progress(self):
+        """完成百分比"""
+        if self.status == 'completed':
+            return 100
+        if not self.count:
+            return 0
+        return min(99, int(self.generated_count * 100 / self.count))
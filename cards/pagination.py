@@ -0,0 +1,197 @@
+"""
+列表页游标分页
+
+大表上 OFFSET 分页越往后越慢，总页数需要的 COUNT(*) 本身也要扫描全部匹配行。这里改为按 (时间, id) 倒序的游标分页：
+
+- 下一页 ``?after=<游标>``、上一页 ``?before=<游标>``、末页 ``?last=1``，每页都是一次按索引定位的 LIMIT 查询，
+  耗时与页码无关；
+- 总数只精确统计到 LIST_COUNT_LIMIT 条（子查询 LIMIT 后再 COUNT），超过时在 PostgreSQL 上使用执行计划的估算行数，
+  其他数据库显示"N+ 条"。
+"""
+import base64
+import json
+import logging
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger(__name__)
+
+# 切换页面时需要去掉的查询参数
+CURSOR_PARAMS = ('after', 'before', 'last', 'page')
+
+
+def encode_cursor(value, pk):
+    raw = json.dumps([value.isoformat(), pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，无效时返回 None"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, pk = json.loads(raw)
+        value = parse_datetime(value)
+    except (ValueError, TypeError):
+        return None
+    if value is None or not isinstance(pk, int):
+        return None
+    return value, pk
+
+
+def count_rows(queryset, limit=None):
+    """
+    统计行数，最多精确统计到 limit 条
+
+    Returns:
+        tuple: (行数, 类型)；类型为 exact（精确）、estimate（执行计划估算）或 limit（至少 limit 条）
+    """
+    limit = limit or getattr(settings, 'LIST_COUNT_LIMIT', 10000)
+    queryset = queryset.order_by()
+    count = queryset.values('pk')[:limit + 1].count()
+    if count <= limit:
+        return count, 'exact'
+    estimate = estimate_rows(queryset)
+    if estimate is not None and estimate > limit:
+        return estimate, 'estimate'
+    return limit, 'limit'
+
+
+def estimate_rows(queryset):
+    """PostgreSQL 执行计划估算的行数，其他数据库返回 None"""
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.values('pk').query.sql_with_params()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    except Exception as e:
+        logger.warning(f"估算行数失败: {e}")
+        return None
+
+
+class KeysetPage:
+    """一页数据及前后页链接（模板中作为 page_obj 使用）"""
+
+    def __init__(self, object_list, field, has_next, has_previous, query, count, count_kind):
+        self.object_list = object_list
+        self.field = field
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.query = query
+        self.count = count
+        self.count_kind = count_kind
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def _url(self, **params):
+        query = self.query.copy()
+        for name, value in params.items():
+            query[name] = value
+        return f"?{query.urlencode()}" if query else '?'
+
+    def _cursor(self, obj):
+        return encode_cursor(getattr(obj, self.field), obj.pk)
+
+    @property
+    def first_url(self):
+        return self._url()
+
+    @property
+    def last_url(self):
+        return self._url(last='1')
+
+    @property
+    def next_url(self):
+        return self._url(after=self._cursor(self.object_list[-1])) if self.object_list else None
+
+    @property
+    def previous_url(self):
+        return self._url(before=self._cursor(self.object_list[0])) if self.object_list else None
+
+
+class KeysetPaginator:
+    """按 (field, id) 倒序的游标分页"""
+
+    def __init__(self, queryset, per_page, field):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+
+    def page(self, params):
+        """
+        按查询参数取一页
+
+        Args:
+            params: request.GET
+        """
+        after = decode_cursor(params.get('after', ''))
+        before = decode_cursor(params.get('before', '')) if after is None else None
+        if before is not None:
+            rows, has_next, has_previous = self._backward(before)
+            if not has_previous and len(rows) < self.per_page:
+                # 前面已不足一页（期间有删除），直接显示第一页
+                rows, has_next, has_previous = self._forward(None)
+        elif after is None and params.get('last') == '1':
+            rows, has_next, has_previous = self._backward(None)
+        else:
+            rows, has_next, has_previous = self._forward(after)
+
+        query = params.copy()
+        for name in CURSOR_PARAMS:
+            query.pop(name, None)
+        count, count_kind = count_rows(self.queryset)
+        return KeysetPage(rows, self.field, has_next, has_previous, query, count, count_kind)
+
+    def _forward(self, cursor):
+        """游标之后（更早）的一页；cursor 为 None 时为第一页"""
+        field, size = self.field, self.per_page
+        queryset = self.queryset
+        if cursor is not None:
+            value, pk = cursor
+            # 先按时间范围定位（可用时间索引），再排除同一时间中已显示的行
+            queryset = queryset.filter(Q(**{f'{field}__lte': value}), Q(**{f'{field}__lt': value}) | Q(pk__lt=pk))
+        rows = list(queryset.order_by(f'-{field}', '-pk')[:size + 1])
+        return rows[:size], len(rows) > size, cursor is not None
+
+    def _backward(self, cursor):
+        """游标之前（更新）的一页，正序取出后反转；cursor 为 None 时为末页"""
+        field, size = self.field, self.per_page
+        queryset = self.queryset
+        if cursor is not None:
+            value, pk = cursor
+            queryset = queryset.filter(Q(**{f'{field}__gte': value}), Q(**{f'{field}__gt': value}) | Q(pk__gt=pk))
+        rows = list(queryset.order_by(field, 'pk')[:size + 1])
+        return rows[:size][::-1], cursor is not None, len(rows) > size
+
+
+class KeysetPaginationMixin:
+    """
+    ListView 的游标分页
+
+    子类设置 cursor_field（倒序排列的时间字段）和 paginate_by；模板中 page_obj 提供
+    first_url / previous_url / next_url / last_url 和 count / count_kind（见 count_rows）。
+    """
+    cursor_field = 'created_at'
+
+    def paginate_queryset(self, queryset, page_size):
+        page = KeysetPaginator(queryset, page_size, self.cursor_field).page(self.request.GET)
+        return None, page, page.object_list, page.has_other_pages()
@@ -0,0 +1,114 @@
+"""
+列表页搜索
+
+原先的搜索框对卡密、备注、IP、API密钥都使用 icontains，每次搜索都要顺序扫描卡密表或日志表。这里按搜索词的用途拆分为
+都能走索引的条件：
+
+- 完整卡密：先按 card_key_hash 精确查找（唯一索引），命中时直接返回；
+- 卡密前缀：PostgreSQL 上 card_key 的唯一约束自带 varchar_pattern_ops 索引，``LIKE 'abc%'`` 可直接使用；
+  SQLite 的 LIKE 不区分大小写、用不上索引，额外加上范围条件走唯一索引；
+- 备注子串：PostgreSQL 上由 pg_trgm 的 GIN 索引（见迁移 0007）支持，搜索词不少于 SEARCH_MIN_SUBSTRING_LENGTH
+  个字符时才搜索备注（更短的词三元组索引无法过滤）；SQLite 上仍为 icontains；
+- 创建者：先在用户表中按用户名匹配出用户 ID，再按 created_by_id 过滤，不再与卡密表关联后做 OR；
+- 日志：卡密先解析为卡密 ID（精确或前缀，最多 SEARCH_MAX_CARDS 个），IP 只做精确匹配，API密钥精确匹配，
+  都有对应的 (字段, 时间) 索引。
+"""
+import hashlib
+import ipaddress
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Q
+from .models import Card
+
+# 卡密、API密钥的最大长度，超过时不可能精确匹配
+MAX_KEY_LENGTH = 64
+
+
+def normalize_term(term):
+    return (term or '').strip()
+
+
+def min_substring_length():
+    return getattr(settings, 'SEARCH_MIN_SUBSTRING_LENGTH', 3)
+
+
+def parse_ip(term):
+    """搜索词是合法 IP 时返回规范化后的地址，否则返回 None"""
+    try:
+        return str(ipaddress.ip_address(term))
+    except ValueError:
+        return None
+
+
+def prefix_q(field, term):
+    """字段以 term 开头的条件（SQLite 上附加范围条件以使用普通索引）"""
+    q = Q(**{f'{field}__startswith': term})
+    if connection.vendor == 'sqlite':
+        q &= Q(**{f'{field}__gte': term, f'{field}__lt': term + '\U0010ffff'})
+    return q
+
+
+def exact_card_q(term):
+    """完整卡密的精确匹配条件（按哈希），搜索词过长时返回 None"""
+    if len(term) > MAX_KEY_LENGTH:
+        return None
+    return Q(card_key_hash=hashlib.sha1(term.encode()).hexdigest())
+
+
+def matching_card_ids(term, limit=None):
+    """
+    搜索词对应的卡密 ID：完整卡密命中时只返回该卡密，否则返回以搜索词开头的卡密（最多 limit 个）
+    """
+    limit = limit or getattr(settings, 'SEARCH_MAX_CARDS', 1000)
+    exact = exact_card_q(term)
+    if exact is None:
+        return []
+    card_ids = list(Card.objects.filter(exact).values_list('pk', flat=True)[:1])
+    if card_ids:
+        return card_ids
+    return list(Card.objects.filter(prefix_q('card_key', term)).values_list('pk', flat=True)[:limit])
+
+
+def matching_user_ids(term):
+    """用户名包含搜索词的用户 ID（用户表很小，PostgreSQL 上另有三元组索引）"""
+    return list(get_user_model().objects.filter(username__icontains=term).values_list('pk', flat=True))
+
+
+def search_cards(queryset, term):
+    """按卡密、备注、创建者搜索卡密"""
+    term = normalize_term(term)
+    if not term:
+        return queryset
+
+    exact = exact_card_q(term)
+    if exact is not None:
+        exact_queryset = queryset.filter(exact)
+        if exact_queryset.exists():
+            return exact_queryset
+
+    q = prefix_q('card_key', term)
+    if len(term) >= min_substring_length():
+        q |= Q(note__icontains=term)
+    user_ids = matching_user_ids(term)
+    if user_ids:
+        q |= Q(created_by_id__in=user_ids)
+    return queryset.filter(q)
+
+
+def search_verification_logs(queryset, term):
+    """按卡密、IP、API密钥搜索验证记录"""
+    term = normalize_term(term)
+    if not term:
+        return queryset
+
+    q = Q(pk__in=[])
+    card_ids = matching_card_ids(term)
+    if card_ids:
+        q |= Q(card_id__in=card_ids)
+    ip = parse_ip(term)
+    if ip is not None:
+        q |= Q(ip_address=ip)
+    if len(term) <= MAX_KEY_LENGTH:
+        q |= Q(api_key=term)
+    return queryset.filter(q)
@@ -0,0 +1,38 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .cache import CardStateCache
+from .keyfilter import CardKeyFilter
+from .models import Card, DeviceBinding
+
+
+@receiver(post_save, sender=Card)
+@receiver(post_delete, sender=Card)
+def invalidate_card_state(sender, instance, **kwargs):
+    """卡密保存或删除后失效状态缓存"""
+    if instance.card_key_hash:
+        CardStateCache.invalidate(instance.card_key_hash)
+
+
+@receiver(post_save, sender=Card)
+def add_card_key_to_filter(sender, instance, created, **kwargs):
+    """新建卡密登记到存在性过滤器"""
+    if created and instance.card_key_hash:
+        CardKeyFilter.add(instance.card_key_hash)
+
+
+@receiver(post_delete, sender=Card)
+def remove_card_key_from_filter(sender, instance, **kwargs):
+    """删除卡密时登记到存在性过滤器（用于判断是否需要重建）"""
+    if instance.card_key_hash:
+        CardKeyFilter.remove(instance.card_key_hash)
+
+
+@receiver(post_save, sender=DeviceBinding)
+@receiver(post_delete, sender=DeviceBinding)
+def invalidate_card_state_on_binding_change(sender, instance, **kwargs):
+    """设备绑定变化后失效所属卡密的状态缓存"""
+    try:
+        card_key_hash = instance.card.card_key_hash
+    except Card.DoesNotExist:
+        return
+    CardStateCache.invalidate(card_key_hash)
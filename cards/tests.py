@@ -1,3 +1,79 @@
-from django.test import TestCase
+import hashlib
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from .keyfilter import BloomFilter, CardKeyFilter
+from .models import Card
+
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+
+# 共享快照放在进程内缓存；关闭信号触发的过滤器登记及后台写库功能，由测试显式重建
+@override_settings(
+    CACHES=LOCAL_CACHES, CARD_KEY_FILTER_ENABLED=False, CARD_KEY_FILTER_SHARE_SNAPSHOT=True,
+    CARD_KEY_FILTER_MIN_CAPACITY=10, API_KEY_USAGE_WRITE_BEHIND=False,
+    API_LOG_BUFFER_ENABLED=False, ROLLUP_AUTO_UPDATE=False, METRICS_ENABLED=False,
+)
+class CardKeyFilterRebuildTests(TestCase):
+    """卡密过滤器重建与共享快照"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user('owner', 'owner@example.com', 'pw')
+        cls.cards = [Card.objects.create(card_key=f"FILTER{i}", created_by=user) for i in range(3)]
+
+    def setUp(self):
+        state = (CardKeyFilter._filter, CardKeyFilter._generation, CardKeyFilter._deleted_count)
+        self.addCleanup(self.restore_state, state)
+        CardKeyFilter._filter, CardKeyFilter._generation, CardKeyFilter._deleted_count = None, None, 0
+
+        # 其他worker发布的过满快照，包含一个已删除的卡密
+        self.deleted_hash = hashlib.sha1(b'DELETED').hexdigest()
+        stale = BloomFilter(2)
+        for card_key_hash in [self.deleted_hash] + [card.card_key_hash for card in self.cards]:
+            stale.add(card_key_hash)
+        cache = caches['default']
+        cache.clear()
+        cache.set(CardKeyFilter.GENERATION_KEY, 0, None)
+        cache.set(CardKeyFilter.SNAPSHOT_KEY, dict(stale.to_snapshot(), generation=0), None)
+
+    @staticmethod
+    def restore_state(state):
+        CardKeyFilter._filter, CardKeyFilter._generation, CardKeyFilter._deleted_count = state
+
+    def run_scheduled_rebuild(self, force):
+        """在当前线程中执行 _schedule_rebuild 启动的重建（不关闭测试的数据库连接）"""
+        def run_inline(target, args=(), **kwargs):
+            return mock.Mock(start=lambda: target(*args))
+
+        with mock.patch('cards.keyfilter.threading.Thread', side_effect=run_inline), \
+                mock.patch('cards.keyfilter.connections'):
+            CardKeyFilter._schedule_rebuild(force=force)
+        self.assertFalse(CardKeyFilter._building)
+
+    def test_initial_rebuild_loads_shared_snapshot(self):
+        self.run_scheduled_rebuild(force=False)
+
+        self.assertEqual(CardKeyFilter._filter.capacity, 2)
+        self.assertEqual(CardKeyFilter._generation, 0)
+
+    def test_forced_rebuild_scans_database_and_republishes_snapshot(self):
+        self.run_scheduled_rebuild(force=False)
+        CardKeyFilter._deleted_count = 5
+
+        self.run_scheduled_rebuild(force=True)
+
+        bloom = CardKeyFilter._filter
+        self.assertEqual((bloom.capacity, bloom.count), (10, 3))
+        self.assertEqual(CardKeyFilter._deleted_count, 0)
+        self.assertTrue(all(card.card_key_hash in bloom for card in self.cards))
+        self.assertNotIn(self.deleted_hash, bloom)
+
+        snapshot = caches['default'].get(CardKeyFilter.SNAPSHOT_KEY)
+        self.assertEqual((snapshot['capacity'], snapshot['count'], snapshot['generation']), (10, 3, 0))
@@ -1,10 +1,11 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
+from django.views import View
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView, TemplateView
 from django.urls import reverse_lazy
-from django.http import HttpResponse, JsonResponse
-from django.db.models import Q
+from django.http import JsonResponse, FileResponse, StreamingHttpResponse
 from django.db import transaction
 from django.utils import timezone
 from django import forms
@@ -12,10 +13,13 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import uuid
 import hashlib
-import pandas as pd
-from io import BytesIO
 import logging
-from .models import Card, DeviceBinding, VerificationLog
+from .cache import CardStateCache
+from .export import CardExporter, CONTENT_TYPES, EXPORT_FORMATS, filter_cards, filter_verification_logs
+from .generation import CardGenerationJobRunner, CardGenerator, card_attrs
+from .imports import CardImporter, CardImportError, detect_format
+from .models import Card, CardGenerationJob, DeviceBinding, VerificationLog
+from .pagination import KeysetPaginationMixin
 from accounts.mixins import ApprovedUserRequiredMixin
 
 logger = logging.getLogger(__name__)
@@ -67,7 +71,7 @@ class BatchCreateForm(forms.Form):
         widget=forms.Select(attrs={'class': 'form-select', 'id': 'id_card_type'})
     )
     count = forms.IntegerField(
-        min_value=1, max_value=1000,
+        min_value=1, max_value=settings.CARD_GENERATION_MAX_COUNT,
         widget=forms.NumberInput(attrs={'class': 'form-control', 'id': 'id_count'})
     )
     valid_days = forms.IntegerField(
@@ -86,9 +90,13 @@ class BatchCreateForm(forms.Form):
         initial=1,
         widget=forms.NumberInput(attrs={'class': 'form-control', 'id': 'id_max_devices'})
     )
+    note = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={'class': 'form-control', 'id': 'id_note', 'rows': 2})
+    )
 
 
-class CardListView(ApprovedUserRequiredMixin, ListView):
+class CardListView(ApprovedUserRequiredMixin, KeysetPaginationMixin, ListView):
     """卡密列表视图"""
     model = Card
     template_name = 'cards/list.html'
@@ -97,26 +105,8 @@ class CardListView(ApprovedUserRequiredMixin, ListView):
 
     def get_queryset(self):
         queryset = Card.objects.select_related('created_by').order_by('-created_at')
-
-        # 搜索功能
-        search = self.request.GET.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(card_key__icontains=search) |
-                Q(note__icontains=search) |
-                Q(created_by__username__icontains=search)
-            )
-
-        # 筛选功能
-        card_type = self.request.GET.get('card_type')
-        if card_type:
-            queryset = queryset.filter(card_type=card_type)
-
-        status = self.request.GET.get('status')
-        if status:
-            queryset = queryset.filter(status=status)
-
-        return queryset
+        # 搜索和筛选（与导出共用）
+        return filter_cards(queryset, self.request.GET)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -155,58 +145,68 @@ class BatchCreateView(ApprovedUserRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['form'] = BatchCreateForm()
+        context.setdefault('form', BatchCreateForm())
+        context['sync_limit'] = settings.CARD_GENERATION_SYNC_LIMIT
+        context['max_count'] = settings.CARD_GENERATION_MAX_COUNT
+        # 进程重启后由页面访问拉起生成线程，继续未完成的任务
+        CardGenerationJobRunner.ensure_started()
+        context['jobs'] = _visible_generation_jobs(self.request.user)[:10]
         return context
 
     def post(self, request, *args, **kwargs):
         form = BatchCreateForm(request.POST)
-        if form.is_valid():
-            cards = []
-            created_keys = set()  # 用于检查本次批量创建中的重复
-
-            for i in range(form.cleaned_data['count']):
-                # 生成唯一的卡密
-                max_attempts = 10
-                for attempt in range(max_attempts):
-                    card_key = generate_unique_card_key()
-
-                    # 检查是否与本次批量创建中的其他卡密重复
-                    if card_key not in created_keys:
-                        created_keys.add(card_key)
-                        break
-                else:
-                    # 如果10次尝试都失败，使用序号确保唯一性
-                    import time
-                    card_key = str(uuid.uuid4()).replace('-', '') + f"{int(time.time() * 1000000)}{i:04d}"[-10:]
-                    created_keys.add(card_key)
-
-                card = Card(
-                    card_key=card_key,
-                    card_key_hash=hashlib.sha1(card_key.encode()).hexdigest(),  # 手动设置哈希值
-                    card_type=form.cleaned_data['card_type'],
-                    created_by=request.user
-                )
-
-                if form.cleaned_data['card_type'] == 'time' and form.cleaned_data['valid_days']:
-                    card.valid_days = form.cleaned_data['valid_days']
-                    card.expire_date = timezone.now() + timezone.timedelta(days=form.cleaned_data['valid_days'])
-                elif form.cleaned_data['card_type'] == 'count' and form.cleaned_data['total_count']:
-                    card.total_count = form.cleaned_data['total_count']
-
-                card.allow_multi_device = form.cleaned_data['allow_multi_device']
-                card.max_devices = form.cleaned_data['max_devices']
-                cards.append(card)
-
-            try:
-                with transaction.atomic():
-                    Card.objects.bulk_create(cards)
-                messages.success(request, f'成功批量创建 {len(cards)} 个卡密！')
-                return redirect('cards:list')
-            except Exception as e:
-                messages.error(request, f'批量创建失败：{str(e)}')
-                return self.render_to_response({'form': form})
-
-        return self.render_to_response({'form': form})
+        if not form.is_valid():
+            return self.render_to_response(self.get_context_data(form=form))
+
+        data = form.cleaned_data
+        options = {
+            'valid_days': data['valid_days'],
+            'total_count': data['total_count'],
+            'allow_multi_device': data['allow_multi_device'],
+            'max_devices': data['max_devices'],
+            'note': data['note'],
+        }
+        count = data['count']
+
+        # 数量较大时转为后台任务，避免长时间占用请求
+        if count > settings.CARD_GENERATION_SYNC_LIMIT:
+            job = CardGenerationJobRunner.create(request.user, data['card_type'], count, **options)
+            logger.info(f"用户 {request.user.username} 创建了批量生成任务 {job.pk}（{count} 张）")
+            messages.success(request, f'已创建后台生成任务，共 {count} 个卡密，可在下方查看进度。')
+            return redirect('cards:batch_create')
+
+        try:
+            with transaction.atomic():
+                result = CardGenerator.generate(count, card_attrs(request.user, data['card_type'], **options))
+            messages.success(request, f'成功批量创建 {result["created"]} 个卡密！')
+            return redirect('cards:list')
+        except Exception as e:
+            messages.error(request, f'批量创建失败：{str(e)}')
+            return self.render_to_response(self.get_context_data(form=form))
+
+
+class CardGenerationJobStatusView(ApprovedUserRequiredMixin, View):
+    """批量生成任务进度（供页面轮询）"""
+
+    def get(self, request, pk):
+        CardGenerationJobRunner.ensure_started()
+        job = get_object_or_404(_visible_generation_jobs(request.user), pk=pk)
+        return JsonResponse({
+            'status': job.status,
+            'status_text': job.get_status_display(),
+            'progress': job.progress,
+            'generated_count': job.generated_count,
+            'count': job.count,
+            'error_message': job.error_message,
+        })
+
+
+def _visible_generation_jobs(user):
+    """当前用户可以查看的批量生成任务"""
+    queryset = CardGenerationJob.objects.order_by('-created_at')
+    if user.is_superuser:
+        return queryset
+    return queryset.filter(created_by=user)
 
 
 class CardDetailView(ApprovedUserRequiredMixin, DetailView):
@@ -243,7 +243,9 @@ class CardUpdateView(ApprovedUserRequiredMixin, UpdateView):
 
     def form_valid(self, form):
         messages.success(self.request, '卡密信息更新成功！')
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        CardStateCache.store(self.object)
+        return response
 
 
 class CardDeleteView(ApprovedUserRequiredMixin, DeleteView):
@@ -297,85 +299,90 @@ class UnbindDeviceView(ApprovedUserRequiredMixin, TemplateView):
         return redirect('cards:detail', pk=pk)
 
 
-class ExportCardsView(ApprovedUserRequiredMixin, TemplateView):
-    """导出卡密视图"""
+class CardImportForm(forms.Form):
+    """卡密导入表单"""
+    file = forms.FileField(
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.gz,.xlsx'})
+    )
 
-    def get(self, request):
-        # 获取筛选参数
-        card_type = request.GET.get('card_type')
-        status = request.GET.get('status')
 
-        queryset = Card.objects.select_related('created_by').order_by('-created_at')
+class CardImportView(ApprovedUserRequiredMixin, TemplateView):
+    """从 CSV / XLSX 导入卡密"""
+    template_name = 'cards/import.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.setdefault('form', CardImportForm())
+        return context
 
-        if card_type:
-            queryset = queryset.filter(card_type=card_type)
-        if status:
-            queryset = queryset.filter(status=status)
-
-        # 准备数据
-        data = []
-        for card in queryset:
-            data.append({
-                '卡密': card.card_key,
-                '类型': card.get_card_type_display(),
-                '状态': card.get_status_display(),
-                '有效天数': card.valid_days if card.card_type == 'time' else '',
-                '过期时间': card.expire_date.strftime('%Y-%m-%d %H:%M:%S') if card.expire_date else '',
-                '总次数': card.total_count if card.card_type == 'count' else '',
-                '已使用次数': card.used_count if card.card_type == 'count' else '',
-                '允许多设备': '是' if card.allow_multi_device else '否',
-                '最大设备数': card.max_devices,
-                '创建者': card.created_by.username,
-                '创建时间': card.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                '备注': card.note,
-            })
-
-        # 创建Excel文件
-        df = pd.DataFrame(data)
-        output = BytesIO()
-
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='卡密列表', index=False)
-
-        output.seek(0)
-
-        # 返回文件
-        response = HttpResponse(
-            output.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    def post(self, request, *args, **kwargs):
+        form = CardImportForm(request.POST, request.FILES)
+        if not form.is_valid():
+            return self.render_to_response(self.get_context_data(form=form))
+
+        upload = form.cleaned_data['file']
+        try:
+            result = CardImporter.import_file(upload, detect_format(upload.name), request.user)
+        except CardImportError as e:
+            messages.error(request, f'导入失败：{str(e)}')
+            return self.render_to_response(self.get_context_data(form=form))
+        except Exception as e:
+            logger.error(f"导入卡密失败: {e}", exc_info=True)
+            messages.error(request, f'导入失败：{str(e)}')
+            return self.render_to_response(self.get_context_data(form=form))
+
+        logger.info(
+            f"用户 {request.user.username} 导入卡密 {upload.name}：新建 {result['created']}，"
+            f"更新 {result['updated']}，失败 {result['failed']}"
         )
-        response['Content-Disposition'] = f'attachment; filename="cards_{timezone.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
+        if result['failed']:
+            messages.warning(request, f'导入完成，{result["failed"]} 行未导入，详见下方错误明细。')
+        else:
+            messages.success(request, f'导入完成！新建 {result["created"]} 个，更新 {result["updated"]} 个卡密。')
+        return self.render_to_response(self.get_context_data(form=CardImportForm(), result=result))
+
+
+class ExportCardsView(ApprovedUserRequiredMixin, TemplateView):
+    """导出卡密视图"""
+
+    def get(self, request):
+        # 筛选条件与卡密列表页一致
+        queryset = filter_cards(Card.objects.order_by('-created_at'), request.GET)
+
+        # 流式导出：分批读取，内存占用与卡密数量无关
+        export_format = request.GET.get('format', 'xlsx')
+        if export_format not in EXPORT_FORMATS:
+            export_format = 'xlsx'
+        filename = f'cards_{timezone.now().strftime("%Y%m%d_%H%M%S")}.{export_format}'
+
+        if export_format == 'xlsx':
+            response = FileResponse(
+                CardExporter.write_xlsx(queryset), content_type=CONTENT_TYPES['xlsx']
+            )
+        else:
+            response = StreamingHttpResponse(
+                CardExporter.iter_csv(queryset, compress=export_format == 'csv.gz'),
+                content_type=CONTENT_TYPES[export_format]
+            )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
 
         return response
 
 
-class VerificationLogListView(ApprovedUserRequiredMixin, ListView):
+class VerificationLogListView(ApprovedUserRequiredMixin, KeysetPaginationMixin, ListView):
     """验证记录列表视图"""
     model = VerificationLog
     template_name = 'cards/verification_logs.html'
     context_object_name = 'logs'
     paginate_by = 50
+    cursor_field = 'verification_time'
 
     def get_queryset(self):
         queryset = VerificationLog.objects.select_related(
             'card', 'device_binding'
         ).order_by('-verification_time')
-
-        # 搜索功能
-        search = self.request.GET.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(card__card_key__icontains=search) |
-                Q(ip_address__icontains=search) |
-                Q(api_key__icontains=search)
-            )
-
-        # 筛选功能
-        success = self.request.GET.get('success')
-        if success:
-            queryset = queryset.filter(success=success == 'true')
-
-        return queryset
+        # 搜索和筛选（与导出共用）
+        return filter_verification_logs(queryset, self.request.GET)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -410,6 +417,7 @@ def toggle_card_status(request, pk):
             return JsonResponse({'success': False, 'message': '此卡密状态无法切换'}, status=400)
 
         card.save()
+        CardStateCache.store(card)
 
         # 记录操作日志
         logger.info(f"用户 {request.user.username} {action}了卡密 {card.card_key[:8]}***")
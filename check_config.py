@@ -125,6 +125,19 @@ class ConfigChecker:
             else:
                 self.log_warning(f"{description}未配置")
     
+    def check_metrics_config(self):
+        """检查指标端点访问控制"""
+        print("🔍 检查指标端点配置...")
+        
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            self.log_success("指标端点已关闭")
+        elif getattr(settings, 'METRICS_TOKEN', ''):
+            self.log_success("指标端点已配置访问令牌")
+        elif getattr(settings, 'METRICS_ALLOWED_IPS', []):
+            self.log_success(f"指标端点仅允许以下地址访问: {', '.join(settings.METRICS_ALLOWED_IPS)}")
+        else:
+            self.log_error("指标端点已开启但未配置 METRICS_TOKEN 或 METRICS_ALLOWED_IPS，/metrics 将拒绝所有抓取")
+    
     def check_logging_config(self):
         """检查日志配置"""
         print("🔍 检查日志配置...")
@@ -185,6 +198,9 @@ class ConfigChecker:
         self.check_security_settings()
         print()
         
+        self.check_metrics_config()
+        print()
+        
         self.check_logging_config()
         print()
         
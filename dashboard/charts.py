@@ -0,0 +1,253 @@
+"""
+控制面板图表数据
+
+图表接口接受任意的 ``start`` / ``end``（ISO 时间或日期）和可选的 ``granularity``（minute/hour/day，默认自动）、
+``points``（点数上限）参数：
+
+- 自动粒度：选择桶数不超过点数上限的最细粒度（分钟 → 小时 → 天）；
+- 数据来源：小时/天读取汇总表（加上尚未汇总的少量日志），分钟或关闭 CHART_USE_ROLLUPS 时按时间范围过滤日志表，
+  以 TruncMinute/TruncHour/TruncDay 分组，都不对时间列套函数做过滤条件，可以使用时间索引；
+- 补零：按本地时区生成完整的桶起点，用 searchsorted + bincount 一次把数据放入对应的桶，缺失的桶为 0；
+- 降采样：桶数仍超过点数上限时（指定粒度或时间跨度很长）用 LTTB 算法保留曲线形状选出固定数量的点。
+"""
+import datetime
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDay, TruncHour, TruncMinute
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from api.models import ApiCallLog
+from api.rollups import RollupService
+from cards.models import VerificationHourlyRollup, VerificationLog
+
+# 粒度 -> pandas 频率、桶长度（用于估算桶数）、标签格式、日志分组函数
+GRANULARITIES = {
+    'minute': ('min', pd.Timedelta(minutes=1), '%m-%d %H:%M', TruncMinute),
+    'hour': ('h', pd.Timedelta(hours=1), '%Y-%m-%d %H', TruncHour),
+    'day': ('D', pd.Timedelta(days=1), '%m-%d', TruncDay),
+}
+
+# 桶起点由 pandas 按纳秒精度生成，start/end 须在其可表示范围内（两端各留一天，向下取整到天时也不越界）
+TIME_RANGE = (
+    datetime.datetime(1677, 9, 22, tzinfo=datetime.timezone.utc),
+    datetime.datetime(2262, 4, 10, tzinfo=datetime.timezone.utc),
+)
+
+
+class ChartParamError(ValueError):
+    """图表参数错误"""
+
+
+def parse_time(value, name):
+    """解析 ISO 时间或日期（日期按本地时区的零点），无时区时按本地时区处理"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ChartParamError(f'{name} 不是有效的时间：{value}')
+        parsed = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    if not TIME_RANGE[0] <= parsed <= TIME_RANGE[1]:
+        raise ChartParamError(f'{name} 超出支持的时间范围（1677-09-22 ~ 2262-04-10）：{value}')
+    return parsed
+
+
+def lttb(values, threshold):
+    """
+    Largest-Triangle-Three-Buckets 降采样
+
+    Args:
+        values: 按时间排列的一维数组（横坐标为下标）
+        threshold: 保留的点数
+
+    Returns:
+        ndarray: 保留的下标（升序，包含首尾两点）
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # 中间 n-2 个点均分为 threshold-2 个桶，第 i 个桶为 [bounds[i], bounds[i+1])
+    every = (n - 2) / (threshold - 2)
+    bounds = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    bounds[-1] = n - 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        # 下一个桶的平均点（最后一个桶的下一个为终点）
+        if i + 2 < len(bounds):
+            next_lo, next_hi = bounds[i + 1], bounds[i + 2]
+            avg_x = (next_lo + next_hi - 1) / 2
+            avg_y = values[next_lo:next_hi].mean()
+        else:
+            avg_x, avg_y = n - 1, values[n - 1]
+        xs = np.arange(lo, hi)
+        areas = np.abs((a - avg_x) * (values[lo:hi] - values[a]) - (a - xs) * (avg_y - values[a]))
+        a = lo + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+class ChartDataService:
+    """图表时间序列（自动粒度、补零、降采样）"""
+
+    @staticmethod
+    def point_budget():
+        return getattr(settings, 'CHART_POINT_BUDGET', 500)
+
+    @classmethod
+    def parse_params(cls, params, default_start):
+        """
+        解析图表查询参数
+
+        Returns:
+            tuple: (start, end, granularity, points)
+
+        Raises:
+            ChartParamError: 参数无效
+        """
+        end = parse_time(params['end'], 'end') if params.get('end') else timezone.now()
+        start = parse_time(params['start'], 'start') if params.get('start') else default_start
+        if start >= end:
+            raise ChartParamError('start 必须早于 end')
+
+        points = params.get('points') or cls.point_budget()
+        try:
+            points = int(points)
+        except (TypeError, ValueError):
+            raise ChartParamError('points 必须是整数') from None
+        max_points = getattr(settings, 'CHART_MAX_POINTS', 2000)
+        if not 3 <= points <= max_points:
+            raise ChartParamError(f'points 必须在 3 到 {max_points} 之间')
+
+        granularity = params.get('granularity') or 'auto'
+        if granularity == 'auto':
+            granularity = cls.choose_granularity(start, end, points)
+        elif granularity not in GRANULARITIES:
+            raise ChartParamError('granularity 只能是 auto、minute、hour 或 day')
+        # 自动粒度最粗为天，时间跨度很长时同样受桶数上限约束
+        if cls.bucket_count(start, end, granularity) > getattr(settings, 'CHART_MAX_BUCKETS', 20000):
+            raise ChartParamError('时间范围过长，请缩短时间范围或使用更粗的粒度')
+        return start, end, granularity, points
+
+    @staticmethod
+    def bucket_count(start, end, granularity):
+        """估算时间范围内的桶数"""
+        # 用 Python timedelta 相除，跨度超过 pandas Timedelta 上限（约 292 年）时也不会溢出
+        return int(np.ceil((end - start) / GRANULARITIES[granularity][1].to_pytimedelta())) + 1
+
+    @classmethod
+    def choose_granularity(cls, start, end, points):
+        """桶数不超过点数上限的最细粒度，都超过时按天（再降采样）"""
+        for granularity in ('minute', 'hour'):
+            if cls.bucket_count(start, end, granularity) <= points:
+                return granularity
+        return 'day'
+
+    @staticmethod
+    def bucket_starts(start, end, granularity):
+        """本地时区下覆盖 [start, end) 的所有桶起点"""
+        freq = GRANULARITIES[granularity][0]
+        tz = timezone.get_current_timezone()
+        first = pd.Timestamp(start).tz_convert(tz).floor(freq, ambiguous=False, nonexistent='shift_forward')
+        return pd.date_range(first, pd.Timestamp(end).tz_convert(tz), freq=freq, inclusive='left')
+
+    @staticmethod
+    def fill(edges, end, times, *columns):
+        """
+        把 (时间, 数值...) 放入对应的桶，缺失的桶补零
+
+        Returns:
+            list[ndarray]: 每一列按桶求和的结果
+        """
+        n = len(edges)
+        times = pd.to_datetime(pd.Series(times, dtype=object), utc=True)
+        time_ns = pd.DatetimeIndex(times).as_unit('ns').asi8
+        edge_ns = edges.tz_convert('UTC').as_unit('ns').asi8
+        indexes = np.searchsorted(edge_ns, time_ns, side='right') - 1
+        mask = (indexes >= 0) & (time_ns < pd.Timestamp(end).as_unit('ns').value)
+        return [
+            np.bincount(indexes[mask], weights=np.asarray(column, dtype=float)[mask], minlength=n)[:n].astype(np.int64)
+            for column in columns
+        ]
+
+    @staticmethod
+    def use_rollups(granularity):
+        return granularity != 'minute' and getattr(settings, 'CHART_USE_ROLLUPS', True)
+
+    @classmethod
+    def _log_counts(cls, model, time_field, start, end, granularity):
+        """按时间范围过滤日志表并按桶分组统计（总数、成功数）"""
+        trunc = GRANULARITIES[granularity][3]
+        rows = list(model.objects.filter(**{
+            f'{time_field}__gte': start, f'{time_field}__lt': end,
+        }).annotate(bucket=trunc(time_field)).values('bucket').annotate(
+            total=Count('pk'), success=Count('pk', filter=Q(success=True)),
+        ).order_by().values_list('bucket', 'total', 'success'))
+        return [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows]
+
+    @classmethod
+    def verification_series(cls, start, end, granularity):
+        """
+        验证次数时间序列
+
+        Returns:
+            tuple: (桶起点, 总次数数组, 成功次数数组)
+        """
+        edges = cls.bucket_starts(start, end, granularity)
+        if len(edges) == 0:
+            return edges, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        first = edges[0].to_pydatetime()
+        if cls.use_rollups(granularity):
+            rows = list(VerificationHourlyRollup.objects.filter(
+                bucket_start__gte=first, bucket_start__lt=end
+            ).values_list('bucket_start', 'total_count', 'success_count'))
+            rows += [(time, 1, int(success)) for time, success in RollupService.verification_tail(first, end)]
+            times, totals, successes = zip(*rows) if rows else ((), (), ())
+        else:
+            times, totals, successes = cls._log_counts(VerificationLog, 'verification_time', first, end, granularity)
+        return (edges, *cls.fill(edges, end, times, totals, successes))
+
+    @classmethod
+    def api_call_series(cls, start, end, granularity):
+        """
+        API调用次数时间序列
+
+        Returns:
+            tuple: (桶起点, 调用次数数组, 成功次数数组)
+        """
+        edges = cls.bucket_starts(start, end, granularity)
+        if len(edges) == 0:
+            return edges, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        first = edges[0].to_pydatetime()
+        if cls.use_rollups(granularity):
+            period = 'day' if granularity == 'day' else 'hour'
+            stats = RollupService.api_call_stats(period, ['bucket_start'], first)
+            times = [key[0] for key in stats]
+            totals = [item['call_count'] for item in stats.values()]
+            successes = [item['success_count'] for item in stats.values()]
+        else:
+            times, totals, successes = cls._log_counts(ApiCallLog, 'call_time', first, end, granularity)
+        return (edges, *cls.fill(edges, end, times, totals, successes))
+
+    @staticmethod
+    def downsample(edges, granularity, points, *series):
+        """
+        按第一条序列的形状降采样到 points 个点
+
+        Returns:
+            tuple: (标签列表, [降采样后的各序列列表], 是否降采样)
+        """
+        selected = lttb(series[0], points) if len(series[0]) > points else np.arange(len(edges))
+        label_format = GRANULARITIES[granularity][2]
+        if granularity == 'day' and len(edges) and edges[0].year != edges[-1].year:
+            label_format = '%Y-%m-%d'
+        labels = [edges[i].strftime(label_format) for i in selected]
+        return labels, [values[selected].tolist() for values in series], len(selected) < len(edges)
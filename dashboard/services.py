@@ -0,0 +1,153 @@
+"""
+控制面板统计
+
+原先每次打开控制面板执行约 10 条 COUNT 查询。这里改为每张表一条条件聚合查询
+（``COUNT(*) FILTER (WHERE ...)``），结果在共享缓存中保存 DASHBOARD_CACHE_SECONDS 秒：
+
+- 单飞：缓存过期后只有拿到锁的请求重新统计，其他请求继续使用上一份结果（缓存中保留更久），
+  只有完全没有结果时才短暂等待；
+- 日志表很大时设置 DASHBOARD_USE_ROLLUPS=True，今日验证/调用次数改为读取汇总表（加上尚未汇总的少量日志），
+  不再统计日志表。
+"""
+import logging
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Q
+from django.utils import timezone
+from accounts.models import CustomUser
+from CardVerification.metrics import cache_access
+from api.models import ApiKey, ApiCallLog
+from api.rollups import RollupService
+from cards.models import Card, VerificationLog
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardStatsService:
+    """控制面板统计（条件聚合 + 短时缓存）"""
+
+    CACHE_KEY = 'dashboard:stats'
+    LOCK_KEY = 'dashboard:stats:lock'
+    LOCK_TIMEOUT = 30
+    # 过期后的结果继续保留的倍数，供未拿到锁的请求使用
+    STALE_FACTOR = 12
+    # 没有任何结果时等待其他请求统计完成的最长时间（秒）
+    WAIT_TIMEOUT = 3
+    WAIT_INTERVAL = 0.05
+
+    @staticmethod
+    def _get_cache():
+        return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+    @classmethod
+    def get(cls):
+        """返回控制面板统计数据（字段见 compute()）"""
+        ttl = getattr(settings, 'DASHBOARD_CACHE_SECONDS', 5)
+        if ttl <= 0:
+            return cls.compute()
+        try:
+            cache = cls._get_cache()
+            entry = cache.get(cls.CACHE_KEY)
+        except Exception as e:
+            logger.warning(f"读取控制面板统计缓存失败: {e}")
+            return cls.compute()
+
+        if entry is not None and entry['expires_at'] > time.time():
+            cache_access('dashboard_stats', True)
+            return entry['stats']
+
+        token = uuid.uuid4().hex
+        try:
+            acquired = cache.add(cls.LOCK_KEY, token, cls.LOCK_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"获取控制面板统计锁失败: {e}")
+            acquired = True
+        if acquired:
+            cache_access('dashboard_stats', False)
+            try:
+                stats = cls.compute()
+                try:
+                    cache.set(
+                        cls.CACHE_KEY, {'stats': stats, 'expires_at': time.time() + ttl}, ttl * cls.STALE_FACTOR
+                    )
+                except Exception as e:
+                    logger.warning(f"写入控制面板统计缓存失败: {e}")
+                return stats
+            finally:
+                try:
+                    if cache.get(cls.LOCK_KEY) == token:
+                        cache.delete(cls.LOCK_KEY)
+                except Exception as e:
+                    logger.warning(f"释放控制面板统计锁失败: {e}")
+
+        # 其他请求正在统计：有旧结果时直接使用，否则等待其结果
+        cache_access('dashboard_stats', entry is not None)
+        if entry is not None:
+            return entry['stats']
+        deadline = time.monotonic() + cls.WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(cls.WAIT_INTERVAL)
+            entry = cache.get(cls.CACHE_KEY)
+            if entry is not None:
+                return entry['stats']
+        return cls.compute()
+
+    @classmethod
+    def compute(cls):
+        """
+        统计控制面板数据
+
+        Returns:
+            dict: total_cards, active_cards, expired_cards, total_api_keys, active_api_keys,
+                total_users, pending_users, today_verifications, today_api_calls,
+                recent_verifications（最近7天 [{'date', 'count'}]）, recent_logs（最近10条验证记录）
+        """
+        stats = {}
+        stats.update(Card.objects.aggregate(
+            total_cards=Count('pk'),
+            active_cards=Count('pk', filter=Q(status='active')),
+            expired_cards=Count('pk', filter=Q(status='expired')),
+        ))
+        stats.update(ApiKey.objects.aggregate(
+            total_api_keys=Count('pk'),
+            active_api_keys=Count('pk', filter=Q(is_active=True)),
+        ))
+        stats.update(CustomUser.objects.aggregate(
+            total_users=Count('pk'),
+            pending_users=Count('pk', filter=Q(status='pending')),
+        ))
+
+        # 最近7天的验证趋势（来自汇总表）
+        today_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        today = today_start.date()
+        daily_counts = RollupService.verification_daily_counts(today_start - timedelta(days=6))
+        stats['recent_verifications'] = [
+            {
+                'date': (today - timedelta(days=offset)).isoformat(),
+                'count': daily_counts.get(today - timedelta(days=offset), (0, 0))[0],
+            }
+            for offset in range(6, -1, -1)
+        ]
+
+        # 今日统计
+        if getattr(settings, 'DASHBOARD_USE_ROLLUPS', False):
+            stats['today_verifications'] = daily_counts.get(today, (0, 0))[0]
+            today_calls = RollupService.api_call_stats('day', start=today_start).get((), {})
+            stats['today_api_calls'] = today_calls.get('call_count', 0)
+        else:
+            # 按时间范围过滤，可使用索引并只扫描当前分区
+            stats['today_verifications'] = VerificationLog.objects.filter(
+                verification_time__gte=today_start
+            ).count()
+            stats['today_api_calls'] = ApiCallLog.objects.filter(call_time__gte=today_start).count()
+
+        # 最近的验证记录（只保存页面需要的字段，便于缓存）
+        stats['recent_logs'] = list(VerificationLog.objects.order_by('-verification_time').values(
+            'card__card_key', 'ip_address', 'verification_time', 'success'
+        )[:10])
+        for log in stats['recent_logs']:
+            log['card_key'] = log.pop('card__card_key')
+        return stats
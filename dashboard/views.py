@@ -1,12 +1,13 @@
 from django.views.generic import TemplateView
 from django.http import JsonResponse
-from django.db.models import Count, Q
+from django.db.models import Count
 from django.utils import timezone
 from datetime import timedelta
-from cards.models import Card, VerificationLog
-from api.models import ApiKey, ApiCallLog
-from accounts.models import CustomUser
+from cards.models import Card
+from api.models import ApiCallLog
 from accounts.mixins import ApprovedUserRequiredMixin
+from .charts import ChartDataService, ChartParamError
+from .services import DashboardStatsService
 
 
 class DashboardView(ApprovedUserRequiredMixin, TemplateView):
@@ -16,53 +17,16 @@ class DashboardView(ApprovedUserRequiredMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        # 基础统计数据
-        context.update({
-            'total_cards': Card.objects.count(),
-            'active_cards': Card.objects.filter(status='active').count(),
-            'expired_cards': Card.objects.filter(status='expired').count(),
-            'total_api_keys': ApiKey.objects.count(),
-            'active_api_keys': ApiKey.objects.filter(is_active=True).count(),
-        })
+        # 统计数据（每张表一条聚合查询，短时缓存，见 dashboard/services.py）
+        context.update(DashboardStatsService.get())
 
         # 只有超级管理员才能看到用户管理相关统计
-        if self.request.user.is_superuser:
-            context.update({
-                'total_users': CustomUser.objects.count(),
-                'pending_users': CustomUser.objects.filter(status='pending').count(),
-            })
-        else:
+        if not self.request.user.is_superuser:
             context.update({
                 'total_users': 0,
                 'pending_users': 0,
             })
 
-        # 今日统计
-        today = timezone.now().date()
-        context.update({
-            'today_verifications': VerificationLog.objects.filter(
-                verification_time__date=today
-            ).count(),
-            'today_api_calls': ApiCallLog.objects.filter(
-                call_time__date=today
-            ).count(),
-        })
-
-        # 最近7天的验证趋势
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        recent_verifications = VerificationLog.objects.filter(
-            verification_time__gte=seven_days_ago
-        ).values('verification_time__date').annotate(
-            count=Count('id')
-        ).order_by('verification_time__date')
-
-        context['recent_verifications'] = list(recent_verifications)
-
-        # 最近的验证记录
-        context['recent_logs'] = VerificationLog.objects.select_related(
-            'card', 'device_binding'
-        ).order_by('-verification_time')[:10]
-
         return context
 
 
@@ -95,34 +59,28 @@ class StatsView(ApprovedUserRequiredMixin, TemplateView):
 
 
 class CardUsageChartView(ApprovedUserRequiredMixin, TemplateView):
-    """卡密使用图表数据"""
+    """卡密使用图表数据（默认最近30天，参数见 dashboard/charts.py）"""
 
     def get(self, request, *args, **kwargs):
-        # 获取最近30天的数据
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-
-        # 按日期统计验证次数
-        daily_usage = VerificationLog.objects.filter(
-            verification_time__gte=thirty_days_ago
-        ).extra(
-            select={'day': 'date(verification_time)'}
-        ).values('day').annotate(
-            total=Count('id'),
-            success=Count('id', filter=Q(success=True))
-        ).order_by('day')
-
-        # 格式化数据
-        labels = []
-        total_data = []
-        success_data = []
-
-        for item in daily_usage:
-            labels.append(item['day'].strftime('%m-%d'))
-            total_data.append(item['total'])
-            success_data.append(item['success'])
+        today_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        try:
+            start, end, granularity, points = ChartDataService.parse_params(
+                request.GET, today_start - timedelta(days=29)
+            )
+        except ChartParamError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        edges, total, success = ChartDataService.verification_series(start, end, granularity)
+        labels, (total_data, success_data), downsampled = ChartDataService.downsample(
+            edges, granularity, points, total, success
+        )
 
         return JsonResponse({
             'labels': labels,
+            'granularity': granularity,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'downsampled': downsampled,
             'datasets': [
                 {
                     'label': '总验证次数',
@@ -143,34 +101,28 @@ class CardUsageChartView(ApprovedUserRequiredMixin, TemplateView):
 
 
 class ApiCallsChartView(ApprovedUserRequiredMixin, TemplateView):
-    """API调用图表数据"""
+    """API调用图表数据（默认最近7天，参数见 dashboard/charts.py）"""
 
     def get(self, request, *args, **kwargs):
-        # 获取最近7天的数据
-        seven_days_ago = timezone.now() - timedelta(days=7)
-
-        # 按小时统计API调用
-        hourly_calls = ApiCallLog.objects.filter(
-            call_time__gte=seven_days_ago
-        ).extra(
-            select={'hour': 'strftime("%%Y-%%m-%%d %%H", call_time)'}
-        ).values('hour').annotate(
-            total=Count('id'),
-            success=Count('id', filter=Q(success=True))
-        ).order_by('hour')
-
-        # 格式化数据
-        labels = []
-        total_data = []
-        success_data = []
-
-        for item in hourly_calls:
-            labels.append(item['hour'])
-            total_data.append(item['total'])
-            success_data.append(item['success'])
+        current_hour = timezone.localtime().replace(minute=0, second=0, microsecond=0)
+        try:
+            start, end, granularity, points = ChartDataService.parse_params(
+                request.GET, current_hour - timedelta(hours=7 * 24 - 1)
+            )
+        except ChartParamError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        edges, total, success = ChartDataService.api_call_series(start, end, granularity)
+        labels, (total_data, success_data), downsampled = ChartDataService.downsample(
+            edges, granularity, points, total, success
+        )
 
         return JsonResponse({
             'labels': labels,
+            'granularity': granularity,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'downsampled': downsampled,
             'datasets': [
                 {
                     'label': 'API调用总数',
@@ -5,3 +5,7 @@ class SettingsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'settings'
     verbose_name = '系统设置'
+
+    def ready(self):
+        """注册系统设置缓存失效信号"""
+        from . import signals
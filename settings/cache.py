@@ -0,0 +1,149 @@
+"""
+系统设置缓存
+
+每个模板渲染都需要网站名称等系统设置，原先每次都执行 ``get_or_create(pk=1)``。这里改为：
+
+- 每个 worker 在内存中保存一份只读快照（SettingsSnapshot），渲染页面时不访问数据库；
+- 系统设置保存或删除后（post_save/post_delete 信号）递增共享缓存中的版本号；
+- 各 worker 每隔 SYSTEM_SETTINGS_CHECK_INTERVAL 秒读取一次版本号，变化时先从共享缓存取对应版本的数据，
+  没有时才查询数据库，并把数据连同版本号写入共享缓存供其他 worker 使用；
+- 共享缓存不可用（或版本号丢失）时，快照在 SYSTEM_SETTINGS_CACHE_TTL 秒后过期重新查询。
+"""
+import logging
+import threading
+import time
+from types import MappingProxyType
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from CardVerification.metrics import cache_access
+from .models import SystemSettings
+
+logger = logging.getLogger(__name__)
+
+
+class SettingsSnapshot:
+    """系统设置的只读快照，属性与 SystemSettings 相同（图片字段仍可使用 .url）"""
+
+    __slots__ = ('_values',)
+
+    def __init__(self, values):
+        instance = SystemSettings(**values)
+        instance._state.adding = False
+        instance._state.db = 'default'
+        object.__setattr__(self, '_values', MappingProxyType({
+            field.attname: getattr(instance, field.attname) for field in SystemSettings._meta.concrete_fields
+        }))
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        raise AttributeError('系统设置快照是只读的，请修改 SystemSettings 后保存')
+
+    def __str__(self):
+        return f'{self.site_name} - 系统设置'
+
+
+class SystemSettingsCache:
+    """系统设置的进程内快照（跨worker按版本号失效）"""
+
+    VERSION_KEY = 'system_settings:version'
+    DATA_KEY = 'system_settings:data'
+
+    # 首次加载时创建默认设置会触发失效信号，需要可重入
+    _lock = threading.RLock()
+    _snapshot = None
+    _version = None
+    _loaded_at = 0.0
+    _checked_at = 0.0
+
+    @staticmethod
+    def _get_cache():
+        return caches[getattr(settings, 'SYSTEM_SETTINGS_CACHE_ALIAS', 'default')]
+
+    @classmethod
+    def get(cls):
+        """返回当前系统设置的只读快照"""
+        if cls._snapshot is not None and not cls._check_due():
+            cache_access('system_settings', True)
+            return cls._snapshot
+
+        with cls._lock:
+            if cls._snapshot is not None and not cls._check_due():
+                cache_access('system_settings', True)
+                return cls._snapshot
+            version = cls._read_version()
+            ttl = getattr(settings, 'SYSTEM_SETTINGS_CACHE_TTL', 60)
+            expired = version is None and time.monotonic() - cls._loaded_at >= ttl
+            reload = cls._snapshot is None or version != cls._version or expired
+            if reload:
+                cls._snapshot = SettingsSnapshot(cls._load_values(version))
+                cls._version = version
+                cls._loaded_at = time.monotonic()
+            cls._checked_at = time.monotonic()
+            cache_access('system_settings', not reload)
+            return cls._snapshot
+
+    @classmethod
+    def invalidate(cls):
+        """清空本进程快照，并在事务提交后递增版本号通知所有worker"""
+        cls.clear()
+        transaction.on_commit(cls._bump_version)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._snapshot = None
+            cls._version = None
+
+    @classmethod
+    def _bump_version(cls):
+        try:
+            cache = cls._get_cache()
+            cache.add(cls.VERSION_KEY, 0, None)
+            cache.incr(cls.VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"广播系统设置缓存失效失败: {e}")
+        # 提交前可能已有请求把旧数据重新放回本地快照
+        cls.clear()
+
+    @classmethod
+    def _check_due(cls):
+        interval = getattr(settings, 'SYSTEM_SETTINGS_CHECK_INTERVAL', 1)
+        return time.monotonic() - cls._checked_at >= interval
+
+    @classmethod
+    def _read_version(cls):
+        try:
+            return cls._get_cache().get(cls.VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"读取系统设置缓存版本失败: {e}")
+            return None
+
+    @classmethod
+    def _load_values(cls, version):
+        """读取指定版本的设置数据：先查共享缓存，没有时查询数据库并写回共享缓存"""
+        if version is not None:
+            try:
+                cached = cls._get_cache().get(cls.DATA_KEY)
+            except Exception as e:
+                logger.warning(f"读取系统设置缓存失败: {e}")
+                cached = None
+            if cached is not None and cached.get('version') == version:
+                return cached['values']
+
+        values = SystemSettings.objects.filter(pk=1).values().first()
+        if values is None:
+            SystemSettings.get_settings()
+            values = SystemSettings.objects.filter(pk=1).values().first()
+
+        if version is not None:
+            try:
+                cls._get_cache().set(cls.DATA_KEY, {'version': version, 'values': values}, None)
+            except Exception as e:
+                logger.warning(f"写入系统设置缓存失败: {e}")
+        return values
@@ -1,13 +1,13 @@
-from .models import SystemSettings
+from .cache import SystemSettingsCache
 
 
 def system_settings(request):
     """
     系统设置上下文处理器
-    在所有模板中提供系统设置数据
+    在所有模板中提供系统设置数据（进程内只读快照，见 settings/cache.py）
     """
     try:
-        settings = SystemSettings.get_settings()
+        settings = SystemSettingsCache.get()
         return {
             'settings': settings,
             'site_name': settings.site_name,
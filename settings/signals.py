@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .cache import SystemSettingsCache
+from .models import SystemSettings
+
+
+@receiver(post_save, sender=SystemSettings)
+@receiver(post_delete, sender=SystemSettings)
+def invalidate_system_settings_cache(sender, instance, **kwargs):
+    """系统设置修改（设置页、图片上传/删除、后台管理）后通知所有worker重新读取"""
+    SystemSettingsCache.invalidate()